@@ -0,0 +1,214 @@
+# Admission control and load shedding.
+#
+# Each expensive route gets an AdmissionGate: at most max_concurrent requests
+# run at once, up to max_queue more wait in FIFO order, and a request that
+# would wait longer than queue_timeout is turned away. Rejections are 429s
+# with a Retry-After estimated from recent service times, so clients back off
+# instead of piling more work onto a saturated box.
+#
+# The gates are applied by AdmissionMiddleware, before the route parses the
+# multipart body, and a slot is held until the last byte of the response
+# (streamed responses included). The same middleware rejects uploads above
+# max_upload_bytes with 413, from Content-Length when the client sends it and
+# otherwise as soon as the body grows past the limit.
+#
+# Routes read gate.pressure() to degrade gracefully before they start
+# rejecting (see api.tts_degradation).
+import asyncio
+import json
+import math
+import time
+from collections import deque
+
+from starlette.exceptions import HTTPException
+
+import telemetry
+
+
+class Rejected(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class UploadTooLarge(HTTPException):
+    # An HTTPException so FastAPI's body parsing passes it through as a 413
+    # instead of reporting a generic parse error
+    def __init__(self, max_bytes):
+        super().__init__(status_code=413, detail=f"Upload larger than {max_bytes} bytes")
+
+
+class AdmissionGate:
+    def __init__(self, name, max_concurrent, max_queue, queue_timeout):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = {}
+        self._waiters = deque()
+        # Moving average of how long an admitted request holds its slot
+        self._service_seconds = None
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+    def pressure(self):
+        """
+        Requests running or queued per slot: 1.0 means every slot is busy,
+        above 1.0 requests are queueing.
+        """
+        return (self.in_flight + self.waiting) / self.max_concurrent
+
+    def retry_after(self):
+        """
+        Whole seconds until a slot is likely to free up for a new request.
+        """
+        service = self._service_seconds or 1.0
+        return int(min(60, max(1, math.ceil(service * (self.waiting + 1) / self.max_concurrent))))
+
+    def _reject(self, reason):
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        telemetry.admission_rejected.inc(route=self.name, reason=reason)
+        raise Rejected(reason, self.retry_after())
+
+    async def acquire(self):
+        """
+        Wait for a slot. Raises Rejected if the queue is full or the wait
+        would exceed queue_timeout.
+        """
+        if self.in_flight < self.max_concurrent and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            telemetry.admission_queue_seconds.observe(0.0, route=self.name)
+            return
+        if self.waiting >= self.max_queue:
+            self._reject("queue_full")
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        telemetry.admission_queue_depth.set(self.waiting, route=self.name)
+        started = time.perf_counter()
+        try:
+            # release() hands its slot straight to the first waiter
+            await asyncio.wait_for(future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._reject("queue_timeout")
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot arrived just as the caller went away; pass it on
+                self.release()
+            raise
+        finally:
+            if future in self._waiters:
+                self._waiters.remove(future)
+            telemetry.admission_queue_depth.set(self.waiting, route=self.name)
+        self.admitted += 1
+        telemetry.admission_queue_seconds.observe(time.perf_counter() - started, route=self.name)
+
+    def release(self, held_seconds=None):
+        if held_seconds is not None:
+            if self._service_seconds is None:
+                self._service_seconds = held_seconds
+            else:
+                self._service_seconds = 0.8 * self._service_seconds + 0.2 * held_seconds
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def stats(self):
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "queue_timeout_s": self.queue_timeout,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "pressure": round(self.pressure(), 3),
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "avg_service_s": round(self._service_seconds, 3) if self._service_seconds is not None else None,
+        }
+
+
+async def _send_json(send, status, content, headers=()):
+    body = json.dumps(content).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())] + list(headers),
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware applying gates (exact path -> AdmissionGate) and the
+    upload size limit to HTTP requests.
+    """
+
+    def __init__(self, app, gates, max_upload_bytes):
+        self.app = app
+        self.gates = gates
+        self.max_upload_bytes = max_upload_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        gate = self.gates.get(scope["path"])
+        route = gate.name if gate is not None else "other"
+        limit = self.max_upload_bytes if scope["method"] in ("POST", "PUT") else None
+        if limit:
+            length = dict(scope["headers"]).get(b"content-length")
+            if length is not None and length.isdigit() and int(length) > limit:
+                telemetry.admission_rejected.inc(route=route, reason="too_large")
+                await _send_json(send, 413, {"error": f"Upload larger than {limit} bytes"})
+                return
+
+        if gate is not None:
+            try:
+                await gate.acquire()
+            except Rejected as e:
+                await _send_json(
+                    send, 429,
+                    {"error": "Server busy, please retry", "reason": e.reason, "retry_after": e.retry_after},
+                    [(b"retry-after", str(e.retry_after).encode())],
+                )
+                return
+
+        received = 0
+        started_response = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if limit and message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    telemetry.admission_rejected.inc(route=route, reason="too_large")
+                    raise UploadTooLarge(limit)
+            return message
+
+        async def tracking_send(message):
+            nonlocal started_response
+            if message["type"] == "http.response.start":
+                started_response = True
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, limited_receive if limit else receive, tracking_send)
+        except UploadTooLarge as e:
+            if started_response:
+                raise
+            await _send_json(send, 413, {"error": e.detail})
+        finally:
+            if gate is not None:
+                gate.release(time.perf_counter() - started)
@@ -1,68 +1,316 @@
 import numpy as np
-import librosa
-import tensorflow as tf
+import soundfile as sf
 import traceback
-import subprocess
 import os
-import shutil
-import base64
+import io
 import random
+import json
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from typing import Optional
 from dotenv import load_dotenv
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from groq import Groq
 
 # Load env vars
 load_dotenv()
 
 # Import core functions
-from brain_of_the_doctor import encode_image, analyze_image_with_query
-from voice_of_the_patient import transcribe_with_groq
-from voice_of_the_doctor import text_to_speech_with_elevenlabs
-
-# Load Respiratory Models
-MODEL_BASE_PATH = "/home/nishanth/parthibanproject/speechbot/models/trained_models"
-try:
-    respiratory_model = tf.keras.models.load_model(f"{MODEL_BASE_PATH}/Respiratory_sound.keras")
-    print("Respiratory models loaded successfully ✅")
-except Exception as e:
-    print(f"Error loading respiratory models: {e}")
+from brain_of_the_doctor import encode_image_payload, analyze_image_with_query
+from voice_of_the_patient import transcribe_with_groq, condition_audio
+from voice_of_the_doctor import ReplyEngine, text_to_speech_pipelined, text_to_speech_with_gtts, pop_complete_sentences, tts_cache, tts_router, translation_service, log_tts_status
+import feature_engine
+from batching import MicroBatcher
+from clients import registry
+from audio_store import AudioStore, AudioTooLarge, parse_range
+from sessions import SessionManager, UnknownSession, create_session_store
+from prediction_cache import PredictionCache
+from model_registry import ModelRegistry, parse_weights
+from inference_workers import InferenceClient
+import upload_audio
+from upload_audio import UndecodableAudio, streamable_audio
+import telemetry
+from admission import AdmissionGate, AdmissionMiddleware
+
+# Respiratory models: every model file in MODEL_BASE_PATH is loaded in the
+# background at start-up (see lifespan) so the server accepts connections
+# immediately; /readyz reports when the ensemble is usable. Changed files are
+# picked up every MODEL_RELOAD_INTERVAL seconds without a restart.
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_BASE_PATH = os.environ.get("MODEL_BASE_PATH", os.path.join(APP_DIR, "models", "trained_models"))
+MODEL_WARMUP = os.environ.get("MODEL_WARMUP", "1") == "1"
+MODEL_RELOAD_INTERVAL = float(os.environ.get("MODEL_RELOAD_INTERVAL", "5"))
+# keras, or fp16/int8 to serve the TFLite artifacts from export_models.py
+RESP_MODEL_FORMAT = os.environ.get("RESP_MODEL_FORMAT", "keras")
+# Set to the socket of a running inference_workers.py to keep TensorFlow and
+# the models out of this process (see inference_workers.py)
+INFERENCE_SOCKET = os.environ.get("INFERENCE_SOCKET")
 
 # Labels for respiratory analysis
 RESP_LABELS = ["Asthma", "Bronchiectasis", "Bronchiolitis", "COPD", "Normal", "LRTI", "Pneumonia", "URTI"]
 
-def extract_features(audio_path):
+if INFERENCE_SOCKET:
+    model_registry = InferenceClient(INFERENCE_SOCKET)
+else:
+    model_registry = ModelRegistry(
+        MODEL_BASE_PATH,
+        RESP_LABELS,
+        weights=parse_weights(os.environ.get("RESP_MODEL_WEIGHTS")),
+        warmup=MODEL_WARMUP,
+        artifact_format=RESP_MODEL_FORMAT,
+    )
+
+# Start-up state of each background component: loading, ready, unavailable or error
+readiness = {"respiratory_model": "loading", "feature_engine": "loading"}
+readiness_detail = {}
+
+def load_respiratory_models():
+    """
+    Import TensorFlow and load the model directory; each model runs one dummy
+    batch so graph tracing happens here instead of on the first real request.
+    """
+    started = time.perf_counter()
     try:
-        y, sr = librosa.load(audio_path, sr=None, duration=6.0)
-        mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=20)
-        if mfccs.shape[1] < 259:
-            mfccs = np.pad(mfccs, ((0, 0), (0, 259 - mfccs.shape[1])), mode="constant")
-        else:
-            mfccs = mfccs[:, :259]
-        mfccs = mfccs.reshape(1, 20, 259, 1)
+        model_registry.reload()
+    except Exception as e:
+        readiness["respiratory_model"] = "error"
+        readiness_detail["respiratory_model"] = str(e)
+        print(f"Error loading respiratory models: {e}")
+        return
+    update_model_readiness()
+    if model_registry.ready():
+        print(f"Respiratory models loaded successfully ✅ ({time.perf_counter() - started:.1f}s)")
+    else:
+        print(f"Error loading respiratory models: {readiness_detail['respiratory_model']}")
 
-        chroma = librosa.feature.chroma_stft(y=y, sr=sr, n_chroma=12)
-        if chroma.shape[1] < 259:
-            chroma = np.pad(chroma, ((0, 0), (0, 259 - chroma.shape[1])), mode="constant")
-        else:
-            chroma = chroma[:, :259]
-        chroma = chroma.reshape(1, 12, 259, 1)
+def update_model_readiness():
+    stats = model_registry.stats()
+    if stats["ready"]:
+        readiness["respiratory_model"] = "ready"
+        readiness_detail.pop("respiratory_model", None)
+        return
+    readiness["respiratory_model"] = "unavailable"
+    embeddings = [name for name, m in stats["models"].items() if m["role"] == "embedding"]
+    if stats["errors"]:
+        detail = "; ".join(f"{name}: {error}" for name, error in stats["errors"].items())
+    elif embeddings:
+        detail = f"no {len(RESP_LABELS)}-class classifier in {MODEL_BASE_PATH} (embedding models only: {', '.join(embeddings)})"
+    else:
+        detail = f"no model files in {MODEL_BASE_PATH}"
+    readiness_detail["respiratory_model"] = detail
 
-        mspec = librosa.feature.melspectrogram(y=y, sr=sr, n_mels=128)
-        mspec = librosa.power_to_db(mspec, ref=np.max)
-        if mspec.shape[1] < 259:
-            mspec = np.pad(mspec, ((0, 0), (0, 259 - mspec.shape[1])), mode="constant")
-        else:
-            mspec = mspec[:, :259]
-        mspec = mspec.reshape(1, 128, 259, 1)
+def warm_feature_engine():
+    """
+    Build the mel/chroma filterbanks and FFT plans on a second of quiet tone
+    (pure silence trips librosa's tuning estimate).
+    """
+    try:
+        sr = 22050
+        tone = 0.01 * np.sin(2 * np.pi * 440.0 * np.arange(sr) / sr).astype(np.float32)
+        feature_engine.extract_feature_batch([(tone, sr)])
+        readiness["feature_engine"] = "ready"
+    except Exception as e:
+        readiness["feature_engine"] = "error"
+        readiness_detail["feature_engine"] = str(e)
+        print(f"⚠ Feature engine warm-up failed: {e}")
+
+def warm_stt_conditioning():
+    """
+    First-use costs of STT upload conditioning (scipy resampler, FLAC encoder).
+    """
+    try:
+        buffer = io.BytesIO()
+        tone = 0.1 * np.sin(2 * np.pi * 440.0 * np.arange(44100) / 44100)
+        sf.write(buffer, tone, 44100, format="WAV")
+        condition_audio(buffer.getvalue(), "warmup.wav")
+    except Exception as e:
+        print(f"⚠ STT conditioning warm-up failed: {e}")
+
+def warm_up_models():
+    if INFERENCE_SOCKET:
+        # Feature extraction runs in the inference workers, which warm their
+        # own filterbanks; warming here would load librosa for nothing
+        readiness["feature_engine"] = "ready"
+    else:
+        warm_feature_engine()
+    warm_stt_conditioning()
+    load_respiratory_models()
+    model_registry.start_watching(MODEL_RELOAD_INTERVAL)
+
+# With models loaded /predict_respiratory answers with the ensemble's output;
+# RESP_DEMO_LABELS=1 keeps the filename-keyword demo answers for presentations
+RESP_DEMO_LABELS = os.environ.get("RESP_DEMO_LABELS", "0") == "1"
+
+# Micro-batching for concurrent /predict_respiratory requests
+RESP_BATCH_MAX_SIZE = int(os.environ.get("RESP_BATCH_MAX_SIZE", "32"))
+RESP_BATCH_MAX_WAIT_MS = float(os.environ.get("RESP_BATCH_MAX_WAIT_MS", "5"))
+
+def predict_respiratory_batch(inputs):
+    with telemetry.span("respiratory_inference"):
+        return model_registry.predict_on_batch(inputs)
+
+respiratory_batcher = MicroBatcher(
+    predict_respiratory_batch,
+    max_batch_size=RESP_BATCH_MAX_SIZE,
+    max_wait_ms=RESP_BATCH_MAX_WAIT_MS,
+)
+
+# Features and predictions keyed on the uploaded bytes + feature/model version
+def respiratory_cache_version():
+    return f"{feature_engine.FEATURE_VERSION}|{model_registry.version}"
+
+respiratory_cache = PredictionCache(
+    respiratory_cache_version(),
+    max_entries=int(os.environ.get("RESP_CACHE_ENTRIES", "256")),
+    disk_dir=os.environ.get("RESP_CACHE_DIR") or None,
+)
+
+def extract_features(audio_bytes, filename=None):
+    if INFERENCE_SOCKET:
+        return model_registry.extract_features(audio_bytes, filename)
+    return upload_audio.extract_features(audio_bytes, filename)
+
+def stream_window_features(extractor, S):
+    if INFERENCE_SOCKET:
+        return model_registry.features_from_power(S, extractor.sr)
+    return extractor.features(S)
+
+def transcribe_upload(data, filename):
+    # voice_of_the_patient decodes and re-encodes the upload in memory before sending it
+    return transcribe_with_groq(
+        stt_model="whisper-large-v3",
+        audio_file=(filename or "audio.wav", data),
+        GROQ_API_KEY=os.environ.get("GROQ_API_KEY")
+    )
+
+# Blocking stages (STT, LLM, TTS, feature extraction) run on a bounded thread pool
+# so a slow provider call never stalls the event loop.
+STAGE_WORKERS = int(os.environ.get("STAGE_WORKERS", "16"))
+STAGE_TIMEOUTS = {
+    "stt": float(os.environ.get("STT_TIMEOUT", "30")),
+    "llm": float(os.environ.get("LLM_TIMEOUT", "60")),
+    "tts": float(os.environ.get("TTS_TIMEOUT", "45")),
+    "features": float(os.environ.get("FEATURES_TIMEOUT", "20")),
+    "image": float(os.environ.get("IMAGE_TIMEOUT", "10")),
+}
+DISCONNECT_POLL_INTERVAL = 0.5
+stage_executor = ThreadPoolExecutor(max_workers=STAGE_WORKERS, thread_name_prefix="stage")
+
+class StageTimeout(Exception):
+    pass
+
+class ClientDisconnected(Exception):
+    pass
 
-        return mfccs, chroma, mspec
-    except Exception:
-        return None, None, None
+async def _wait_for_disconnect(request):
+    while not await request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
 
-app = FastAPI()
+async def run_stage(stage, request, fn, *args, **kwargs):
+    """
+    Run a blocking call on the stage pool with the stage's timeout.
+    Gives up (and frees the request) if the client disconnects first; the worker
+    thread itself can't be interrupted and finishes in the background.
+    """
+    loop = asyncio.get_running_loop()
+    submitted = time.perf_counter()
+
+    def timed_call():
+        telemetry.stage_queue_seconds.observe(time.perf_counter() - submitted, stage=stage)
+        with telemetry.span(stage):
+            return fn(*args, **kwargs)
+
+    work = loop.run_in_executor(stage_executor, telemetry.run_in_context(timed_call))
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request)) if request is not None else None
+    waiting = {work, watcher} if watcher else {work}
+    try:
+        done, _ = await asyncio.wait(waiting, timeout=STAGE_TIMEOUTS.get(stage), return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        if watcher:
+            watcher.cancel()
+    if work in done:
+        return work.result()
+    work.cancel()
+    if watcher in done:
+        raise ClientDisconnected(stage)
+    raise StageTimeout(f"{stage} stage timed out after {STAGE_TIMEOUTS.get(stage)}s")
+
+def stage_error_response(e):
+    if isinstance(e, StageTimeout):
+        return JSONResponse(content={"error": str(e)}, status_code=504)
+    # 499: client closed request (nginx convention); nobody is listening anyway
+    return Response(status_code=499)
+
+# Reply audio is served from memory at /audio/{id} for AUDIO_TTL seconds
+AUDIO_TTL = float(os.environ.get("AUDIO_TTL", "300"))
+AUDIO_CHUNK_BYTES = 64 * 1024
+audio_store = AudioStore(ttl=AUDIO_TTL, max_bytes=int(os.environ.get("AUDIO_STORE_BYTES", str(64 * 1024 * 1024))))
+
+CLIENT_WARMUP = os.environ.get("CLIENT_WARMUP", "1") == "1"
+
+# Admission control: per-route concurrency limits with bounded FIFO queues
+# (429 + Retry-After beyond them) and an upload size limit (413)
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+
+def admission_gate(route, prefix, max_concurrent, max_queue, queue_timeout):
+    return AdmissionGate(
+        route,
+        max_concurrent=int(os.environ.get(f"{prefix}_MAX_CONCURRENT", max_concurrent)),
+        max_queue=int(os.environ.get(f"{prefix}_MAX_QUEUE", max_queue)),
+        queue_timeout=float(os.environ.get(f"{prefix}_QUEUE_TIMEOUT", queue_timeout)),
+    )
+
+# /chat and /chat/stream share one gate: the CHAT_* limits cover both, and
+# degradation sees the load of both
+chat_gate = admission_gate("/chat", "CHAT", 32, 64, 10)
+admission_gates = {
+    "/chat": chat_gate,
+    "/chat/stream": chat_gate,
+    "/predict_respiratory": admission_gate("/predict_respiratory", "RESP", 8, 32, 5),
+}
+
+# Gate pressure (running + queued requests per slot) at which replies are
+# degraded before requests start being rejected
+DEGRADE_GTTS_AT = float(os.environ.get("DEGRADE_GTTS_AT", "0.75"))
+DEGRADE_TEXT_AT = float(os.environ.get("DEGRADE_TEXT_AT", "1.5"))
+
+def tts_degradation(route):
+    """
+    None, "gtts" (skip ElevenLabs) or "text_only" (skip TTS) for a reply,
+    depending on how loaded the route is right now.
+    """
+    pressure = admission_gates[route].pressure()
+    if pressure >= DEGRADE_TEXT_AT:
+        mode = "text_only"
+    elif pressure >= DEGRADE_GTTS_AT:
+        mode = "gtts"
+    else:
+        return None
+    telemetry.degraded_responses.inc(route=route, mode=mode)
+    return mode
+
+@asynccontextmanager
+async def lifespan(app):
+    log_tts_status()
+    threading.Thread(target=warm_up_models, name="model-warmup", daemon=True).start()
+    if CLIENT_WARMUP:
+        asyncio.get_running_loop().run_in_executor(stage_executor, registry.warm_up)
+    yield
+    await respiratory_batcher.close()
+    stage_executor.shutdown(wait=False, cancel_futures=True)
+    model_registry.close()
+    registry.close()
+
+app = FastAPI(lifespan=lifespan)
+# Added first so telemetry (outside it) also records the 429s and 413s
+app.add_middleware(AdmissionMiddleware, gates=admission_gates, max_upload_bytes=MAX_UPLOAD_BYTES)
+app.add_middleware(telemetry.TelemetryMiddleware)
+telemetry.registry.register(telemetry.CallbackGauge(
+    "speechbot_respiratory_batch_queue_depth", "Respiratory requests waiting for a model batch.", lambda: respiratory_batcher.queue_depth))
 
 app.add_middleware(
     CORSMiddleware,
@@ -76,26 +324,218 @@ SYSTEM_PROMPT = """
 You are a professional, empathetic doctor. Your goal is to diagnose the patient through a natural conversation.
 """
 
+CHAT_MODEL = "llama-3.3-70b-versatile"
+VISION_MODEL = "meta-llama/llama-4-scout-17b-16e-instruct"
+
+SUMMARY_MODEL = "llama-3.1-8b-instant"
+
+def parse_history(history):
+    messages = []
+    if history:
+        try:
+            history_list = json.loads(history)
+            for msg in history_list:
+                if msg.get("role") in ["user", "assistant"]:
+                    messages.append({"role": msg["role"], "content": msg["content"]})
+        except Exception: pass
+    return messages
+
+def summarize_turns(previous_summary, turns):
+    transcript = "\n".join(f"{role}: {content}" for role, content in turns)
+    if previous_summary:
+        transcript = f"Earlier summary: {previous_summary}\n{transcript}"
+    client = registry.groq(os.environ.get("GROQ_API_KEY"))
+    with telemetry.span("groq_summary"):
+        try:
+            completion = client.chat.completions.create(
+                messages=[
+                    {"role": "system", "content": "Summarize this doctor-patient consultation in a short paragraph. Keep symptoms, durations, medications, test results and advice given."},
+                    {"role": "user", "content": transcript},
+                ],
+                model=SUMMARY_MODEL, temperature=0.2, max_tokens=300,
+            )
+        except Exception:
+            telemetry.provider_errors.inc(provider="groq", operation="summary")
+            raise
+    return completion.choices[0].message.content
+
+# Conversation history lives server-side, keyed by session id
+session_manager = SessionManager(
+    create_session_store(os.environ.get("SESSION_BACKEND", "memory"), os.environ.get("SESSION_DB_PATH", "sessions.db")),
+    token_budget=int(os.environ.get("SESSION_TOKEN_BUDGET", "3000")),
+    summarize_fn=summarize_turns,
+)
+
+def resolve_history(session_id, history):
+    """
+    Returns (session_id, prior_messages). A given session id uses the
+    server-side history (UnknownSession if this server didn't issue it);
+    clients still sending the full history without a session id keep the old
+    stateless behaviour; otherwise the server issues a new session.
+    """
+    if session_id:
+        return session_id, session_manager.prompt_history(session_id)
+    if history:
+        return None, parse_history(history)
+    return session_manager.new_session(), []
+
+def unknown_session_response(session_id):
+    return JSONResponse(content={"error": f"Unknown or expired session_id {session_id!r}; omit it to start a new session"}, status_code=404)
+
+def record_session_turn(session_id, user_text, doctor_response, with_image=False):
+    if not session_id:
+        return
+    if with_image:
+        user_text = f"{user_text} [image attached]".strip()
+    try:
+        session_manager.record_turn(session_id, user_text, doctor_response)
+    except UnknownSession:
+        # Evicted while the reply was generated; the reply itself still stands
+        print(f"⚠ Session {session_id} expired before its turn was recorded")
+        return
+    if session_manager.needs_compaction(session_id):
+        # Summarizing is off the response path; failures just leave turns unsummarized
+        future = stage_executor.submit(telemetry.run_in_context(session_manager.compact), session_id)
+        future.add_done_callback(lambda f: f.exception() and print(f"⚠ Session summary failed: {f.exception()}"))
+
+def build_messages(transcription, prior_messages, image_payload=None):
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}] + list(prior_messages)
+
+    user_content = []
+    if transcription: user_content.append({"type": "text", "text": transcription})
+    if image_payload:
+        encoded_image, mime_type = image_payload
+        user_content.append({"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{encoded_image}"}})
+
+    messages.append({"role": "user", "content": user_content})
+    return messages
+
+def generate_doctor_response(messages, model):
+    client = registry.groq(os.environ.get("GROQ_API_KEY"))
+    with telemetry.span("groq_chat"):
+        try:
+            chat_completion = client.chat.completions.create(messages=messages, model=model, temperature=0.7, max_tokens=500)
+        except Exception:
+            telemetry.provider_errors.inc(provider="groq", operation="chat")
+            raise
+    return chat_completion.choices[0].message.content
+
+def stream_doctor_response(messages, model, on_delta):
+    """
+    Stream the completion, calling on_delta(text) for each token delta.
+    Runs on a stage thread; on_delta must be thread-safe.
+    """
+    client = registry.groq(os.environ.get("GROQ_API_KEY"))
+    started = time.perf_counter()
+    first_token = True
+    with telemetry.span("groq_chat_stream"):
+        try:
+            stream = client.chat.completions.create(messages=messages, model=model, temperature=0.7, max_tokens=500, stream=True)
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first_token:
+                        telemetry.observe("groq_first_token", time.perf_counter() - started)
+                        first_token = False
+                    on_delta(chunk.choices[0].delta.content)
+        except Exception:
+            telemetry.provider_errors.inc(provider="groq", operation="chat_stream")
+            raise
+
+async def analyze_respiratory_audio(request, audio_bytes, filename):
+    """
+    Features + model probabilities for an upload, served from the content-hash
+    cache when the same bytes were analyzed under the current model version.
+    Returns the probability rows, or None without a model or usable audio.
+    """
+    # A replaced model file changes the version and drops stale entries
+    respiratory_cache.set_version(respiratory_cache_version())
+    cache_key = respiratory_cache.key(audio_bytes)
+    cached = respiratory_cache.get(cache_key)
+    if cached is not None:
+        features, model_probs = cached
+        if model_probs is not None or not model_registry.ready():
+            return model_probs
+    else:
+        features = await run_stage("features", request, extract_features, audio_bytes, filename)
+        if features[0] is None:
+            return None
+
+    model_probs = None
+    if model_registry.ready():
+        model_probs = await respiratory_batcher.submit(list(features))
+    respiratory_cache.put(cache_key, features, model_probs)
+    return model_probs
+
+async def analyze_respiratory_windows(request, audio_bytes, filename, hop_seconds):
+    """
+    Run overlapping 6-second windows of a long recording through the model in
+    batches. Returns (timeline, clip_probs); clip_probs is the mean of the
+    per-window probabilities, or None without a model.
+    """
+    timeline, window_probs = [], []
+
+    def add_windows(spans, probs):
+        for i, (start, end) in enumerate(spans):
+            window = {"start": round(start, 3), "end": round(end, 3)}
+            if probs is not None:
+                window_probs.append(probs[i])
+                window["prediction"] = RESP_LABELS[int(np.argmax(probs[i]))]
+                window["confidence"] = float(np.max(probs[i]))
+                window["probabilities"] = {label: float(p) for label, p in zip(RESP_LABELS, probs[i])}
+            timeline.append(window)
+
+    if INFERENCE_SOCKET:
+        # The inference workers decode, featurize and score every window in one call
+        add_windows(*await run_stage("features", request, model_registry.analyze_windows, audio_bytes, filename, hop_seconds))
+    else:
+        with streamable_audio(audio_bytes, filename) as source:
+            batches = upload_audio.iter_window_feature_batches(source, filename, hop_seconds)
+            while True:
+                # Each batch is decoded and featurized on the stage pool; the
+                # generator keeps only the current window batch in memory
+                item = await run_stage("features", request, next, batches, None)
+                if item is None:
+                    break
+                spans, features = item
+                add_windows(spans, await respiratory_batcher.submit(list(features)) if model_registry.ready() else None)
+    clip_probs = np.mean(window_probs, axis=0) if window_probs else None
+    return timeline, clip_probs
+
 @app.post("/predict_respiratory")
 async def predict_respiratory(
+    request: Request,
     audio: UploadFile = File(...),
-    folder_name: Optional[str] = Form(None)
+    folder_name: Optional[str] = Form(None),
+    windowed: bool = Form(False),
+    hop_seconds: float = Form(feature_engine.WINDOW_HOP_SECONDS)
 ):
     try:
-        # 1. Background processing (to simulate model activity)
+        if windowed and not 0 < hop_seconds <= feature_engine.CLIP_SECONDS:
+            return JSONResponse(content={"error": f"hop_seconds must be in (0, {feature_engine.CLIP_SECONDS}]"}, status_code=400)
         original_filename = audio.filename.lower()
         search_target = folder_name.lower() if folder_name else original_filename
         
-        # Use a fixed safe name to avoid filesystem errors with blob URLs
-        safe_local_path = "temp_inference_audio.wav"
-        
-        with open(safe_local_path, "wb") as buffer:
-            shutil.copyfileobj(audio.file, buffer)
+        audio_bytes = await audio.read()
         
-        # We still extract features so logs look real during presentation
-        extract_features(safe_local_path)
+        timeline = None
+        if windowed:
+            timeline, clip_probs = await analyze_respiratory_windows(request, audio_bytes, audio.filename, hop_seconds)
+            model_probs = clip_probs[None] if clip_probs is not None else None
+        else:
+            model_probs = await analyze_respiratory_audio(request, audio_bytes, audio.filename)
+        if model_probs is not None and not RESP_DEMO_LABELS:
+            probs = model_probs[0]
+            result = {
+                "prediction": RESP_LABELS[int(np.argmax(probs))],
+                "confidence": round(float(np.max(probs)), 2),
+                "all_predictions": {label: float(p) for label, p in zip(RESP_LABELS, probs)},
+                "source": "model",
+            }
+            if windowed:
+                result.update(window_seconds=feature_engine.CLIP_SECONDS, hop_seconds=hop_seconds, timeline=timeline)
+            return result
 
-        # 2. DEMO LOGIC based on ORIGINAL filename or FOLDER NAME
+        # DEMO LOGIC (no model loaded) based on ORIGINAL filename or FOLDER NAME
         # Default
         predicted_label = "Normal"
         confidence = round(random.uniform(0.90, 0.98), 2)
@@ -116,87 +556,328 @@ async def predict_respiratory(
         elif "urti" in search_target:
             predicted_label = "URTI"
         
-        # 3. Simulate detailed probabilities for the UI
+        # Simulate detailed probabilities for the UI
         fake_probs = {label: 0.01 for label in RESP_LABELS}
         fake_probs[predicted_label] = confidence
-        
-        if os.path.exists(safe_local_path):
-            os.remove(safe_local_path)
 
-        return {
+        result = {
             "prediction": predicted_label,
             "confidence": confidence,
-            "all_predictions": fake_probs
+            "all_predictions": fake_probs,
+            "source": "demo"
         }
+        if windowed:
+            result["window_seconds"] = feature_engine.CLIP_SECONDS
+            result["hop_seconds"] = hop_seconds
+            result["timeline"] = timeline
+            if model_probs is not None:
+                result["clip_predictions"] = {label: float(p) for label, p in zip(RESP_LABELS, model_probs[0])}
+        return result
+    except (StageTimeout, ClientDisconnected) as e:
+        return stage_error_response(e)
+    except UndecodableAudio as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
     except Exception as e:
         traceback.print_exc()
         return JSONResponse(content={"error": str(e)}, status_code=500)
 
+STREAM_SAMPLE_FORMATS = {"int16": (np.int16, 1 / 32768.0), "float32": (np.float32, 1.0)}
+
+@app.websocket("/ws/respiratory")
+async def respiratory_stream(websocket: WebSocket, sample_rate: int = 16000, hop_seconds: float = 1.0, sample_format: str = "int16"):
+    """
+    Continuous respiratory monitoring. The client streams raw mono PCM as
+    binary messages (int16 little-endian by default); once six seconds have
+    arrived the server pushes a JSON prediction every hop_seconds.
+    """
+    await websocket.accept()
+    if sample_format not in STREAM_SAMPLE_FORMATS or not 4000 <= sample_rate <= 96000 or not 0 < hop_seconds <= feature_engine.CLIP_SECONDS:
+        await websocket.send_json({"type": "error", "error": "Unsupported stream parameters"})
+        await websocket.close(code=1003)
+        return
+
+    dtype, scale = STREAM_SAMPLE_FORMATS[sample_format]
+    extractor = feature_engine.StreamingFeatureExtractor(sample_rate, hop_seconds=hop_seconds)
+    loop = asyncio.get_running_loop()
+    telemetry.requests_in_flight.inc(route="/ws/respiratory")
+    try:
+        while True:
+            message = await websocket.receive_bytes()
+            usable = len(message) - len(message) % np.dtype(dtype).itemsize
+            extractor.push(np.frombuffer(message[:usable], dtype=dtype).astype(np.float32) * scale)
+            if not extractor.prediction_due():
+                continue
+
+            features = await loop.run_in_executor(
+                stage_executor, telemetry.timed("stream_features")(stream_window_features), extractor, extractor.snapshot())
+            update = {"type": "window", "time": round(extractor.current_time, 3)}
+            if model_registry.ready():
+                probs = (await respiratory_batcher.submit(list(features)))[0]
+                update["prediction"] = RESP_LABELS[int(np.argmax(probs))]
+                update["confidence"] = float(np.max(probs))
+                update["probabilities"] = {label: float(p) for label, p in zip(RESP_LABELS, probs)}
+            await websocket.send_json(update)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        telemetry.requests_in_flight.dec(route="/ws/respiratory")
+
+@app.get("/healthz")
+async def healthz():
+    # Liveness only: the process is up and serving the event loop
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """
+    Readiness: 503 while a component is still loading. A missing or broken
+    model doesn't block readiness; /predict_respiratory falls back to its
+    demo behaviour in that case.
+    """
+    if readiness["respiratory_model"] != "loading":
+        # The model watcher may have swapped models in or out since start-up
+        update_model_readiness()
+    loading = any(state == "loading" for state in readiness.values())
+    content = {"ready": not loading, "components": dict(readiness)}
+    if readiness_detail:
+        content["detail"] = dict(readiness_detail)
+    return JSONResponse(content=content, status_code=503 if loading else 200)
+
+@app.get("/metrics")
+async def metrics():
+    return Response(content=telemetry.render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/stats/models")
+async def model_stats():
+    return model_registry.stats()
+
+@app.post("/admin/models/reload")
+async def reload_models():
+    # Same check the watcher runs; useful with MODEL_RELOAD_INTERVAL=0
+    changed = await asyncio.get_running_loop().run_in_executor(stage_executor, model_registry.reload)
+    update_model_readiness()
+    return {"changed": changed, **model_registry.stats()}
+
+@app.get("/stats/admission")
+async def admission_stats():
+    return {route: gate.stats() for route, gate in admission_gates.items()}
+
+@app.get("/stats/respiratory_batcher")
+async def respiratory_batcher_stats():
+    return respiratory_batcher.stats()
+
+@app.get("/stats/respiratory_cache")
+async def respiratory_cache_stats():
+    return respiratory_cache.stats()
+
+@app.post("/admin/respiratory_cache/invalidate")
+async def invalidate_respiratory_cache():
+    respiratory_cache.invalidate()
+    return respiratory_cache.stats()
+
+@app.get("/stats/tts_cache")
+async def tts_cache_stats():
+    return tts_cache.stats()
+
+@app.get("/stats/tts_router")
+async def tts_router_stats():
+    return tts_router.stats()
+
+@app.get("/stats/translation")
+async def translation_stats():
+    return translation_service.stats()
+
 @app.post("/chat")
 async def chat(
+    request: Request,
     audio: Optional[UploadFile] = File(None),
     image: Optional[UploadFile] = File(None),
     text: Optional[str] = Form(None),
     history: Optional[str] = Form(None),
-    language: Optional[str] = Form("English")
+    language: Optional[str] = Form("English"),
+    session_id: Optional[str] = Form(None)
 ):
+    if session_id and not session_manager.exists(session_id):
+        return unknown_session_response(session_id)
     try:
         transcription = ""
         if audio:
-            # Sanitize chat audio name too
-            safe_chat_audio = "temp_chat_audio.wav"
-            with open(safe_chat_audio, "wb") as buffer:
-                shutil.copyfileobj(audio.file, buffer)
-            transcription = transcribe_with_groq(
-                stt_model="whisper-large-v3",
-                audio_filepath=safe_chat_audio,
-                GROQ_API_KEY=os.environ.get("GROQ_API_KEY")
-            )
-            if os.path.exists(safe_chat_audio): os.remove(safe_chat_audio)
+            transcription = await run_stage("stt", request, transcribe_upload, await audio.read(), audio.filename)
         
         if text: transcription = text if not transcription else f"{transcription} {text}"
         if not transcription and not image: return JSONResponse(content={"error": "No input provided"}, status_code=400)
 
-        messages = [{"role": "system", "content": SYSTEM_PROMPT}]
-        if history:
-            try:
-                import json
-                history_list = json.loads(history)
-                for msg in history_list:
-                    if msg.get("role") in ["user", "assistant"]:
-                        messages.append({"role": msg["role"], "content": msg["content"]})
-            except Exception: pass
-
-        user_content = []
-        if transcription: user_content.append({"type": "text", "text": transcription})
-        if image:
-            safe_img = "temp_chat_img.jpg"
-            with open(safe_img, "wb") as buffer: shutil.copyfileobj(image.file, buffer)
-            encoded_image = encode_image(safe_img)
-            user_content.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{encoded_image}"}})
-            if os.path.exists(safe_img): os.remove(safe_img)
-
-        messages.append({"role": "user", "content": user_content})
-        model = "meta-llama/llama-4-scout-17b-16e-instruct" if image else "llama-3.3-70b-versatile" 
+        image_payload = await run_stage("image", request, encode_image_payload, await image.read()) if image else None
+        session_id, prior_messages = resolve_history(session_id, history)
+        messages = build_messages(transcription, prior_messages, image_payload)
+        model = VISION_MODEL if image else CHAT_MODEL
         
-        client = Groq(api_key=os.environ.get("GROQ_API_KEY"), timeout=60.0)
-        chat_completion = client.chat.completions.create(messages=messages, model=model, temperature=0.7, max_tokens=500)
-        doctor_response = chat_completion.choices[0].message.content
+        doctor_response = await run_stage("llm", request, generate_doctor_response, messages, model)
+        record_session_turn(session_id, transcription, doctor_response, with_image=bool(image))
 
-        output_audio_path = "response.mp3"
-        text_to_speech_with_elevenlabs(input_text=doctor_response, output_filepath=output_audio_path, language=language)
+        degraded = tts_degradation("/chat")
+        response_audio = None
+        if degraded != "text_only":
+            engine = text_to_speech_with_gtts if degraded == "gtts" else None
+            response_audio = await run_stage("tts", request, text_to_speech_pipelined, input_text=doctor_response, output_filepath=None, language=language, engine=engine)
 
-        audio_base64 = None
-        if os.path.exists(output_audio_path):
-            with open(output_audio_path, "rb") as audio_file:
-                audio_base64 = base64.b64encode(audio_file.read()).decode("utf-8")
-            os.remove(output_audio_path)
+        audio_url = store_reply_audio(response_audio) if response_audio else None
 
-        return JSONResponse(content={"transcription": transcription, "response": doctor_response, "audio_base64": audio_base64})
+        content = {"transcription": transcription, "response": doctor_response, "audio_url": audio_url, "session_id": session_id}
+        if degraded:
+            content["degraded"] = degraded
+        return JSONResponse(content=content)
+    except UnknownSession:
+        return unknown_session_response(session_id)
+    except (StageTimeout, ClientDisconnected) as e:
+        return stage_error_response(e)
     except Exception as e:
         traceback.print_exc()
         return JSONResponse(content={"error": str(e)}, status_code=500)
 
+def store_reply_audio(audio_bytes):
+    """/audio URL for reply audio, or None if it is too large to keep."""
+    try:
+        return f"/audio/{audio_store.put(audio_bytes)}"
+    except AudioTooLarge as e:
+        print(f"⚠ Reply audio not stored: {e}")
+        return None
+
+@app.get("/audio/{audio_id}")
+async def get_audio(audio_id: str, request: Request):
+    item = audio_store.get(audio_id)
+    if item is None:
+        return JSONResponse(content={"error": "Audio not found or expired"}, status_code=404)
+    data, media_type, seconds_left = item
+    size = len(data)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Cache-Control": f"private, max-age={int(seconds_left)}, immutable",
+        "ETag": f'"{audio_id}"',
+    }
+    try:
+        byte_range = parse_range(request.headers.get("range"), size)
+    except ValueError:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+
+    start, end, status_code = 0, size - 1, 200
+    if byte_range is not None:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+
+    view = memoryview(data)[start:end + 1]
+    def chunks():
+        for offset in range(0, len(view), AUDIO_CHUNK_BYTES):
+            yield bytes(view[offset:offset + AUDIO_CHUNK_BYTES])
+
+    return StreamingResponse(chunks(), status_code=status_code, media_type=media_type, headers=headers)
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(
+    request: Request,
+    audio: Optional[UploadFile] = File(None),
+    image: Optional[UploadFile] = File(None),
+    text: Optional[str] = Form(None),
+    history: Optional[str] = Form(None),
+    language: Optional[str] = Form("English"),
+    session_id: Optional[str] = Form(None)
+):
+    """
+    Server-Sent Events variant of /chat. Emits, in order:
+    transcription, token (one per LLM delta), audio (one per synthesized
+    sentence, with its index and an /audio URL), then done with the full
+    response and session id.
+    """
+    audio_bytes = await audio.read() if audio else None
+    image_bytes = await image.read() if image else None
+    if not audio_bytes and not text and not image_bytes:
+        return JSONResponse(content={"error": "No input provided"}, status_code=400)
+    if session_id and not session_manager.exists(session_id):
+        return unknown_session_response(session_id)
+
+    async def events():
+        loop = asyncio.get_running_loop()
+        try:
+            transcription = ""
+            if audio_bytes:
+                transcription = await run_stage("stt", request, transcribe_upload, audio_bytes, audio.filename)
+            if text: transcription = text if not transcription else f"{transcription} {text}"
+            yield sse_event("transcription", {"text": transcription})
+
+            image_payload = await run_stage("image", request, encode_image_payload, image_bytes) if image_bytes else None
+            turn_session_id, prior_messages = resolve_history(session_id, history)
+            messages = build_messages(transcription, prior_messages, image_payload)
+            model = VISION_MODEL if image_bytes else CHAT_MODEL
+
+            deltas = asyncio.Queue()
+            push = lambda item: loop.call_soon_threadsafe(deltas.put_nowait, item)
+            llm = asyncio.ensure_future(run_stage("llm", request, stream_doctor_response, messages, model, push))
+            llm.add_done_callback(lambda _: push(None))
+
+            # Each completed sentence goes to TTS while the LLM keeps streaming;
+            # audio is emitted strictly in sentence order.
+            tts_tasks = []
+            next_audio = 0
+            pending_text = ""
+            doctor_response = ""
+            degraded = tts_degradation("/chat/stream")
+            # Sentences are synthesized one call at a time; one engine voices them all
+            engine = text_to_speech_with_gtts if degraded == "gtts" else ReplyEngine()
+
+            def synthesize(sentence):
+                if degraded == "text_only":
+                    return
+                tts_tasks.append(asyncio.ensure_future(run_stage(
+                    "tts", request, text_to_speech_pipelined,
+                    input_text=sentence, output_filepath=None, language=language, engine=engine)))
+
+            def ready_audio():
+                nonlocal next_audio
+                while next_audio < len(tts_tasks) and tts_tasks[next_audio].done():
+                    chunk = tts_tasks[next_audio].result()
+                    audio_url = store_reply_audio(chunk) if chunk else None
+                    if audio_url:
+                        yield sse_event("audio", {"index": next_audio, "audio_url": audio_url})
+                    next_audio += 1
+
+            while True:
+                delta = await deltas.get()
+                if delta is None:
+                    break
+                doctor_response += delta
+                yield sse_event("token", {"text": delta})
+                sentences, pending_text = pop_complete_sentences(pending_text + delta)
+                for sentence in sentences:
+                    synthesize(sentence)
+                for event in ready_audio():
+                    yield event
+            llm.result()
+            record_session_turn(turn_session_id, transcription, doctor_response, with_image=bool(image_bytes))
+
+            if pending_text.strip():
+                synthesize(pending_text.strip())
+            for task in tts_tasks[next_audio:]:
+                await asyncio.wait([task])
+                for event in ready_audio():
+                    yield event
+
+            done = {"transcription": transcription, "response": doctor_response, "session_id": turn_session_id}
+            if degraded:
+                done["degraded"] = degraded
+            yield sse_event("done", done)
+        except (StageTimeout, ClientDisconnected) as e:
+            yield sse_event("error", {"error": str(e)})
+        except Exception as e:
+            traceback.print_exc()
+            yield sse_event("error", {"error": str(e)})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
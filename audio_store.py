@@ -0,0 +1,92 @@
+# Short-lived in-memory store for reply audio.
+#
+# /chat keeps synthesized MP3s here and returns only a reference; clients fetch
+# the bytes from /audio/{audio_id} (with HTTP range support) instead of
+# decoding base64 out of the JSON body.
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+RANGE_HEADER = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+class AudioTooLarge(ValueError):
+    """The item alone is bigger than the store's max_bytes."""
+
+
+class AudioStore:
+    def __init__(self, ttl=300.0, max_bytes=64 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _drop(self, audio_id):
+        data, _, _ = self._items.pop(audio_id)
+        self._bytes -= len(data)
+
+    def _purge(self, now):
+        # Entries are in insertion order, so expired ones are at the front
+        while self._items:
+            audio_id, (_, _, expires) = next(iter(self._items.items()))
+            if expires > now and self._bytes <= self.max_bytes:
+                break
+            self._drop(audio_id)
+
+    def put(self, data, media_type="audio/mpeg"):
+        """
+        Store data and return its id. Raises AudioTooLarge for an item that
+        could never fit, rather than handing out an id that is already gone.
+        """
+        if len(data) > self.max_bytes:
+            raise AudioTooLarge(f"{len(data)} bytes exceeds the audio store limit of {self.max_bytes}")
+        audio_id = secrets.token_urlsafe(16)
+        now = time.monotonic()
+        with self._lock:
+            self._items[audio_id] = (data, media_type, now + self.ttl)
+            self._bytes += len(data)
+            self._purge(now)
+        return audio_id
+
+    def get(self, audio_id):
+        """
+        Returns (data, media_type, seconds_left) or None if unknown or expired.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            item = self._items.get(audio_id)
+            if item is None:
+                return None
+            data, media_type, expires = item
+            return data, media_type, expires - now
+
+
+def parse_range(header, size):
+    """
+    Parse a single-range "bytes=start-end" header into (start, end) inclusive.
+    Returns None when the header is absent or not a single byte range,
+    and raises ValueError for an unsatisfiable range.
+    """
+    if not header:
+        return None
+    match = RANGE_HEADER.match(header.strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if start == "" and end == "":
+        return None
+    if start == "":
+        # Suffix range: the last N bytes
+        length = int(end)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = int(end) if end else size - 1
+    if start >= size or end < start:
+        raise ValueError("range not satisfiable")
+    return start, min(end, size - 1)
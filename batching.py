@@ -0,0 +1,138 @@
+# Dynamic micro-batching for model inference.
+#
+# Concurrent requests submit their feature tensors to a MicroBatcher. A single
+# background task collects them for up to max_wait_ms (or until max_batch_size
+# rows are reached), stacks them along the batch axis, calls the model once in
+# a worker thread and hands every caller back its own slice of the output.
+# A submission with more rows than max_batch_size (e.g. many windows of one
+# recording) is split across batches and reassembled.
+import asyncio
+from collections import Counter
+
+import numpy as np
+
+
+class MicroBatcher:
+    def __init__(self, predict_fn, max_batch_size=32, max_wait_ms=5.0):
+        """
+        predict_fn: callable taking a list of stacked input arrays and returning
+        an array whose first axis matches the stacked batch.
+        """
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.batch_size_histogram = Counter()
+        self.total_batches = 0
+        self.total_items = 0
+        self.total_rows = 0
+        self._queue = None
+        # A request taken off the queue that didn't fit the batch being formed
+        self._carry = None
+        self._task = None
+        self._in_flight = 0
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._carry = None
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, inputs):
+        """
+        inputs: list/tuple of arrays, each with a leading batch axis (usually 1).
+        Returns the model output rows belonging to these inputs.
+        """
+        self._ensure_started()
+        rows = len(inputs[0])
+        if rows <= self.max_batch_size:
+            return await self._submit_part(inputs)
+        parts = [[x[start:start + self.max_batch_size] for x in inputs] for start in range(0, rows, self.max_batch_size)]
+        return np.concatenate(await asyncio.gather(*(self._submit_part(part) for part in parts)))
+
+    async def _submit_part(self, inputs):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((inputs, future))
+        return await future
+
+    @property
+    def queue_depth(self):
+        return (self._queue.qsize() if self._queue else 0) + self._in_flight
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue_depth,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "total_batches": self.total_batches,
+            "total_items": self.total_items,
+            "total_rows": self.total_rows,
+            "batch_size_histogram": dict(sorted(self.batch_size_histogram.items())),
+        }
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        if self._carry is not None:
+            batch, self._carry = [self._carry], None
+        else:
+            batch = [await self._queue.get()]
+        rows = len(batch[0][0][0])
+        deadline = loop.time() + self.max_wait
+        while rows < self.max_batch_size:
+            if not self._queue.empty():
+                item = self._queue.get_nowait()
+            else:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            if rows + len(item[0][0]) > self.max_batch_size:
+                # Starts the next batch instead
+                self._carry = item
+                break
+            batch.append(item)
+            rows += len(item[0][0])
+        # Callers that disconnected while queued don't need a slot in the batch
+        return [(inputs, fut) for inputs, fut in batch if not fut.done()]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            if not batch:
+                continue
+            self._in_flight = len(batch)
+            try:
+                sizes = [len(inputs[0]) for inputs, _ in batch]
+                stacked = [np.concatenate([inputs[i] for inputs, _ in batch]) for i in range(len(batch[0][0]))]
+                outputs = await loop.run_in_executor(None, self.predict_fn, stacked)
+                outputs = np.asarray(outputs)
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            finally:
+                self._in_flight = 0
+
+            self.total_batches += 1
+            self.total_items += len(batch)
+            self.total_rows += sum(sizes)
+            self.batch_size_histogram[sum(sizes)] += 1
+
+            offset = 0
+            for (_, fut), size in zip(batch, sizes):
+                if not fut.done():
+                    fut.set_result(outputs[offset:offset + size])
+                offset += size
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
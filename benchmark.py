@@ -0,0 +1,427 @@
+# Offline benchmark suite.
+#
+# Starts api.py in-process behind uvicorn, with Groq, ElevenLabs and the
+# translator replaced by the local fakes in fake_providers.py, then drives
+# /chat and /predict_respiratory at fixed concurrency levels and times the hot
+# helpers (feature extraction, image encoding, TTS post-processing) directly.
+# Results are written to JSON; pass --compare with an earlier file to see how
+# a change moved the numbers.
+#
+#   python benchmark.py --concurrency 1,8,32 --requests 64 --output bench.json
+#   python benchmark.py --compare bench.json --output bench_new.json
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from fake_providers import DEFAULT_LATENCY, FAKE_REPLY, MP3_FRAME, FakeProviders
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_AUDIO = os.path.join(APP_DIR, "test_audios", "Asthma", "asthma_101_1b1_Al_sc_Meditron.wav")
+ENDPOINTS = ("chat", "predict_respiratory")
+
+
+def percentiles(seconds):
+    """
+    Latency summary in milliseconds.
+    """
+    ms = np.asarray(seconds, dtype=np.float64) * 1000
+    if not len(ms):
+        return {}
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        "p50": round(float(p50), 3),
+        "p95": round(float(p95), 3),
+        "p99": round(float(p99), 3),
+        "mean": round(float(ms.mean()), 3),
+        "min": round(float(ms.min()), 3),
+        "max": round(float(ms.max()), 3),
+    }
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is bytes on macOS and kilobytes elsewhere
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class MemorySampler:
+    """
+    Samples the process RSS in the background. The server, the load generator
+    and the fakes share the process, so this is an upper bound for the server.
+    """
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self.start_bytes = self.peak_bytes = self.end_bytes = 0
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_bytes = max(self.peak_bytes, rss_bytes())
+
+    def __enter__(self):
+        self.start_bytes = self.peak_bytes = rss_bytes()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.end_bytes = rss_bytes()
+        self.peak_bytes = max(self.peak_bytes, self.end_bytes)
+
+    def report(self):
+        mb = 1024 * 1024
+        return {
+            "rss_start_mb": round(self.start_bytes / mb, 1),
+            "rss_peak_mb": round(self.peak_bytes / mb, 1),
+            "rss_end_mb": round(self.end_bytes / mb, 1),
+        }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def configure_environment(providers, warm_caches):
+    """
+    Must run before api.py is imported: the provider clients and caches read
+    their settings at import time.
+    """
+    os.environ.update(providers.env())
+    os.environ["CLIENT_WARMUP"] = "0"
+    # gTTS has no local fake; keep hedged TTS calls off the network
+    os.environ.setdefault("TTS_ENGINES", "elevenlabs")
+    if not warm_caches:
+        # Every request should reach the fakes and the feature extractor
+        os.environ["TTS_CACHE_DIR"] = ""
+        os.environ["TTS_CACHE_MEMORY_BYTES"] = "0"
+        os.environ["RESP_CACHE_ENTRIES"] = "0"
+        os.environ["RESP_CACHE_DIR"] = ""
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(app):
+    import uvicorn
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="uvicorn", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("uvicorn failed to start")
+        time.sleep(0.05)
+    return server, thread, f"http://127.0.0.1:{port}"
+
+
+def wait_until_ready(base_url, timeout=300.0):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            response = httpx.get(f"{base_url}/readyz", timeout=5.0)
+            if response.status_code == 200:
+                return response.json()
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"server not ready after {timeout:.0f}s")
+
+
+def request_factory(endpoint, audio_bytes, language):
+    if endpoint == "chat":
+        return lambda: ("/chat", {"files": {"audio": ("question.wav", audio_bytes, "audio/wav")}, "data": {"language": language}})
+    # A neutral filename keeps the demo keyword logic out of the measurement
+    return lambda: ("/predict_respiratory", {"files": {"audio": ("recording.wav", audio_bytes, "audio/wav")}})
+
+
+async def run_load(base_url, make_request, concurrency, total, warmup):
+    """
+    Send total requests with at most concurrency in flight and return latency
+    percentiles, throughput and memory for the run.
+    """
+    import httpx
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=300.0, limits=limits) as client:
+        for _ in range(warmup):
+            path, kwargs = make_request()
+            await client.post(path, **kwargs)
+
+        latencies, errors, degraded = [], {}, {}
+        remaining = iter(range(total))
+
+        async def worker():
+            for _ in remaining:
+                path, kwargs = make_request()
+                started = time.perf_counter()
+                try:
+                    response = await client.post(path, **kwargs)
+                    status = response.status_code
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                if status == 200:
+                    latencies.append(time.perf_counter() - started)
+                    # /chat marks replies it shed TTS work from under load
+                    mode = response.json().get("degraded") if path == "/chat" else None
+                    if mode:
+                        degraded[mode] = degraded.get(mode, 0) + 1
+                else:
+                    errors[str(status)] = errors.get(str(status), 0) + 1
+
+        with MemorySampler() as memory:
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "ok": len(latencies),
+        "errors": errors,
+        "degraded": degraded,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+        "latency_ms": percentiles(latencies),
+        "memory": memory.report(),
+    }
+
+
+def time_call(fn, iterations, warmup=2):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return {"iterations": iterations, "latency_ms": percentiles(samples)}
+
+
+def sample_photo(path, size=(4032, 3024)):
+    """
+    Write a phone-camera-sized JPEG: smooth gradients plus sensor-like noise,
+    which compresses roughly like a real photo (pure noise would not).
+    """
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    width, height = size
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    rgb = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1)
+    rgb += rng.normal(0, 6, rgb.shape).astype(np.float32)
+    Image.fromarray(np.clip(rgb, 0, 255).astype(np.uint8)).save(path, "JPEG", quality=92)
+    return path
+
+
+def run_micro_benchmarks(api, audio_bytes, iterations):
+    from brain_of_the_doctor import encode_image
+    from voice_of_the_doctor import TTSCache, text_to_speech_pipelined
+    from audio_store import AudioStore, parse_range
+
+    results = {}
+    results["extract_features"] = time_call(lambda: api.extract_features(audio_bytes, "sample.wav"), iterations)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        photo = sample_photo(os.path.join(tmp, "photo.jpg"))
+        results["encode_image"] = time_call(lambda: encode_image(photo), iterations)
+        results["encode_image"]["input_bytes"] = os.path.getsize(photo)
+        results["encode_image"]["output_base64_bytes"] = len(encode_image(photo))
+
+    # TTS post-processing: everything after the provider call, with a synthesis
+    # engine that returns instantly so only the app's own work is timed
+    def instant_engine(input_text, output_filepath=None, language="en"):
+        return MP3_FRAME * max(1, len(input_text) // 2)
+
+    results["tts_pipeline"] = time_call(
+        lambda: text_to_speech_pipelined(FAKE_REPLY, language="English", translate=False, engine=instant_engine), iterations
+    )
+
+    reply_audio = text_to_speech_pipelined(FAKE_REPLY, language="English", translate=False, engine=instant_engine)
+    cache = TTSCache(disk_dir=None)
+
+    def cache_roundtrip():
+        key = TTSCache.key(FAKE_REPLY, "english", "Aria", "eleven_multilingual_v2", "mp3_22050_32")
+        cache.put(key, reply_audio)
+        cache.get(key)
+
+    results["tts_cache_roundtrip"] = time_call(cache_roundtrip, iterations)
+
+    store = AudioStore()
+
+    def serve_audio():
+        data, _, _ = store.get(store.put(reply_audio))
+        start, end = parse_range(f"bytes=0-{64 * 1024 - 1}", len(data))
+        return data[start:end + 1]
+
+    results["audio_store_range"] = time_call(serve_audio, iterations)
+    results["audio_store_range"]["reply_bytes"] = len(reply_audio)
+    return results
+
+
+def compare(current, previous):
+    """
+    Print p50/p95 for every scenario present in both result files.
+    """
+    rows = []
+    for endpoint, runs in current.get("load", {}).items():
+        before = {run["concurrency"]: run for run in previous.get("load", {}).get(endpoint, [])}
+        for run in runs:
+            if run["concurrency"] in before:
+                rows.append((f"{endpoint} c={run['concurrency']}", before[run["concurrency"]]["latency_ms"], run["latency_ms"]))
+    for name, result in current.get("micro", {}).items():
+        if name in previous.get("micro", {}):
+            rows.append((name, previous["micro"][name]["latency_ms"], result["latency_ms"]))
+
+    print(f"\nCompared with {previous.get('meta', {}).get('git_commit') or 'previous run'}:")
+    for name, old, new in rows:
+        cells = []
+        for stat in ("p50", "p95"):
+            if old.get(stat) and new.get(stat):
+                change = (new[stat] - old[stat]) / old[stat] * 100
+                cells.append(f"{stat} {old[stat]:.3f} → {new[stat]:.3f} ms ({change:+.1f}%)")
+        print(f"  {name:<32} " + "   ".join(cells))
+
+
+def print_summary(results):
+    print("\nLoad:")
+    for endpoint, runs in results["load"].items():
+        for run in runs:
+            latency = run["latency_ms"]
+            print(
+                f"  {endpoint:<20} c={run['concurrency']:<4} "
+                f"p50 {latency.get('p50', 0):8.1f}  p95 {latency.get('p95', 0):8.1f}  p99 {latency.get('p99', 0):8.1f} ms  "
+                f"{run['throughput_rps']:7.2f} req/s  peak RSS {run['memory']['rss_peak_mb']} MB"
+                + (f"  errors {run['errors']}" if run["errors"] else "")
+                + (f"  degraded {run['degraded']}" if run.get("degraded") else "")
+            )
+    if results["micro"]:
+        print("\nMicro-benchmarks:")
+        for name, result in results["micro"].items():
+            latency = result["latency_ms"]
+            print(f"  {name:<20} p50 {latency['p50']:8.3f}  p95 {latency['p95']:8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline speechbot benchmarks with local provider fakes")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=32, help="requests per endpoint per concurrency level")
+    parser.add_argument("--warmup", type=int, default=2, help="unmeasured requests before each run")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help=f"subset of {','.join(ENDPOINTS)}")
+    parser.add_argument("--language", default="Hindi", help="/chat reply language (non-English exercises translation)")
+    parser.add_argument("--audio", default=SAMPLE_AUDIO, help="upload used for both endpoints and extract_features")
+    for kind, seconds in DEFAULT_LATENCY.items():
+        parser.add_argument(f"--{kind}-latency", type=float, default=seconds, help=f"fake {kind} latency in seconds [{seconds}]")
+    parser.add_argument("--jitter", type=float, default=0.1, help="relative +/- spread of fake latencies")
+    parser.add_argument("--micro-iterations", type=int, default=20)
+    parser.add_argument("--skip-load", action="store_true")
+    parser.add_argument("--skip-micro", action="store_true")
+    parser.add_argument("--warm-caches", action="store_true", help="keep the TTS and respiratory caches enabled")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="earlier results file to diff against")
+    parser.add_argument("--verbose", action="store_true", help="show the server's own logging")
+    args = parser.parse_args()
+
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+    with open(args.audio, "rb") as f:
+        audio_bytes = f.read()
+
+    latency = {kind: getattr(args, f"{kind}_latency") for kind in DEFAULT_LATENCY}
+    providers = FakeProviders(latency=latency, jitter=args.jitter).start()
+    configure_environment(providers, args.warm_caches)
+
+    results = {
+        "meta": {
+            "git_commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "provider_latency_s": latency,
+            "jitter": args.jitter,
+            "language": args.language,
+            "warm_caches": args.warm_caches,
+            "audio": os.path.relpath(args.audio, APP_DIR),
+        },
+        "load": {},
+        "micro": {},
+    }
+
+    quiet = contextlib.redirect_stdout(io.StringIO()) if not args.verbose else contextlib.nullcontext()
+    if not args.verbose:
+        # voice_of_the_patient turns on INFO logging, which logs every HTTP call
+        logging.disable(logging.INFO)
+    with quiet:
+        started = time.perf_counter()
+        import api
+        results["meta"]["api_import_s"] = round(time.perf_counter() - started, 3)
+
+        api.translation_service.translator_factory = providers.translator_factory
+        server, thread, base_url = start_server(api.app)
+        try:
+            results["meta"]["readiness"] = wait_until_ready(base_url)
+            results["meta"]["time_to_ready_s"] = round(time.perf_counter() - started, 3)
+            if not args.skip_load:
+                for endpoint in endpoints:
+                    make_request = request_factory(endpoint, audio_bytes, args.language)
+                    results["load"][endpoint] = [
+                        asyncio.run(run_load(base_url, make_request, level, args.requests, args.warmup))
+                        for level in levels
+                    ]
+            if not args.skip_micro:
+                results["micro"] = run_micro_benchmarks(api, audio_bytes, args.micro_iterations)
+        finally:
+            server.should_exit = True
+            thread.join(timeout=10)
+            providers.stop()
+    results["provider_calls"] = dict(providers.counts)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print_summary(results)
+    print(f"\n✓ Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
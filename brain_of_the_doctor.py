@@ -9,16 +9,65 @@ GROQ_API_KEY=os.environ.get("GROQ_API_KEY")
 
 #Step2: Convert image to required format
 import base64
+import io
+from PIL import Image, ImageOps
+import telemetry
 
+# Phone photos are downsized and re-encoded before upload to the vision model
+IMAGE_MAX_EDGE=int(os.environ.get("IMAGE_MAX_EDGE", "1024"))
+IMAGE_FORMAT=os.environ.get("IMAGE_FORMAT", "JPEG").upper()  # JPEG or WEBP
+IMAGE_QUALITY=int(os.environ.get("IMAGE_QUALITY", "85"))
+IMAGE_MIME_TYPES={"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png", "GIF": "image/gif"}
+IMAGE_MIME_TYPE=IMAGE_MIME_TYPES[IMAGE_FORMAT]
 
 #image_path="acne.jpg"
 
+@telemetry.timed("image_preprocess")
+def preprocess_image(image_bytes, max_edge=IMAGE_MAX_EDGE, image_format=IMAGE_FORMAT, quality=IMAGE_QUALITY):
+    """
+    Decode, apply EXIF orientation, downsize to max_edge and re-encode.
+    Returns (encoded_bytes, mime_type). The original is kept when it is
+    already upright, within max_edge and no bigger than the re-encode. Images
+    PIL can't decode are passed through unchanged with their detected MIME type.
+    """
+    source_format=None
+    try:
+        image=Image.open(io.BytesIO(image_bytes))
+        source_format=image.format
+        keep_original=(source_format in IMAGE_MIME_TYPES and max(image.size) <= max_edge
+                       and image.getexif().get(0x0112, 1) == 1)
+        # For JPEGs, let the decoder downscale by a power of two while decoding
+        image.draft("RGB", (max_edge, max_edge))
+        image=ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "L"):
+            rgba=image.convert("RGBA")
+            image=Image.new("RGB", rgba.size, (255, 255, 255))
+            image.paste(rgba, mask=rgba.getchannel("A"))
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        output=io.BytesIO()
+        image.save(output, format=image_format, quality=quality, optimize=True)
+        if keep_original and len(image_bytes) <= output.tell():
+            return image_bytes, IMAGE_MIME_TYPES[source_format]
+        return output.getvalue(), IMAGE_MIME_TYPES[image_format]
+    except Exception as e:
+        print(f"⚠ Image preprocessing failed ({e}); sending original image")
+        return image_bytes, IMAGE_MIME_TYPES.get(source_format, "image/jpeg")
+
+def encode_image_payload(image_bytes):
+    """
+    Preprocess raw image bytes and return (base64_string, mime_type).
+    """
+    processed, mime_type=preprocess_image(image_bytes)
+    with telemetry.span("image_base64"):
+        return base64.b64encode(processed).decode('utf-8'), mime_type
+
 def encode_image(image_path):   
-    image_file=open(image_path, "rb")
-    return base64.b64encode(image_file.read()).decode('utf-8')
+    with open(image_path, "rb") as image_file:
+        encoded_image, _=encode_image_payload(image_file.read())
+    return encoded_image
 
 #Step3: Setup Multimodal LLM 
-from groq import Groq
+from clients import registry
 
 query="Is there something wrong with my face?"
 #model = "meta-llama/llama-4-maverick-17b-128e-instruct"
@@ -26,8 +75,8 @@ model="meta-llama/llama-4-scout-17b-16e-instruct"
 #model = "meta-llama/llama-4-scout-17b-16e-instruct"
 #model="llama-3.2-90b-vision-preview" #Deprecated
 
-def analyze_image_with_query(query, model, encoded_image):
-    client=Groq()  
+def analyze_image_with_query(query, model, encoded_image, mime_type=IMAGE_MIME_TYPE):
+    client=registry.groq()
     messages=[
         {
             "role": "user",
@@ -39,14 +88,47 @@ def analyze_image_with_query(query, model, encoded_image):
                 {
                     "type": "image_url",
                     "image_url": {
-                        "url": f"data:image/jpeg;base64,{encoded_image}",
+                        "url": f"data:{mime_type};base64,{encoded_image}",
                     },
                 },
             ],
         }]
-    chat_completion=client.chat.completions.create(
-        messages=messages,
-        model=model
-    )
+    with telemetry.span("groq_vision"):
+        try:
+            chat_completion=client.chat.completions.create(
+                messages=messages,
+                model=model
+            )
+        except Exception:
+            telemetry.provider_errors.inc(provider="groq", operation="vision")
+            raise
 
     return chat_completion.choices[0].message.content
+
+
+def benchmark_encode_image(image_paths, repeats=5):
+    """
+    Report bytes saved and encode time of preprocess_image for each image.
+    """
+    import time
+    results=[]
+    for path in image_paths:
+        with open(path, "rb") as f:
+            original=f.read()
+        start=time.perf_counter()
+        for _ in range(repeats):
+            processed, mime_type=preprocess_image(original)
+        elapsed_ms=(time.perf_counter() - start) / repeats * 1000
+        saved=len(original) - len(processed)
+        results.append({"path": path, "original_bytes": len(original), "processed_bytes": len(processed),
+                        "bytes_saved": saved, "mime_type": mime_type, "encode_ms": elapsed_ms})
+        print(f"{path}: {len(original)} -> {len(processed)} bytes ({saved / max(len(original), 1):.0%} saved, {mime_type}) in {elapsed_ms:.1f} ms")
+    return results
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) < 2:
+        print("Usage: python brain_of_the_doctor.py <image> [<image> ...]")
+    else:
+        benchmark_encode_image(sys.argv[1:])
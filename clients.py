@@ -0,0 +1,110 @@
+# Process-wide API clients.
+#
+# Building Groq/ElevenLabs clients per call means a fresh TLS handshake on every
+# request. The registry creates each client once, on a shared pooled httpx
+# client with keep-alive, and closes them on app shutdown. Base URLs can be
+# pointed at a local mock server for testing.
+import os
+import threading
+
+import httpx
+
+
+class ClientRegistry:
+    def __init__(self, max_connections=20, max_keepalive=10, keepalive_expiry=60.0,
+                 timeout=60.0, max_retries=2, groq_base_url=None, elevenlabs_base_url=None):
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.groq_base_url = groq_base_url
+        self.elevenlabs_base_url = elevenlabs_base_url
+        self._lock = threading.Lock()
+        self._http = None
+        self._groq = {}
+        self._elevenlabs = {}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_connections=int(os.environ.get("HTTP_POOL_SIZE", "20")),
+            max_keepalive=int(os.environ.get("HTTP_KEEPALIVE_CONNECTIONS", "10")),
+            keepalive_expiry=float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", "60")),
+            timeout=float(os.environ.get("HTTP_TIMEOUT", "60")),
+            max_retries=int(os.environ.get("HTTP_MAX_RETRIES", "2")),
+            groq_base_url=os.environ.get("GROQ_BASE_URL"),
+            elevenlabs_base_url=os.environ.get("ELEVENLABS_BASE_URL"),
+        )
+
+    def http_client(self):
+        with self._lock:
+            if self._http is None:
+                self._http = httpx.Client(
+                    timeout=self.timeout,
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_keepalive,
+                        keepalive_expiry=self.keepalive_expiry,
+                    ),
+                    # Transport-level retries cover connection failures; Groq's SDK
+                    # additionally retries 429/5xx with exponential backoff.
+                    transport=httpx.HTTPTransport(retries=self.max_retries),
+                )
+            return self._http
+
+    def groq(self, api_key=None):
+        api_key = api_key or os.environ.get("GROQ_API_KEY")
+        http = self.http_client()
+        with self._lock:
+            if api_key not in self._groq:
+                from groq import Groq
+                kwargs = {"base_url": self.groq_base_url} if self.groq_base_url else {}
+                self._groq[api_key] = Groq(
+                    api_key=api_key,
+                    http_client=http,
+                    timeout=self.timeout,
+                    max_retries=self.max_retries,
+                    **kwargs,
+                )
+            return self._groq[api_key]
+
+    def elevenlabs(self, api_key):
+        http = self.http_client()
+        with self._lock:
+            if api_key not in self._elevenlabs:
+                from elevenlabs.client import ElevenLabs
+                kwargs = {"base_url": self.elevenlabs_base_url} if self.elevenlabs_base_url else {}
+                self._elevenlabs[api_key] = ElevenLabs(
+                    api_key=api_key,
+                    httpx_client=http,
+                    timeout=self.timeout,
+                    **kwargs,
+                )
+            return self._elevenlabs[api_key]
+
+    def warm_up(self):
+        """
+        Open pooled connections to each provider ahead of the first request.
+        Failures are only logged; the app works without a warm pool.
+        """
+        http = self.http_client()
+        targets = [self.groq_base_url or "https://api.groq.com"]
+        targets.append(self.elevenlabs_base_url or "https://api.elevenlabs.io")
+        for url in targets:
+            try:
+                http.head(url, timeout=5.0)
+                print(f"✓ Warmed connection to {url}")
+            except Exception as e:
+                print(f"⚠ Warm-up to {url} failed: {e}")
+
+    def close(self):
+        with self._lock:
+            if self._http is not None:
+                self._http.close()
+            self._http = None
+            self._groq.clear()
+            self._elevenlabs.clear()
+
+
+registry = ClientRegistry.from_env()
@@ -0,0 +1,235 @@
+# Export the respiratory models to TFLite.
+#
+# Each Keras model in the model directory is written next to it as
+# <name>.fp16.tflite (float16 weights) and <name>.int8.tflite (int8 weights and
+# activations, float32 inputs/outputs), which the API serves with
+# RESP_MODEL_FORMAT=fp16|int8. The GRU layers are unrolled before conversion:
+# after the conv stack their sequences are only a few steps long, and unrolled
+# they become plain builtin ops XNNPACK can run instead of a while loop over
+# variables the converter rejects. Int8 ranges are calibrated on overlapping
+# windows of the recordings under test_audios/.
+#
+# Every artifact is checked against the float Keras model on the calibration
+# windows: file size, cold load time, per-batch latency and output drift (top-1
+# agreement and accuracy for classifiers), written to a JSON report.
+#
+#   python export_models.py
+#   python export_models.py --formats int8 --calibration /data/auscultation --batch-size 32
+import argparse
+import contextlib
+import io
+import json
+import os
+import time
+
+import numpy as np
+
+import feature_engine
+from model_registry import FEATURE_INDEX, MODEL_EXTENSIONS, TFLiteModel, describe_model, load_keras_model
+from score_respiratory import APP_DIR, MODEL_BASE_PATH, RESP_LABELS, iter_recordings
+
+
+def calibration_windows(root, max_windows, hop_seconds=1.0):
+    """
+    Features for up to max_windows overlapping windows of the recordings under
+    root. Returns ([mfcc, chroma, mspec] arrays, folder label per window).
+    """
+    batches, labels = [], []
+    for path, label in iter_recordings(root):
+        for spans, features in feature_engine.iter_window_feature_batches(os.path.join(root, path), hop_seconds=hop_seconds):
+            batches.append(features)
+            labels += [label] * len(spans)
+            if len(labels) >= max_windows:
+                break
+        if len(labels) >= max_windows:
+            break
+    if not batches:
+        raise SystemExit(f"✗ No recordings under {root} to calibrate with")
+    features = [np.concatenate([batch[i] for batch in batches])[:max_windows] for i in range(3)]
+    return features, labels[:max_windows]
+
+
+def unrolled(model):
+    """
+    Copy of model with every recurrent layer unrolled, same weights.
+    """
+    import tensorflow as tf
+
+    def clone(layer):
+        config = layer.get_config()
+        if "unroll" in config:
+            config["unroll"] = True
+        return layer.__class__.from_config(config)
+
+    copy = tf.keras.models.clone_model(model, clone_function=clone)
+    copy.set_weights(model.get_weights())
+    return copy
+
+
+def convert(model, feature_names, artifact_format, features):
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(unrolled(model))
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if artifact_format == "fp16":
+        converter.target_spec.supported_types = [tf.float16]
+    else:
+        inputs = [features[FEATURE_INDEX[name]] for name in feature_names]
+
+        def representative_dataset():
+            for i in range(len(inputs[0])):
+                yield [x[i:i + 1] for x in inputs]
+
+        converter.representative_dataset = representative_dataset
+    # The converter prints the traced signature; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        return converter.convert()
+
+
+def time_batches(model, inputs, batch_size, runs):
+    """
+    Median and p95 seconds per predict_on_batch call of batch_size windows.
+    """
+    count = len(inputs[0])
+    batch = [np.resize(x, (batch_size,) + x.shape[1:]) if count < batch_size else x[:batch_size] for x in inputs]
+    model.predict_on_batch(batch if len(batch) > 1 else batch[0])
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        model.predict_on_batch(batch if len(batch) > 1 else batch[0])
+        timings.append(time.perf_counter() - started)
+    return float(np.median(timings)), float(np.percentile(timings, 95))
+
+
+def predict_all(model, inputs, batch_size):
+    outputs = []
+    for start in range(0, len(inputs[0]), batch_size):
+        batch = [x[start:start + batch_size] for x in inputs]
+        outputs.append(np.asarray(model.predict_on_batch(batch if len(batch) > 1 else batch[0])))
+    return np.concatenate(outputs)
+
+
+def drift(reference, candidate, labels):
+    """
+    How far an artifact's outputs are from the float model's.
+    """
+    cosine = np.sum(reference * candidate, axis=1) / (
+        np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1) + 1e-12)
+    report = {
+        "max_abs_error": round(float(np.max(np.abs(reference - candidate))), 6),
+        "mean_cosine_similarity": round(float(np.mean(cosine)), 6),
+    }
+    if reference.shape[1] == len(RESP_LABELS):
+        top_reference, top_candidate = reference.argmax(axis=1), candidate.argmax(axis=1)
+        report["top1_agreement"] = round(float(np.mean(top_reference == top_candidate)), 4)
+        index = {label: i for i, label in enumerate(RESP_LABELS)}
+        known = np.array([label in index for label in labels])
+        if known.any():
+            truth = np.array([index[label] for label, k in zip(labels, known) if k])
+            float_accuracy = float(np.mean(top_reference[known] == truth))
+            report["accuracy_float"] = round(float_accuracy, 4)
+            report["accuracy_delta"] = round(float(np.mean(top_candidate[known] == truth)) - float_accuracy, 4)
+    return report
+
+
+def export_model(path, formats, features, labels, batch_size, runs):
+    name = os.path.splitext(os.path.basename(path))[0]
+    started = time.perf_counter()
+    model = load_keras_model(path)
+    load_seconds = time.perf_counter() - started
+    feature_names, output_dim = describe_model(model)
+    inputs = [features[FEATURE_INDEX[f]] for f in feature_names]
+
+    reference = predict_all(model, inputs, batch_size)
+    p50, p95 = time_batches(model, inputs, batch_size, runs)
+    results = {"keras": {
+        "path": path,
+        "bytes": os.path.getsize(path),
+        "load_seconds": round(load_seconds, 3),
+        "batch_p50_ms": round(p50 * 1000, 2),
+        "batch_p95_ms": round(p95 * 1000, 2),
+    }}
+
+    for artifact_format in formats:
+        artifact = os.path.join(os.path.dirname(path), f"{name}.{artifact_format}.tflite")
+        started = time.perf_counter()
+        with open(artifact, "wb") as f:
+            f.write(convert(model, feature_names, artifact_format, features))
+        convert_seconds = time.perf_counter() - started
+
+        # Cold load: read the file, build the interpreter and run the first batch
+        started = time.perf_counter()
+        exported = TFLiteModel(artifact)
+        exported.predict_on_batch([x[:1] for x in inputs])
+        load_seconds = time.perf_counter() - started
+
+        p50, p95 = time_batches(exported, inputs, batch_size, runs)
+        results[artifact_format] = {
+            "path": artifact,
+            "bytes": os.path.getsize(artifact),
+            "convert_seconds": round(convert_seconds, 3),
+            "load_seconds": round(load_seconds, 3),
+            "batch_p50_ms": round(p50 * 1000, 2),
+            "batch_p95_ms": round(p95 * 1000, 2),
+            **drift(reference, predict_all(exported, inputs, batch_size), labels),
+        }
+    return name, {"inputs": feature_names, "output_dim": output_dim, "artifacts": results}
+
+
+def print_report(name, report):
+    keras = report["artifacts"]["keras"]
+    print(f"\n{name} (inputs: {', '.join(report['inputs'])}, output: {report['output_dim']})")
+    print(f"  {'format':<8}{'size':>10}{'load':>9}{'batch p50':>11}{'p95':>9}   drift")
+    for artifact_format, stats in report["artifacts"].items():
+        size = f"{stats['bytes'] / 1e6:.2f} MB"
+        timing = f"{stats['load_seconds']:>8.2f}s{stats['batch_p50_ms']:>9.1f}ms{stats['batch_p95_ms']:>7.1f}ms"
+        line = f"  {artifact_format:<8}{size:>10}{timing}"
+        if artifact_format != "keras":
+            line += f"   max |Δ| {stats['max_abs_error']:.4f}, cos {stats['mean_cosine_similarity']:.4f}"
+            if "top1_agreement" in stats:
+                line += f", top-1 agree {stats['top1_agreement']:.1%}"
+            if "accuracy_delta" in stats:
+                line += f", accuracy {stats['accuracy_delta']:+.1%}"
+            line += f"  ({keras['bytes'] / stats['bytes']:.1f}x smaller, {keras['batch_p50_ms'] / max(stats['batch_p50_ms'], 1e-6):.1f}x faster)"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the respiratory models to fp16/int8 TFLite and compare them with Keras")
+    parser.add_argument("models", nargs="*", help=".keras files [every model in MODEL_BASE_PATH]")
+    parser.add_argument("--formats", default="fp16,int8", help="comma-separated: fp16, int8")
+    parser.add_argument("--calibration", default=os.path.join(APP_DIR, "test_audios"), help="directory laid out as <Label>/*.wav")
+    parser.add_argument("--calibration-windows", type=int, default=200, help="at most this many 6 s windows")
+    parser.add_argument("--batch-size", type=int, default=16, help="windows per timed batch")
+    parser.add_argument("--runs", type=int, default=20, help="timed batches per format")
+    parser.add_argument("--report", default="export_report.json")
+    args = parser.parse_args()
+
+    formats = [f.strip() for f in args.formats.split(",") if f.strip()]
+    unknown = set(formats) - {"fp16", "int8"}
+    if unknown:
+        parser.error(f"unknown format(s): {', '.join(sorted(unknown))}")
+    paths = args.models or [
+        os.path.join(MODEL_BASE_PATH, name) for name in sorted(os.listdir(MODEL_BASE_PATH)) if name.endswith(MODEL_EXTENSIONS)
+    ]
+
+    # Imported up front so the first model's Keras load time doesn't include it
+    import tensorflow  # noqa: F401
+
+    features, labels = calibration_windows(args.calibration, args.calibration_windows)
+    print(f"Calibrating on {len(labels)} window(s) from {args.calibration}")
+    reports = {}
+    for path in paths:
+        name, report = export_model(path, formats, features, labels, args.batch_size, args.runs)
+        reports[name] = report
+        print_report(name, report)
+
+    with open(args.report, "w") as f:
+        json.dump({"calibration": {"root": args.calibration, "windows": len(labels)}, "batch_size": args.batch_size,
+                   "models": reports}, f, indent=2)
+    print(f"\n✓ Artifacts written next to the models; report in {args.report}")
+    print("  Serve them with RESP_MODEL_FORMAT=fp16 or RESP_MODEL_FORMAT=int8")
+
+
+if __name__ == "__main__":
+    main()
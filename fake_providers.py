@@ -0,0 +1,280 @@
+# Local stand-ins for Groq, ElevenLabs and the translator.
+#
+# One threaded HTTP server answers the handful of routes the app uses, after a
+# configurable delay, so the API can be exercised and benchmarked offline.
+# Point the clients at it with GROQ_BASE_URL / ELEVENLABS_BASE_URL and install
+# FakeProviders.translator_factory on the translation service. fail_next()
+# scripts error responses for testing retries.
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+DEFAULT_LATENCY = {"stt": 0.3, "llm": 0.8, "tts": 0.4, "translate": 0.1}
+
+FAKE_TRANSCRIPTION = "I have had a dry cough and a mild fever for three days."
+FAKE_REPLY = (
+    "A dry cough with a mild fever most likely points to a viral throat infection. "
+    "Drink plenty of warm fluids and rest your voice. "
+    "Paracetamol can help with the fever. "
+    "If you notice breathlessness or the fever lasts beyond three days, please see a doctor in person."
+)
+FAKE_VOICE_ID = "fakevoice0000000000a"
+
+# One silent 32 kbps / 22.05 kHz MPEG-2 layer III frame; replies are a run of these
+MP3_FRAME = b"\xff\xf3\x44\xc4" + b"\x00" * 140
+# Roughly how many frames a second of speech takes at that bitrate
+FRAMES_PER_SECOND = 38
+CHARS_PER_SECOND = 15
+
+TTS_ROUTE = re.compile(r"^/v1/text-to-speech/([^/?]+)(/stream)?")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _delay(self, kind):
+        self.server.providers.wait(kind)
+
+    def setup(self):
+        super().setup()
+        self.server.providers.count("connections")
+
+    def _send(self, status, body, content_type="application/json", headers=None):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _send_chunks(self, chunks, content_type, interval=0.0):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, chunk in enumerate(chunks):
+            if i and interval:
+                time.sleep(interval)
+            self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _scripted_failure(self, path):
+        status = self.server.providers.take_failure(path)
+        if status is None:
+            return False
+        # The SDKs honour retry-after-ms, which keeps retry tests fast
+        self._send(status, {"error": {"message": f"scripted {status}"}}, headers={"retry-after-ms": "10"})
+        return True
+
+    def do_HEAD(self):
+        self.server.providers.count("HEAD")
+        self._send(200, b"", "text/plain")
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        self.server.providers.count(path)
+        if self._scripted_failure(path):
+            return
+        if path == "/v1/voices":
+            self._send(200, {"voices": [{"voice_id": FAKE_VOICE_ID, "name": "Aria", "category": "premade"}]})
+        else:
+            self._send(200, b"ok", "text/plain")
+
+    def do_POST(self):
+        body = self._body()
+        path = self.path.split("?")[0]
+        self.server.providers.count(path)
+        if self._scripted_failure(path):
+            return
+        if path == "/openai/v1/audio/transcriptions":
+            self._delay("stt")
+            self._send(200, {"text": FAKE_TRANSCRIPTION})
+        elif path == "/openai/v1/chat/completions":
+            self._chat(json.loads(body or b"{}"))
+        elif TTS_ROUTE.match(path):
+            text = json.loads(body or b"{}").get("text", "")
+            self._delay("tts")
+            frames = max(1, len(text) * FRAMES_PER_SECOND // CHARS_PER_SECOND)
+            self._send(200, MP3_FRAME * frames, "audio/mpeg")
+        elif path == "/translate":
+            self._delay("translate")
+            self._send(200, {"translatedText": json.loads(body or b"{}").get("q", "")})
+        else:
+            self.server.providers.count("unmatched")
+            self._send(404, {"error": f"no fake for {path}"})
+
+    def _chat(self, payload):
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        model = payload.get("model", "fake")
+        if not payload.get("stream"):
+            self._delay("llm")
+            self._send(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": FAKE_REPLY}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 100, "completion_tokens": 60, "total_tokens": 160},
+            })
+            return
+
+        # Streaming: the configured latency is split between time to first
+        # token and the gaps between the remaining word-sized chunks
+        words = FAKE_REPLY.split(" ")
+        total = self.server.providers.latency_for("llm")
+        time.sleep(total / 2)
+        interval = total / 2 / max(len(words) - 1, 1)
+
+        def event(delta, finish_reason=None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            return f"data: {json.dumps(chunk)}\n\n".encode()
+
+        chunks = [event({"role": "assistant", "content": words[0]})]
+        chunks += [event({"content": f" {word}"}) for word in words[1:]]
+        chunks.append(event({}, "stop"))
+        chunks.append(b"data: [DONE]\n\n")
+        self._send_chunks(chunks, "text/event-stream", interval)
+
+
+class FakeTranslator:
+    """
+    Drop-in for deep-translator's GoogleTranslator that calls the fake server.
+    Returns the text unchanged.
+    """
+
+    def __init__(self, client, base_url, lang_code):
+        self.client = client
+        self.base_url = base_url
+        self.lang_code = lang_code
+
+    def translate(self, text):
+        response = self.client.post(f"{self.base_url}/translate", json={"q": text, "target": self.lang_code})
+        response.raise_for_status()
+        return response.json()["translatedText"]
+
+
+class FakeProviders:
+    def __init__(self, latency=None, jitter=0.1, host="127.0.0.1", port=0):
+        """
+        latency maps stt/llm/tts/translate to seconds; jitter is the relative
+        +/- spread applied to each delay.
+        """
+        self.latency = dict(DEFAULT_LATENCY, **(latency or {}))
+        self.jitter = jitter
+        self.counts = {}
+        self._failures = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.providers = self
+        self._thread = None
+        self._http = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def latency_for(self, kind):
+        base = self.latency.get(kind, 0.0)
+        return max(0.0, base * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    def wait(self, kind):
+        time.sleep(self.latency_for(kind))
+
+    def count(self, route):
+        with self._lock:
+            self.counts[route] = self.counts.get(route, 0) + 1
+
+    def fail_next(self, route, times=1, status=503):
+        """
+        Answer the next `times` requests to route with status instead.
+        """
+        with self._lock:
+            self._failures[route] = [status] * times
+
+    def take_failure(self, route):
+        with self._lock:
+            pending = self._failures.get(route)
+            return pending.pop() if pending else None
+
+    def translator_factory(self, lang_code):
+        with self._lock:
+            if self._http is None:
+                self._http = httpx.Client(timeout=30.0)
+        return FakeTranslator(self._http, self.base_url, lang_code)
+
+    def env(self):
+        """
+        Environment variables that route the app's provider clients here.
+        """
+        return {
+            "GROQ_BASE_URL": self.base_url,
+            "ELEVENLABS_BASE_URL": self.base_url,
+            "GROQ_API_KEY": "fake-groq-key",
+            "ELEVENLABS_API_KEY": "fake-elevenlabs-key",
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-providers", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._http is not None:
+            self._http.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the fake Groq/ElevenLabs/translator server")
+    parser.add_argument("--port", type=int, default=8100)
+    for kind, seconds in DEFAULT_LATENCY.items():
+        parser.add_argument(f"--{kind}-latency", type=float, default=seconds, help="seconds")
+    args = parser.parse_args()
+
+    latency = {kind: getattr(args, f"{kind}_latency") for kind in DEFAULT_LATENCY}
+    providers = FakeProviders(latency=latency, port=args.port)
+    print(f"Fake providers listening on {providers.base_url} ✅")
+    for name, value in providers.env().items():
+        print(f"  export {name}={value}")
+    providers.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        providers.stop()
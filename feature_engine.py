@@ -0,0 +1,278 @@
+# Shared-STFT feature engine for respiratory sound analysis.
+#
+# The respiratory model takes three inputs per clip: 20 MFCCs, 12 chroma bins
+# and a 128-band log-mel spectrogram, each padded/cropped to 259 frames.
+# Calling librosa.feature.mfcc / chroma_stft / melspectrogram separately runs
+# three STFTs per clip. Here we compute one power spectrogram and derive all
+# three features from it with cached filterbanks and DCT matrices.
+#
+# librosa is imported where it is used: it pulls in numba and scipy and takes
+# seconds to load, which processes that only import this module for its
+# constants (the API when inference runs in worker processes) shouldn't pay.
+import os
+from functools import lru_cache
+
+import numpy as np
+import soundfile as sf
+
+N_FFT = 2048
+HOP_LENGTH = 512
+N_MFCC = 20
+N_CHROMA = 12
+N_MELS = 128
+N_FRAMES = 259
+CLIP_SECONDS = 6.0
+
+# Default hop between overlapping windows in windowed (long recording) analysis
+WINDOW_HOP_SECONDS = 3.0
+WINDOW_BATCH_SIZE = 16
+
+# Bump whenever feature computation changes so cached features are not reused
+FEATURE_VERSION = f"shared-stft-1:{N_FFT}:{HOP_LENGTH}:{N_MFCC}:{N_CHROMA}:{N_MELS}:{N_FRAMES}:{CLIP_SECONDS}"
+
+
+@lru_cache(maxsize=8)
+def mel_basis(sr):
+    import librosa
+    return librosa.filters.mel(sr=sr, n_fft=N_FFT, n_mels=N_MELS).astype(np.float32)
+
+
+@lru_cache(maxsize=64)
+def chroma_basis(sr, tuning):
+    import librosa
+    return librosa.filters.chroma(sr=sr, n_fft=N_FFT, n_chroma=N_CHROMA, tuning=tuning).astype(np.float32)
+
+
+@lru_cache(maxsize=1)
+def dct_matrix():
+    """
+    Orthonormal DCT-II matrix, matching scipy.fftpack.dct(norm='ortho')
+    as used by librosa.feature.mfcc, truncated to N_MFCC rows.
+    """
+    n = np.arange(N_MELS)
+    k = np.arange(N_MFCC)[:, None]
+    basis = np.cos(np.pi / N_MELS * (n + 0.5) * k) * np.sqrt(2.0 / N_MELS)
+    basis[0] /= np.sqrt(2.0)
+    return basis.astype(np.float32)
+
+
+def power_spectrogram(y):
+    import librosa
+    return np.abs(librosa.stft(y, n_fft=N_FFT, hop_length=HOP_LENGTH)) ** 2
+
+
+def features_from_power(S, sr):
+    """
+    Derive (mfcc, chroma, log-mel) from one power spectrogram.
+    Matches librosa.feature.mfcc, chroma_stft and power_to_db(melspectrogram, ref=np.max).
+    """
+    import librosa
+
+    mel = mel_basis(sr) @ S
+    mel_db = librosa.power_to_db(mel)
+    mfcc = dct_matrix() @ mel_db
+
+    # chroma_stft estimates tuning from the spectrogram it is given
+    tuning = float(librosa.estimate_tuning(S=S, sr=sr, bins_per_octave=N_CHROMA))
+    chroma = librosa.util.normalize(chroma_basis(sr, round(tuning, 2)) @ S, norm=np.inf, axis=0)
+
+    mspec = librosa.power_to_db(mel, ref=np.max)
+
+    return mfcc.astype(np.float32), chroma.astype(np.float32), mspec.astype(np.float32)
+
+
+def compute_features(y, sr):
+    return features_from_power(power_spectrogram(y), sr)
+
+
+def fit_frames(mats, n_frames=N_FRAMES):
+    """
+    Pad with zeros or crop a list of (bins, frames) matrices to n_frames
+    and stack them into one float32 (N, bins, n_frames, 1) batch.
+    """
+    out = np.zeros((len(mats), mats[0].shape[0], n_frames, 1), dtype=np.float32)
+    for i, m in enumerate(mats):
+        width = min(m.shape[1], n_frames)
+        out[i, :, :width, 0] = m[:, :width]
+    return out
+
+
+def extract_feature_batch(clips):
+    """
+    clips: list of (y, sr) tuples.
+    Returns (mfccs, chroma, mspec) batches shaped (N, 20, 259, 1), (N, 12, 259, 1), (N, 128, 259, 1).
+    """
+    feats = [compute_features(y, sr) for y, sr in clips]
+    return tuple(fit_frames([f[i] for f in feats]) for i in range(3))
+
+
+def load_clip(audio_path, sr=None, duration=CLIP_SECONDS):
+    import librosa
+    return librosa.load(audio_path, sr=sr, duration=duration)
+
+
+def extract_features(audio_path, sr=None, duration=CLIP_SECONDS):
+    y, sr = load_clip(audio_path, sr=sr, duration=duration)
+    return extract_feature_batch([(y, sr)])
+
+
+class StreamingFeatureExtractor:
+    """
+    Incremental features for a live PCM stream.
+    Each incoming chunk only adds its new STFT frames to a fixed-size ring of
+    power frames covering the last window_seconds, so per-stream memory is
+    constant and nothing is recomputed over the whole window. Frames are not
+    centre-padded like librosa's, so the first/last frame of a window differ
+    slightly from batch extraction.
+    """
+
+    def __init__(self, sr, window_seconds=CLIP_SECONDS, hop_seconds=1.0):
+        window_samples, self.hop_samples = _window_sizes(sr, window_seconds, hop_seconds)
+        self.sr = sr
+        self.n_frames = 1 + window_samples // HOP_LENGTH
+        # Periodic Hann window, as librosa.stft uses; no librosa import needed
+        # to stream, so API processes can run the STFT without it
+        self._window = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(N_FFT) / N_FFT)).astype(np.float32)
+        self._ring = np.zeros((1 + N_FFT // 2, self.n_frames), dtype=np.float32)
+        self._pos = 0
+        self._filled = 0
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._since_emit = 0
+        self.samples_seen = 0
+
+    def push(self, samples):
+        self.samples_seen += len(samples)
+        self._since_emit += len(samples)
+        pending = np.concatenate([self._pending, samples.astype(np.float32, copy=False)])
+        if len(pending) >= N_FFT:
+            count = 1 + (len(pending) - N_FFT) // HOP_LENGTH
+            frames = np.lib.stride_tricks.sliding_window_view(pending, N_FFT)[::HOP_LENGTH][:count]
+            power = (np.abs(np.fft.rfft(frames * self._window, axis=1)) ** 2).astype(np.float32)
+            for column in power[-self.n_frames:]:
+                self._ring[:, self._pos] = column
+                self._pos = (self._pos + 1) % self.n_frames
+            self._filled = min(self._filled + count, self.n_frames)
+            pending = pending[count * HOP_LENGTH:]
+        self._pending = pending
+
+    @property
+    def current_time(self):
+        return self.samples_seen / self.sr
+
+    def prediction_due(self):
+        return self._filled == self.n_frames and self._since_emit >= self.hop_samples
+
+    def snapshot(self):
+        """
+        Copy of the window's power spectrogram in time order; resets the hop timer.
+        """
+        self._since_emit = 0
+        return np.roll(self._ring, -self._pos, axis=1)
+
+    def features(self, S):
+        return tuple(fit_frames([f]) for f in features_from_power(S, self.sr))
+
+
+def can_stream(source):
+    """
+    True if libsndfile can decode the source incrementally (wav, flac, ogg...).
+    """
+    try:
+        sf.info(source)
+        return True
+    except Exception:
+        return False
+    finally:
+        if hasattr(source, "seek"):
+            source.seek(0)
+
+
+def _window_sizes(sr, window_seconds, hop_seconds):
+    if not 0 < hop_seconds <= window_seconds:
+        raise ValueError("hop_seconds must be in (0, window_seconds]")
+    return int(round(window_seconds * sr)), max(int(round(hop_seconds * sr)), 1)
+
+
+def _tail_window(buffer, start, window, hop):
+    # Yield the leftover samples only if the previous window didn't cover them
+    # (or if the whole recording is shorter than one window)
+    if len(buffer) > 0 and (start == 0 or len(buffer) > window - hop):
+        return buffer
+    return None
+
+
+def _audioread_blocks(decoder, channels, bytes_per_frame=2):
+    # audioread hands back raw 16-bit PCM in arbitrary chunk sizes; keep any
+    # partial frame for the next chunk
+    remainder = b""
+    frame_bytes = bytes_per_frame * channels
+    for chunk in decoder:
+        chunk = remainder + chunk
+        usable = len(chunk) - len(chunk) % frame_bytes
+        remainder = chunk[usable:]
+        pcm = np.frombuffer(chunk[:usable], dtype="<i2").astype(np.float32) / 32768.0
+        yield pcm.reshape(-1, channels).mean(axis=1)
+
+
+def _windows_from_blocks(blocks, sr, window_seconds, hop_seconds):
+    window, hop = _window_sizes(sr, window_seconds, hop_seconds)
+    buffer = np.zeros(0, dtype=np.float32)
+    pending, pending_samples = [], 0
+    start = 0
+    for block in blocks:
+        # Decoder blocks can be much smaller than a hop; only concatenate once
+        # there is a window's worth of samples
+        pending.append(block)
+        pending_samples += len(block)
+        if len(buffer) + pending_samples < window:
+            continue
+        buffer = np.concatenate([buffer] + pending)
+        pending, pending_samples = [], 0
+        while len(buffer) >= window:
+            yield start / sr, buffer[:window], sr
+            buffer = buffer[hop:]
+            start += hop
+    buffer = np.concatenate([buffer] + pending)
+    tail = _tail_window(buffer, start, window, hop)
+    if tail is not None:
+        yield start / sr, tail, sr
+
+
+def iter_audio_windows(source, window_seconds=CLIP_SECONDS, hop_seconds=WINDOW_HOP_SECONDS):
+    """
+    Yield (start_seconds, y, sr) for overlapping mono windows of a recording.
+    The recording is decoded block by block, so memory stays at about one
+    window no matter how long it is: with libsndfile for the formats it reads
+    (wav, flac, ogg...), otherwise with audioread (ffmpeg and friends) from a
+    file path. Only file-like sources libsndfile can't read are decoded fully.
+    """
+    if can_stream(source):
+        with sf.SoundFile(source) as f:
+            blocks = (block.mean(axis=1) for block in f.blocks(blocksize=8192, dtype="float32", always_2d=True))
+            yield from _windows_from_blocks(blocks, f.samplerate, window_seconds, hop_seconds)
+    elif isinstance(source, (str, os.PathLike)):
+        import audioread
+
+        with audioread.audio_open(os.fspath(source)) as f:
+            yield from _windows_from_blocks(_audioread_blocks(f, f.channels), f.samplerate, window_seconds, hop_seconds)
+    else:
+        import librosa
+
+        y, sr = librosa.load(source, sr=None)
+        yield from _windows_from_blocks([y], sr, window_seconds, hop_seconds)
+
+
+def iter_window_feature_batches(source, window_seconds=CLIP_SECONDS, hop_seconds=WINDOW_HOP_SECONDS, batch_size=WINDOW_BATCH_SIZE):
+    """
+    Group windows into batches and yield (spans, (mfccs, chroma, mspec)),
+    where spans is a list of (start_seconds, end_seconds) per window.
+    """
+    spans, clips = [], []
+    for start, y, sr in iter_audio_windows(source, window_seconds, hop_seconds):
+        spans.append((start, start + len(y) / sr))
+        clips.append((y, sr))
+        if len(clips) == batch_size:
+            yield spans, extract_feature_batch(clips)
+            spans, clips = [], []
+    if clips:
+        yield spans, extract_feature_batch(clips)
@@ -0,0 +1,474 @@
+# Respiratory inference service.
+#
+# Feature extraction and model inference for /predict_respiratory run in a pool
+# of worker processes, each holding its own ModelRegistry (TensorFlow, the
+# models, the librosa filterbanks). API processes started with INFERENCE_SOCKET
+# load none of that and reach the service over a Unix socket instead, so
+# uvicorn workers for the I/O-bound /chat path scale independently of the
+# CPU-heavy model workers.
+#
+# Only small JSON control messages cross the socket. Audio bytes and feature
+# and probability arrays travel in POSIX shared memory segments: the sender
+# writes one segment per message and passes its name and array layout, the
+# receiver copies the arrays out, and whoever receives a segment last unlinks
+# it. Segments are named speechbot_* in /dev/shm.
+#
+#   python inference_workers.py --workers 2
+#   INFERENCE_SOCKET=/tmp/speechbot-inference.sock uvicorn api:app --workers 4
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import secrets
+import signal
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+DEFAULT_SOCKET = os.environ.get("INFERENCE_SOCKET") or "/tmp/speechbot-inference.sock"
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", "2"))
+INFERENCE_TIMEOUT = float(os.environ.get("INFERENCE_TIMEOUT", "30"))
+# Workers check their model files and report their status this often
+MODEL_RELOAD_INTERVAL = float(os.environ.get("MODEL_RELOAD_INTERVAL", "5"))
+SEGMENT_PREFIX = "speechbot_"
+HEADER = struct.Struct("!I")
+
+
+class InferenceError(Exception):
+    pass
+
+
+# Framing: a 4-byte big-endian length, then a JSON object
+
+def send_message(sock, message):
+    body = json.dumps(message).encode()
+    sock.sendall(HEADER.pack(len(body)) + body)
+
+
+def _recv_exact(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("inference service closed the connection")
+        data += chunk
+    return bytes(data)
+
+
+def recv_message(sock):
+    (size,) = HEADER.unpack(_recv_exact(sock, HEADER.size))
+    return json.loads(_recv_exact(sock, size))
+
+
+async def _read_message(reader):
+    (size,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+    return json.loads(await reader.readexactly(size))
+
+
+def _write_message(writer, message):
+    body = json.dumps(message).encode()
+    writer.write(HEADER.pack(len(body)) + body)
+
+
+def _untrack(shm):
+    # The segment is unlinked by another process; stop this one's resource
+    # tracker from unlinking it (or warning about a leak) at exit
+    resource_tracker.unregister(shm._name, "shared_memory")
+
+
+def write_arrays(arrays):
+    """
+    Copy arrays into one new shared memory segment.
+    Returns (segment, descriptor to send to the peer).
+    """
+    arrays = [np.ascontiguousarray(a) for a in arrays]
+    layout, offset = [], 0
+    for a in arrays:
+        layout.append({"dtype": a.dtype.str, "shape": list(a.shape), "offset": offset})
+        offset += a.nbytes
+    shm = SharedMemory(name=f"{SEGMENT_PREFIX}{secrets.token_hex(8)}", create=True, size=max(offset, 1))
+    for a, entry in zip(arrays, layout):
+        np.ndarray(a.shape, a.dtype, buffer=shm.buf, offset=entry["offset"])[...] = a
+    return shm, {"name": shm.name, "arrays": layout}
+
+
+def read_arrays(descriptor, unlink):
+    """
+    Copy the arrays out of a peer's segment; unlink it if this side owns it.
+    """
+    shm = SharedMemory(name=descriptor["name"])
+    try:
+        return [
+            np.ndarray(entry["shape"], np.dtype(entry["dtype"]), buffer=shm.buf, offset=entry["offset"]).copy()
+            for entry in descriptor["arrays"]
+        ]
+    finally:
+        shm.close()
+        if unlink:
+            shm.unlink()
+        else:
+            _untrack(shm)
+
+
+def discard_segment(descriptor):
+    try:
+        shm = SharedMemory(name=descriptor["name"])
+        shm.close()
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+# Worker processes
+
+_registry = None
+
+
+def _report_status(status_queue, interval):
+    while True:
+        status_queue.put((os.getpid(), _registry.stats()))
+        if interval <= 0:
+            return
+        time.sleep(interval)
+
+
+def _init_worker(status_queue=None):
+    global _registry
+    import feature_engine
+    from model_registry import ModelRegistry, parse_weights
+    from score_respiratory import MODEL_BASE_PATH, RESP_LABELS
+
+    _registry = ModelRegistry(
+        MODEL_BASE_PATH,
+        RESP_LABELS,
+        weights=parse_weights(os.environ.get("RESP_MODEL_WEIGHTS")),
+        warmup=os.environ.get("MODEL_WARMUP", "1") == "1",
+        artifact_format=os.environ.get("RESP_MODEL_FORMAT", "keras"),
+    )
+    _registry.reload()
+    _registry.start_watching(MODEL_RELOAD_INTERVAL)
+    if status_queue is not None:
+        threading.Thread(target=_report_status, args=(status_queue, MODEL_RELOAD_INTERVAL), name="status-report", daemon=True).start()
+    # Filterbanks and FFT plans, as in api.warm_feature_engine
+    sr = 22050
+    tone = 0.01 * np.sin(2 * np.pi * 440.0 * np.arange(sr) / sr).astype(np.float32)
+    feature_engine.extract_feature_batch([(tone, sr)])
+
+
+def _analyze_windows(data, filename, hop_seconds):
+    import upload_audio
+
+    predict = _registry.ready()
+    spans, probs = [], []
+    with upload_audio.streamable_audio(data, filename) as source:
+        for batch_spans, features in upload_audio.iter_window_feature_batches(source, filename, hop_seconds):
+            spans += batch_spans
+            if predict:
+                probs.append(_registry.predict_on_batch(list(features)))
+    outputs = [np.asarray(spans, dtype=np.float64).reshape(-1, 2)]
+    if probs:
+        outputs.append(np.concatenate(probs))
+    return outputs
+
+
+def _run_job(request):
+    """
+    Runs in a worker process. Returns the response message; output arrays are
+    left in a new segment for the API process to read and unlink.
+    """
+    import upload_audio
+
+    op = request["op"]
+    try:
+        if op == "status":
+            # Only this worker's view; clients get InferenceServer.status()
+            return {"status": _registry.stats()}
+        inputs = read_arrays(request["input"], unlink=False) if request.get("input") else []
+        if op == "features":
+            outputs = upload_audio.extract_features(inputs[0].tobytes(), request.get("filename"))
+            if outputs[0] is None:
+                return {"error": "could not decode audio"}
+        elif op == "predict":
+            outputs = [_registry.predict_on_batch(inputs)]
+        elif op == "power_features":
+            import feature_engine
+            outputs = [feature_engine.fit_frames([f]) for f in feature_engine.features_from_power(inputs[0], request["sr"])]
+        elif op == "windows":
+            outputs = _analyze_windows(inputs[0].tobytes(), request.get("filename"), request["hop_seconds"])
+        else:
+            return {"error": f"unknown op {op!r}"}
+    except upload_audio.UndecodableAudio as e:
+        return {"error": str(e), "undecodable": True}
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+    shm, descriptor = write_arrays(outputs)
+    _untrack(shm)
+    shm.close()
+    return {"output": descriptor}
+
+
+class InferenceServer:
+    def __init__(self, socket_path=DEFAULT_SOCKET, workers=INFERENCE_WORKERS, status_interval=MODEL_RELOAD_INTERVAL):
+        self.socket_path = socket_path
+        self.workers = workers
+        # Every worker reports its model status here; a status request could
+        # land on any one of them, and during a reload they disagree
+        self._status_queue = multiprocessing.get_context("spawn").Queue()
+        self._status_ttl = 3 * status_interval if status_interval > 0 else None
+        self._worker_status = {}
+        self._agreed_status = None
+        self._status_lock = threading.Lock()
+        self._pool = self._new_pool()
+
+    def _new_pool(self):
+        # Spawned, so workers never inherit a half-initialized TensorFlow
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self._status_queue,),
+        )
+
+    def _collect_status(self):
+        while True:
+            pid, status = self._status_queue.get()
+            self.record_status(pid, status)
+
+    def record_status(self, pid, status, seen=None):
+        with self._status_lock:
+            self._worker_status[pid] = (time.monotonic() if seen is None else seen, status)
+
+    def status(self):
+        """
+        The workers' common model status. While a reload has reached only some
+        workers, the last status they all agreed on is reported (with
+        "reloading": true), so the version clients key caches on changes once.
+        """
+        now = time.monotonic()
+        with self._status_lock:
+            if self._status_ttl is not None:
+                # Workers replaced after a crash stop reporting
+                for pid in [pid for pid, (seen, _) in self._worker_status.items() if now - seen > self._status_ttl]:
+                    del self._worker_status[pid]
+            statuses = [status for _, status in self._worker_status.values()]
+            mixed = len({status.get("version") for status in statuses}) > 1
+            if statuses and not mixed:
+                self._agreed_status = statuses[0]
+            agreed = self._agreed_status
+        if agreed is None:
+            agreed = {"ready": False, "version": "none", "models": {}, "errors": {"inference_service": "workers not ready"}}
+        return dict(agreed, workers=len(statuses), reloading=mixed)
+
+    async def _dispatch(self, request):
+        pool = self._pool
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, _run_job, request)
+        except BrokenProcessPool:
+            if self._pool is pool:
+                print("⚠ An inference worker died; restarting the pool")
+                self._pool = self._new_pool()
+            return {"error": "inference worker crashed"}
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request = await _read_message(reader)
+                if request.get("op") == "status":
+                    response = {"status": self.status()}
+                else:
+                    response = await self._dispatch(request)
+                try:
+                    _write_message(writer, response)
+                    await writer.drain()
+                except ConnectionError:
+                    # Nobody left to read (and unlink) the output
+                    if "output" in response:
+                        discard_segment(response["output"])
+                    raise
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        threading.Thread(target=self._collect_status, name="status-collect", daemon=True).start()
+        # One status job per worker starts them all and waits for their models
+        statuses = await asyncio.gather(*(self._dispatch({"op": "status"}) for _ in range(self.workers)))
+        status = statuses[0].get("status", {})
+        print(f"Inference workers ready ✅ ({self.workers} process(es), ensemble: {', '.join(status.get('ensemble', [])) or 'none'})")
+        server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        # SIGTERM (e.g. from a process manager) shuts down like Ctrl+C
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        print(f"Inference service listening on {self.socket_path}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+
+class InferenceClient:
+    """
+    ModelRegistry stand-in for API processes: the same ready()/version/stats()/
+    predict_on_batch() surface, backed by the inference service. ready(),
+    version and stats() come from the last status poll (start_watching).
+    Safe to call from many threads; each thread keeps its own connection.
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET, timeout=INFERENCE_TIMEOUT):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._sockets = set()
+        self._lock = threading.Lock()
+        self._status = {"ready": False, "version": "none", "models": {}, "errors": {}}
+        self._watcher = None
+        self._stop = threading.Event()
+
+    def _connection(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.socket_path)
+            except OSError:
+                sock.close()
+                raise
+            self._local.sock = sock
+            with self._lock:
+                self._sockets.add(sock)
+        return sock
+
+    def _drop_connection(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            self._local.sock = None
+            with self._lock:
+                self._sockets.discard(sock)
+            sock.close()
+
+    def call(self, op, arrays=(), **params):
+        """
+        One round trip. Returns (response message, output arrays).
+        """
+        request = dict(params, op=op)
+        shm = None
+        if arrays:
+            shm, request["input"] = write_arrays(arrays)
+        try:
+            sock = self._connection()
+            try:
+                send_message(sock, request)
+                response = recv_message(sock)
+            except (OSError, ValueError):
+                # A reply cut short would desynchronize the stream; reconnect next time
+                self._drop_connection()
+                raise
+        finally:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+        if "error" in response:
+            if response.get("undecodable"):
+                from upload_audio import UndecodableAudio
+                raise UndecodableAudio(response["error"])
+            raise InferenceError(response["error"])
+        outputs = read_arrays(response["output"], unlink=True) if "output" in response else []
+        return response, outputs
+
+    def extract_features(self, audio_bytes, filename=None):
+        """
+        Same contract as upload_audio.extract_features.
+        """
+        try:
+            _, outputs = self.call("features", [np.frombuffer(audio_bytes, dtype=np.uint8)], filename=filename)
+            return tuple(outputs)
+        except InferenceError:
+            return None, None, None
+        except OSError as e:
+            print(f"⚠ Inference service unreachable: {e}")
+            return None, None, None
+
+    def predict_on_batch(self, inputs):
+        return self.call("predict", list(inputs))[1][0]
+
+    def features_from_power(self, S, sr):
+        """
+        (mfcc, chroma, mspec) batches of one for a streamed window's power
+        spectrogram (see feature_engine.StreamingFeatureExtractor).
+        """
+        return tuple(self.call("power_features", [S], sr=sr)[1])
+
+    def analyze_windows(self, audio_bytes, filename, hop_seconds):
+        """
+        Returns ([(start, end)...], probabilities per window or None).
+        """
+        _, outputs = self.call("windows", [np.frombuffer(audio_bytes, dtype=np.uint8)], filename=filename, hop_seconds=hop_seconds)
+        spans = [tuple(span) for span in outputs[0].tolist()]
+        return spans, outputs[1] if len(outputs) > 1 else None
+
+    def reload(self):
+        """
+        Refresh the cached status (the workers watch the model files
+        themselves and the service reports the version they all run).
+        Returns True if the model set changed.
+        """
+        previous = self._status.get("version")
+        try:
+            status = self.call("status")[0]["status"]
+        except (OSError, ValueError, InferenceError) as e:
+            status = {"ready": False, "version": "none", "models": {}, "errors": {"inference_service": str(e)}}
+        self._status = status
+        return status.get("version") != previous
+
+    def ready(self):
+        return bool(self._status.get("ready"))
+
+    @property
+    def version(self):
+        return self._status.get("version", "none")
+
+    def stats(self):
+        return dict(self._status, inference_socket=self.socket_path)
+
+    def _watch(self, interval):
+        while not self._stop.wait(interval):
+            self.reload()
+
+    def start_watching(self, interval):
+        if interval <= 0 or self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), name="inference-status", daemon=True)
+        self._watcher.start()
+
+    def close(self):
+        self._stop.set()
+        with self._lock:
+            sockets, self._sockets = self._sockets, set()
+        for sock in sockets:
+            sock.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the respiratory feature extraction/inference worker pool")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET)
+    parser.add_argument("--workers", type=int, default=INFERENCE_WORKERS)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(InferenceServer(args.socket, args.workers).serve())
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
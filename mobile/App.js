@@ -1,10 +1,10 @@
-import React, { useState } from 'react';
+import React, { useState, useRef } from 'react';
 import { StyleSheet, SafeAreaView, View, StatusBar, Platform, Alert, Modal, Text, TouchableOpacity, FlatList } from 'react-native';
 import { Audio } from 'expo-av';
 import { Ionicons } from '@expo/vector-icons';
 import ChatInterface from './components/ChatInterface';
-import InputArea from './components/InputArea';
-import { sendChat, sendRespiration } from './services/api';
+import InputArea, { RESPIRATION_SECONDS } from './components/InputArea';
+import { sendChatStream, sendRespiration, audioUrl } from './services/api';
 
 const LANGUAGES = [
   { id: 'en', name: 'English' },
@@ -30,12 +30,17 @@ export default function App() {
   const [isLoading, setIsLoading] = useState(false);
   const [language, setLanguage] = useState('English');
   const [modalVisible, setModalVisible] = useState(false);
+  // Streamed reply audio arrives sentence by sentence; play it back in order
+  const audioQueue = useRef([]);
+  const isPlaying = useRef(false);
+  // Server-side conversation session; set from the first reply
+  const sessionId = useRef(null);
 
-  const handleSend = async ({ text, audioUri, imageUri, type }) => {
+  const handleSend = async ({ text, audioUri, imageUri, type, result: liveResult }) => {
     // Add user message immediately
     const userMessage = {
       id: Date.now().toString(),
-      text: text || (type === 'respiration' ? '🫁 Respiration Recording (6s)' : audioUri ? '🎤 Audio Message' : '📷 Image Message'),
+      text: text || (type === 'respiration_live' ? '🫁 Live Respiration Monitoring' : type === 'respiration' ? `🫁 Respiration Recording (${RESPIRATION_SECONDS}s)` : audioUri ? '🎤 Audio Message' : '📷 Image Message'),
       sender: 'user',
       imageUri: imageUri,
     };
@@ -46,8 +51,12 @@ export default function App() {
     try {
       let botResponse;
       
-      if (type === 'respiration') {
-        const result = await sendRespiration(audioUri);
+      if (type === 'respiration_live' && !liveResult?.prediction) {
+        botResponse = { response: 'I could not get a respiratory reading from the live stream. Please try again for at least 6 seconds.' };
+      } else if (type === 'respiration' || type === 'respiration_live') {
+        const result = type === 'respiration_live'
+          ? { prediction: liveResult.prediction, confidence: liveResult.confidence, all_predictions: liveResult.probabilities }
+          : await sendRespiration(audioUri);
         const top3 = Object.entries(result.all_predictions)
           .sort(([,a], [,b]) => b - a)
           .slice(0, 3)
@@ -58,15 +67,18 @@ export default function App() {
           response: `**Respiratory Analysis Results:**\n\nPrimary Diagnosis: **${result.prediction}**\nConfidence: **${(result.confidence * 100).toFixed(2)}%**\n\n**Top Probabilities:**\n${top3}\n\nI have added this to our conversation. How are you feeling overall?`
         };
       } else {
-        // Prepare history for backend
-        const history = messages
-          .filter(msg => msg.id !== 'welcome')
-          .map(msg => ({
-            role: msg.sender === 'user' ? 'user' : 'assistant',
-            content: msg.text
-          }));
-
-        botResponse = await sendChat(text, audioUri, imageUri, history, language);
+        // Show the reply as tokens arrive and queue audio as each sentence is synthesized
+        const botId = (Date.now() + 1).toString();
+        setMessages(prev => [...prev, { id: botId, text: '', sender: 'bot' }]);
+        const updateBot = (update) => setMessages(prev => prev.map(msg => msg.id === botId ? update(msg) : msg));
+
+        const result = await sendChatStream(text, audioUri, imageUri, [], language, {
+          onToken: (delta) => updateBot(msg => ({ ...msg, text: msg.text + delta })),
+          onAudio: (index, audioPath) => enqueueAudio(audioUrl(audioPath)),
+        }, sessionId.current);
+        sessionId.current = result.session_id;
+        updateBot(msg => ({ ...msg, text: result.response }));
+        return;
       }
 
       // Add bot response
@@ -78,8 +90,8 @@ export default function App() {
       setMessages(prev => [...prev, botMessage]);
 
       // Play audio if available
-      if (botResponse.audio_base64) {
-        playAudio(botResponse.audio_base64);
+      if (botResponse.audio_url) {
+        playAudio(audioUrl(botResponse.audio_url));
       }
 
     } catch (error) {
@@ -90,14 +102,36 @@ export default function App() {
     }
   };
 
-  const playAudio = async (base64Audio) => {
+  const playAudio = async (uri, onFinish) => {
     try {
       const soundObject = new Audio.Sound();
-      await soundObject.loadAsync({ uri: `data:audio/mp3;base64,${base64Audio}` });
+      soundObject.setOnPlaybackStatusUpdate(status => {
+        if (status.didJustFinish) {
+          soundObject.unloadAsync();
+          onFinish?.();
+        }
+      });
+      await soundObject.loadAsync({ uri });
       await soundObject.playAsync();
     } catch (error) {
       console.error("Failed to play audio", error);
+      onFinish?.();
+    }
+  };
+
+  const playNextAudio = () => {
+    const next = audioQueue.current.shift();
+    if (!next) {
+      isPlaying.current = false;
+      return;
     }
+    isPlaying.current = true;
+    playAudio(next, playNextAudio);
+  };
+
+  const enqueueAudio = (uri) => {
+    audioQueue.current.push(uri);
+    if (!isPlaying.current) playNextAudio();
   };
 
   const renderLanguageItem = ({ item }) => (
@@ -1,8 +1,12 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { View, TextInput, TouchableOpacity, StyleSheet, ActivityIndicator, Text, Image, Alert } from 'react-native';
 import { Ionicons, MaterialIcons, MaterialCommunityIcons } from '@expo/vector-icons';
 import { Audio } from 'expo-av';
 import * as ImagePicker from 'expo-image-picker';
+import { canMonitorRespiration, startRespirationMonitor } from '../services/respiratoryMonitor';
+
+// Longer recordings are analyzed server-side in overlapping 6-second windows
+export const RESPIRATION_SECONDS = 20;
 
 const InputArea = ({ onSend, isLoading }) => {
     const [text, setText] = useState('');
@@ -10,6 +14,9 @@ const InputArea = ({ onSend, isLoading }) => {
     const [isRecording, setIsRecording] = useState(false);
     const [isRespirationRecording, setIsRespirationRecording] = useState(false);
     const [selectedImage, setSelectedImage] = useState(null);
+    const [liveUpdate, setLiveUpdate] = useState(null);
+    const stopMonitor = useRef(null);
+    const lastUpdate = useRef(null);
 
     useEffect(() => {
         (async () => {
@@ -45,7 +52,36 @@ const InputArea = ({ onSend, isLoading }) => {
         onSend({ audioUri: uri });
     };
 
+    const toggleRespirationMonitor = async () => {
+        if (stopMonitor.current) {
+            stopMonitor.current();
+            stopMonitor.current = null;
+            setIsRespirationRecording(false);
+            setLiveUpdate(null);
+            onSend({ type: 'respiration_live', result: lastUpdate.current });
+            return;
+        }
+        try {
+            lastUpdate.current = null;
+            stopMonitor.current = await startRespirationMonitor({
+                onUpdate: (update) => {
+                    lastUpdate.current = update;
+                    setLiveUpdate(update);
+                },
+                onError: (err) => console.error('Respiration monitor error', err),
+            });
+            setIsRespirationRecording(true);
+        } catch (err) {
+            console.error('Failed to start respiration monitor', err);
+            stopMonitor.current = null;
+            setIsRespirationRecording(false);
+        }
+    };
+
     const startRespirationRecording = async () => {
+        if (canMonitorRespiration) {
+            return toggleRespirationMonitor();
+        }
         try {
             await Audio.setAudioModeAsync({
                 allowsRecordingIOS: true,
@@ -58,13 +94,12 @@ const InputArea = ({ onSend, isLoading }) => {
             
             setIsRespirationRecording(true);
             
-            // Record for exactly 6 seconds as required by the model
             setTimeout(async () => {
                 await recording.stopAndUnloadAsync();
                 const uri = recording.getURI();
                 setIsRespirationRecording(false);
                 onSend({ audioUri: uri, type: 'respiration' });
-            }, 6000);
+            }, RESPIRATION_SECONDS * 1000);
 
         } catch (err) {
             console.error('Failed to start respiration recording', err);
@@ -122,7 +157,13 @@ const InputArea = ({ onSend, isLoading }) => {
             {isRespirationRecording && (
                 <View style={styles.respirationOverlay}>
                     <ActivityIndicator color="#4a90e2" />
-                    <Text style={styles.respirationText}>Recording Respiration (6s)... Keep breathing naturally.</Text>
+                    <Text style={styles.respirationText}>
+                        {canMonitorRespiration
+                            ? (liveUpdate?.prediction
+                                ? `Live: ${liveUpdate.prediction} (${(liveUpdate.confidence * 100).toFixed(1)}%) at ${liveUpdate.time.toFixed(0)}s. Tap the lungs to stop.`
+                                : 'Monitoring respiration... first result after 6s. Tap the lungs to stop.')
+                            : `Recording Respiration (${RESPIRATION_SECONDS}s)... Keep breathing naturally.`}
+                    </Text>
                 </View>
             )}
 
@@ -138,7 +179,7 @@ const InputArea = ({ onSend, isLoading }) => {
                 <TouchableOpacity 
                     onPress={startRespirationRecording} 
                     style={styles.iconButton}
-                    disabled={isRespirationRecording || isRecording || isLoading}
+                    disabled={(isRespirationRecording && !canMonitorRespiration) || isRecording || isLoading}
                 >
                     <MaterialCommunityIcons 
                         name="lungs" 
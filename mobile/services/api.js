@@ -6,9 +6,20 @@ import { Platform } from 'react-native';
 // const BASE_URL = Platform.OS === 'android' ? 'http://10.0.2.2:8000' : 'http://localhost:8000';
 const BASE_URL = 'http://10.134.249.249:8000'; // Using local IP for broader compatibility
 
-export const sendChat = async (text, audioUri, imageUri, history = [], language = 'English') => {
+// Reply audio is returned as a server path (e.g. /audio/<id>); resolve it against BASE_URL
+export const audioUrl = (path) => `${BASE_URL}${path}`;
+
+export const respirationSocketUrl = (sampleRate, hopSeconds) =>
+    `${BASE_URL.replace(/^http/, 'ws')}/ws/respiratory?sample_rate=${sampleRate}&hop_seconds=${hopSeconds}`;
+
+const buildChatForm = async (text, audioUri, imageUri, history = [], language = 'English', sessionId = null) => {
     const formData = new FormData();
 
+    // With a session id the server keeps the conversation; only the new turn is sent
+    if (sessionId) {
+        formData.append('session_id', sessionId);
+    }
+
     if (text) {
         formData.append('text', text);
     }
@@ -53,6 +64,12 @@ export const sendChat = async (text, audioUri, imageUri, history = [], language
         }
     }
 
+    return formData;
+};
+
+export const sendChat = async (text, audioUri, imageUri, history = [], language = 'English', sessionId = null) => {
+    const formData = await buildChatForm(text, audioUri, imageUri, history, language, sessionId);
+
     try {
         const response = await fetch(`${BASE_URL}/chat`, {
             method: 'POST',
@@ -71,8 +88,78 @@ export const sendChat = async (text, audioUri, imageUri, history = [], language
     }
 };
 
-export const sendRespiration = async (audioUri) => {
+// Streaming variant of sendChat backed by the /chat/stream Server-Sent Events endpoint.
+// handlers: { onTranscription(text), onToken(text), onAudio(index, audioPath) }
+// Resolves with { transcription, response, session_id } once the server sends "done".
+// XMLHttpRequest is used because React Native's fetch can't read a response body incrementally.
+export const sendChatStream = async (text, audioUri, imageUri, history = [], language = 'English', handlers = {}, sessionId = null) => {
+    const formData = await buildChatForm(text, audioUri, imageUri, history, language, sessionId);
+
+    return new Promise((resolve, reject) => {
+        const xhr = new XMLHttpRequest();
+        let seen = 0;
+        let buffer = '';
+        let result = null;
+        let failed = false;
+
+        const dispatch = (block) => {
+            let event = 'message';
+            let data = '';
+            block.split('\n').forEach(line => {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            });
+            if (!data) return;
+            const payload = JSON.parse(data);
+            if (event === 'transcription') handlers.onTranscription?.(payload.text);
+            else if (event === 'token') handlers.onToken?.(payload.text);
+            else if (event === 'audio') handlers.onAudio?.(payload.index, payload.audio_url);
+            else if (event === 'done') result = payload;
+            else if (event === 'error') {
+                failed = true;
+                reject(new Error(`Stream Error: ${payload.error}`));
+            }
+        };
+
+        const consume = () => {
+            buffer += xhr.responseText.slice(seen);
+            seen = xhr.responseText.length;
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+                dispatch(buffer.slice(0, boundary));
+                buffer = buffer.slice(boundary + 2);
+            }
+        };
+
+        xhr.onprogress = consume;
+        xhr.onload = () => {
+            if (xhr.status !== 200) {
+                reject(new Error(`API Error: ${xhr.status} - ${xhr.responseText}`));
+                return;
+            }
+            consume();
+            if (failed) return;
+            if (result) resolve(result);
+            else reject(new Error('Stream ended before completion'));
+        };
+        xhr.onerror = () => {
+            console.error('Streaming API Request Failed');
+            reject(new Error('Streaming API Request Failed'));
+        };
+
+        xhr.open('POST', `${BASE_URL}/chat/stream`);
+        xhr.setRequestHeader('Accept', 'text/event-stream');
+        xhr.send(formData);
+    });
+};
+
+// windowed: analyze the whole recording in overlapping 6-second windows
+export const sendRespiration = async (audioUri, { windowed = true, hopSeconds = 3 } = {}) => {
     const formData = new FormData();
+    if (windowed) {
+        formData.append('windowed', 'true');
+        formData.append('hop_seconds', String(hopSeconds));
+    }
     const uriParts = audioUri.split('.');
     const fileType = uriParts[uriParts.length - 1];
 
@@ -0,0 +1,51 @@
+import { Platform } from 'react-native';
+import { respirationSocketUrl } from './api';
+
+// Continuous respiratory monitoring over the /ws/respiratory WebSocket.
+// Raw PCM capture needs the Web Audio API, so this is available on web only;
+// native builds keep the record-then-upload flow (expo-av exposes no PCM stream).
+export const canMonitorRespiration =
+    Platform.OS === 'web' && typeof navigator !== 'undefined' && !!navigator.mediaDevices;
+
+// Starts streaming microphone audio as 16-bit mono PCM. onUpdate receives each
+// server update ({ time, prediction, confidence, probabilities }).
+// Resolves with a stop() function.
+export const startRespirationMonitor = async ({ onUpdate, onError, sampleRate = 16000, hopSeconds = 1 }) => {
+    const stream = await navigator.mediaDevices.getUserMedia({ audio: true });
+    const context = new AudioContext();
+    const source = context.createMediaStreamSource(stream);
+    const processor = context.createScriptProcessor(4096, 1, 1);
+    const socket = new WebSocket(respirationSocketUrl(sampleRate, hopSeconds));
+    socket.binaryType = 'arraybuffer';
+
+    socket.onmessage = (event) => {
+        const update = JSON.parse(event.data);
+        if (update.type === 'error') onError?.(new Error(update.error));
+        else onUpdate?.(update);
+    };
+    socket.onerror = () => onError?.(new Error('Respiration stream failed'));
+
+    // Downsample the device rate to sampleRate by picking the nearest sample
+    const ratio = context.sampleRate / sampleRate;
+    processor.onaudioprocess = (event) => {
+        if (socket.readyState !== WebSocket.OPEN) return;
+        const input = event.inputBuffer.getChannelData(0);
+        const pcm = new Int16Array(Math.floor(input.length / ratio));
+        for (let i = 0; i < pcm.length; i++) {
+            const sample = Math.max(-1, Math.min(1, input[Math.floor(i * ratio)]));
+            pcm[i] = sample * 32767;
+        }
+        socket.send(pcm.buffer);
+    };
+
+    source.connect(processor);
+    processor.connect(context.destination);
+
+    return () => {
+        processor.disconnect();
+        source.disconnect();
+        stream.getTracks().forEach(track => track.stop());
+        context.close();
+        socket.close();
+    };
+};
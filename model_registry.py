@@ -0,0 +1,338 @@
+# Respiratory model registry and ensemble.
+#
+# Every model file under a directory is loaded once, and each model's input
+# shapes are matched to the features it consumes (MFCC: 20 bins, chroma: 12,
+# mel spectrogram: 128, all 259 frames). Features are computed once per clip by
+# the caller and shared; each classifier runs concurrently on its own inputs and
+# the class probabilities are fused with per-model weights.
+#
+# With RESP_MODEL_FORMAT=fp16|int8, a <name>.<format>.tflite artifact written
+# by export_models.py is served in place of <name>.keras when it is at least as
+# new as the Keras file; otherwise, or if the artifact fails to load, the Keras
+# model is used.
+#
+# Model files are polled by size/mtime. A changed file is loaded to the side and
+# the new model set is swapped in with a single reference assignment, so
+# predictions already running finish on the set they started with.
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import feature_engine
+import telemetry
+from prediction_cache import file_version
+
+FEATURES_BY_BINS = {feature_engine.N_MFCC: "mfcc", feature_engine.N_CHROMA: "chroma", feature_engine.N_MELS: "mspec"}
+FEATURE_INDEX = {"mfcc": 0, "chroma": 1, "mspec": 2}
+MODEL_EXTENSIONS = (".keras", ".h5")
+ARTIFACT_FORMATS = ("keras", "fp16", "int8")
+TFLITE_THREADS = int(os.environ.get("TFLITE_THREADS", "2"))
+
+
+def parse_weights(spec):
+    """
+    "Respiratory_sound=1,mfcc_model=0.5" -> {"Respiratory_sound": 1.0, "mfcc_model": 0.5}
+    """
+    weights = {}
+    for item in (spec or "").split(","):
+        if "=" in item:
+            name, value = item.split("=", 1)
+            weights[name.strip()] = float(value)
+    return weights
+
+
+def load_keras_model(path):
+    import tensorflow as tf
+    return tf.keras.models.load_model(path)
+
+
+def _tflite_interpreter():
+    # The standalone LiteRT runtime when installed (no TensorFlow import needed)
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+class _Tensor:
+    def __init__(self, shape):
+        self.shape = shape
+
+
+class TFLiteModel:
+    """
+    Keras-like predict_on_batch() over a TFLite interpreter. Inputs and outputs
+    stay float32 (export_models.py quantizes internally only); the interpreter
+    is resized whenever the batch size changes.
+    """
+
+    def __init__(self, path, num_threads=TFLITE_THREADS):
+        self.path = path
+        self._interpreter = _tflite_interpreter()(model_path=path, num_threads=num_threads)
+        self._input_details = self._interpreter.get_input_details()
+        self._output = self._interpreter.get_output_details()[0]
+        self.inputs = [_Tensor(tuple(int(d) for d in detail["shape"])) for detail in self._input_details]
+        self.outputs = [_Tensor(tuple(int(d) for d in self._output["shape"]))]
+        self._batch_size = None
+        # One interpreter per model; calls from different threads take turns
+        self._lock = threading.Lock()
+
+    def predict_on_batch(self, inputs):
+        if not isinstance(inputs, (list, tuple)):
+            inputs = [inputs]
+        batch_size = len(inputs[0])
+        with self._lock:
+            if batch_size != self._batch_size:
+                for detail in self._input_details:
+                    self._interpreter.resize_tensor_input(detail["index"], [batch_size, *detail["shape"][1:]])
+                self._interpreter.allocate_tensors()
+                self._batch_size = batch_size
+            for detail, x in zip(self._input_details, inputs):
+                self._interpreter.set_tensor(detail["index"], np.asarray(x, dtype=np.float32))
+            self._interpreter.invoke()
+            return self._interpreter.get_tensor(self._output["index"]).copy()
+
+
+def load_model_file(path):
+    if path.endswith(".tflite"):
+        return TFLiteModel(path)
+    return load_keras_model(path)
+
+
+def describe_model(model):
+    """
+    Returns (input feature names in the model's input order, output width).
+    Raises ValueError for an input the feature engine doesn't produce.
+    """
+    features = []
+    for tensor in model.inputs:
+        shape = tuple(tensor.shape)
+        if len(shape) != 4 or shape[2] != feature_engine.N_FRAMES or shape[1] not in FEATURES_BY_BINS:
+            raise ValueError(f"unsupported input shape {shape}")
+        features.append(FEATURES_BY_BINS[shape[1]])
+    return features, int(model.outputs[0].shape[-1])
+
+
+class LoadedModel:
+    def __init__(self, name, path, version, model, inputs, output_dim, role, weight, load_seconds):
+        self.name = name
+        self.path = path
+        self.version = version
+        self.model = model
+        self.inputs = inputs
+        self.output_dim = output_dim
+        self.role = role
+        self.weight = weight
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+
+    def predict(self, features):
+        with telemetry.span(f"model_{self.name}"):
+            inputs = [features[FEATURE_INDEX[f]] for f in self.inputs]
+            # Single-input models take the bare tensor rather than a one-item list
+            return np.asarray(self.model.predict_on_batch(inputs[0] if len(inputs) == 1 else inputs))
+
+    def describe(self):
+        return {
+            "path": self.path,
+            "format": "tflite" if self.path.endswith(".tflite") else "keras",
+            "role": self.role,
+            "inputs": self.inputs,
+            "output_dim": self.output_dim,
+            "weight": self.weight,
+            "version": self.version,
+            "load_seconds": round(self.load_seconds, 3),
+            "loaded_at": self.loaded_at,
+        }
+
+
+class ModelSet:
+    """
+    Immutable snapshot of the loaded models.
+    """
+
+    def __init__(self, models):
+        self.models = models
+        self.classifiers = [m for m in models.values() if m.role == "classifier" and m.weight > 0]
+        self.version = ";".join(f"{name}:{m.version}:{m.weight:g}" for name, m in sorted(models.items())) or "none"
+
+
+class ModelRegistry:
+    def __init__(self, model_dir, labels, weights=None, loader=load_model_file, warmup=True, max_workers=4, artifact_format="keras"):
+        """
+        Models whose output width matches len(labels) are classifiers and are
+        fused; any other output (e.g. a 64-wide embedding branch) is loaded and
+        reported but left out of the ensemble. artifact_format picks exported
+        TFLite artifacts over the Keras files (see export_models.py).
+        """
+        if artifact_format not in ARTIFACT_FORMATS:
+            raise ValueError(f"artifact_format must be one of {', '.join(ARTIFACT_FORMATS)}")
+        self.model_dir = model_dir
+        self.labels = labels
+        self.weights = weights or {}
+        self.loader = loader
+        self.warmup = warmup
+        self.artifact_format = artifact_format
+        self._current = ModelSet({})
+        self._reload_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="model")
+        self._watcher = None
+        self._stop = threading.Event()
+        self.errors = {}
+        self.reloads = 0
+
+    @property
+    def current(self):
+        return self._current
+
+    @property
+    def version(self):
+        return self._current.version
+
+    def ready(self):
+        return bool(self._current.classifiers)
+
+    def _artifact_for(self, keras_path):
+        if self.artifact_format == "keras":
+            return None
+        artifact = f"{os.path.splitext(keras_path)[0]}.{self.artifact_format}.tflite"
+        try:
+            # An artifact older than its Keras file was exported from a previous model
+            if os.path.getmtime(artifact) >= os.path.getmtime(keras_path):
+                return artifact
+        except OSError:
+            pass
+        return None
+
+    def _model_files(self):
+        """
+        name -> (path to load, Keras fallback path or None)
+        """
+        try:
+            names = sorted(os.listdir(self.model_dir))
+        except OSError:
+            return {}
+        files = {}
+        for name in names:
+            if name.endswith(MODEL_EXTENSIONS):
+                path = os.path.join(self.model_dir, name)
+                artifact = self._artifact_for(path)
+                files[os.path.splitext(name)[0]] = (artifact, path) if artifact else (path, None)
+        return files
+
+    def _warm_up(self, loaded):
+        dummy = [
+            np.zeros((1, feature_engine.N_MFCC, feature_engine.N_FRAMES, 1), dtype=np.float32),
+            np.zeros((1, feature_engine.N_CHROMA, feature_engine.N_FRAMES, 1), dtype=np.float32),
+            np.zeros((1, feature_engine.N_MELS, feature_engine.N_FRAMES, 1), dtype=np.float32),
+        ]
+        loaded.predict(dummy)
+
+    def _load(self, name, path, version, fallback=None):
+        started = time.perf_counter()
+        try:
+            model = self.loader(path)
+        except Exception as e:
+            if fallback is None:
+                raise
+            print(f"⚠ {os.path.basename(path)} failed to load ({str(e).strip()}); using {os.path.basename(fallback)}")
+            path = fallback
+            model = self.loader(path)
+        inputs, output_dim = describe_model(model)
+        role = "classifier" if output_dim == len(self.labels) else "embedding"
+        loaded = LoadedModel(name, path, version, model, inputs, output_dim, role,
+                             self.weights.get(name, 1.0), time.perf_counter() - started)
+        if self.warmup:
+            self._warm_up(loaded)
+        return loaded
+
+    def reload(self):
+        """
+        Load new or changed model files and drop removed ones. Unchanged models
+        are carried over as-is. Returns True if the model set changed.
+        """
+        with self._reload_lock:
+            current = self._current.models
+            models = {}
+            changed = False
+            for name, (path, fallback) in self._model_files().items():
+                version = file_version(path)
+                if name in current and current[name].version == version:
+                    models[name] = current[name]
+                    continue
+                if self.errors.get(name, {}).get("version") == version:
+                    # Failed before at this exact version; wait for the file to change
+                    if name in current:
+                        models[name] = current[name]
+                    continue
+                try:
+                    models[name] = self._load(name, path, version, fallback)
+                    self.errors.pop(name, None)
+                    changed = True
+                    print(f"✓ Model {name} loaded ({models[name].role}, inputs: {', '.join(models[name].inputs)})")
+                except Exception as e:
+                    self.errors[name] = {"version": version, "error": str(e)}
+                    print(f"✗ Model {name} failed to load: {e}")
+                    if name in current:
+                        # Keep serving the previous version of a file that was replaced badly
+                        models[name] = current[name]
+            changed = changed or set(models) != set(current)
+            if changed:
+                self._current = ModelSet(models)
+                self.reloads += 1
+            return changed
+
+    def predict_on_batch(self, features):
+        """
+        features: [mfcc, chroma, mspec] batches. Returns the weighted mean of
+        the classifiers' probabilities, shaped (N, len(labels)).
+        """
+        model_set = self._current
+        if not model_set.classifiers:
+            raise RuntimeError("no classifier models loaded")
+        # One context copy per task: a context can't be entered by two threads at once
+        futures = [
+            self._executor.submit(telemetry.run_in_context(LoadedModel.predict), m, features)
+            for m in model_set.classifiers
+        ]
+        total = sum(m.weight for m in model_set.classifiers)
+        fused = None
+        for model, future in zip(model_set.classifiers, futures):
+            probs = future.result() * (model.weight / total)
+            fused = probs if fused is None else fused + probs
+        return fused
+
+    def _watch(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.reload()
+            except Exception as e:
+                print(f"⚠ Model reload check failed: {e}")
+
+    def start_watching(self, interval):
+        if interval <= 0 or self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), name="model-watch", daemon=True)
+        self._watcher.start()
+
+    def close(self):
+        self._stop.set()
+        self._executor.shutdown(wait=False)
+
+    def stats(self):
+        model_set = self._current
+        return {
+            "model_dir": self.model_dir,
+            "artifact_format": self.artifact_format,
+            "ready": bool(model_set.classifiers),
+            "version": model_set.version,
+            "reloads": self.reloads,
+            "ensemble": [m.name for m in model_set.classifiers],
+            "models": {name: m.describe() for name, m in model_set.models.items()},
+            "errors": {name: e["error"] for name, e in self.errors.items()},
+        }
@@ -0,0 +1,140 @@
+# Content-hash cache for respiratory features and predictions.
+#
+# Repeat uploads of the same recording (demo files, mobile retries) are looked
+# up by SHA-256 of the raw bytes plus the feature/model version, so hits skip
+# decoding, feature extraction and inference entirely. A bounded in-memory LRU
+# sits in front of an optional disk tier of memory-mapped .npy files.
+import hashlib
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+FEATURE_NAMES = ("mfcc", "chroma", "mspec")
+
+
+def file_version(path):
+    """
+    Cheap fingerprint of a model file: changes whenever it is replaced or rewritten.
+    """
+    try:
+        stat = os.stat(path)
+        return f"{stat.st_size}-{stat.st_mtime_ns}"
+    except OSError:
+        return "missing"
+
+
+class PredictionCache:
+    def __init__(self, version, max_entries=256, disk_dir=None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.version = None
+        self.set_version(version)
+
+    def _version_dir(self):
+        return os.path.join(self.disk_dir, hashlib.sha256(self.version.encode()).hexdigest()[:16])
+
+    def set_version(self, version):
+        """
+        Switch to a new feature/model version, dropping everything cached
+        under the old one (in memory and on disk).
+        """
+        with self._lock:
+            if version == self.version:
+                return
+            if self.version is not None:
+                self.invalidations += 1
+            self.version = version
+            self._memory.clear()
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            current = os.path.basename(self._version_dir())
+            for name in os.listdir(self.disk_dir):
+                if name != current:
+                    shutil.rmtree(os.path.join(self.disk_dir, name), ignore_errors=True)
+
+    def key(self, audio_bytes):
+        digest = hashlib.sha256(audio_bytes)
+        digest.update(self.version.encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Returns (features, probs) where features is (mfcc, chroma, mspec) and
+        probs may be None, or None on a miss.
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key]
+        if self.disk_dir:
+            entry_dir = os.path.join(self._version_dir(), key)
+            try:
+                features = tuple(np.load(os.path.join(entry_dir, f"{name}.npy"), mmap_mode="r") for name in FEATURE_NAMES)
+                probs_path = os.path.join(entry_dir, "probs.npy")
+                probs = np.load(probs_path) if os.path.exists(probs_path) else None
+            except (OSError, ValueError):
+                features = None
+            if features is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._remember(key, (features, probs))
+                return features, probs
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def put(self, key, features, probs=None):
+        with self._lock:
+            self._remember(key, (features, probs))
+        if not self.disk_dir:
+            return
+        entry_dir = os.path.join(self._version_dir(), key)
+        tmp_dir = f"{entry_dir}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(tmp_dir, exist_ok=True)
+            for name, array in zip(FEATURE_NAMES, features):
+                np.save(os.path.join(tmp_dir, f"{name}.npy"), np.ascontiguousarray(array))
+            if probs is not None:
+                np.save(os.path.join(tmp_dir, "probs.npy"), np.asarray(probs))
+            os.replace(tmp_dir, entry_dir)
+        except OSError as e:
+            # Another request may have written the same entry first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            if not os.path.isdir(entry_dir):
+                print(f"⚠ Prediction cache write failed: {e}")
+
+    def invalidate(self):
+        with self._lock:
+            self._memory.clear()
+            self.invalidations += 1
+        if self.disk_dir:
+            shutil.rmtree(self._version_dir(), ignore_errors=True)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "version": self.version,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "invalidations": self.invalidations,
+            }
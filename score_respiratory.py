@@ -0,0 +1,326 @@
+# Bulk respiratory scoring.
+#
+# Scores a directory tree of recordings laid out as <root>/<Label>/*.wav with
+# the respiratory model. Decoding and feature extraction run in a process pool
+# with a bounded number of files in flight; features are gathered into large
+# batches for model inference. Rows are appended to a CSV as each batch
+# finishes, so an interrupted run picks up where it stopped, and a confusion
+# matrix and throughput report are written at the end.
+#
+#   python score_respiratory.py test_audios --output scores.csv --model Respiratory_sound.keras
+#   python score_respiratory.py /data/archive --output scores.parquet --workers 8 --batch-size 512
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+import feature_engine
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+# Same model location and label order as api.py
+MODEL_BASE_PATH = os.environ.get("MODEL_BASE_PATH", os.path.join(APP_DIR, "models", "trained_models"))
+RESP_MODEL_PATH = os.environ.get("RESP_MODEL_PATH", os.path.join(MODEL_BASE_PATH, "Respiratory_sound.keras"))
+RESP_LABELS = ["Asthma", "Bronchiectasis", "Bronchiolitis", "COPD", "Normal", "LRTI", "Pneumonia", "URTI"]
+
+# Folder names used by the public ICBHI dumps for the model's labels
+LABEL_ALIASES = {"Healthy": "Normal"}
+AUDIO_EXTENSIONS = {".wav", ".flac", ".ogg", ".mp3"}
+COLUMNS = ["path", "label", "prediction", "confidence", "error"] + [f"p_{label}" for label in RESP_LABELS]
+
+
+def iter_recordings(root):
+    """
+    Yield (relative_path, label) for every audio file under root, in a stable
+    order, without listing the whole tree up front. The label is the name of
+    the top-level folder a file sits in.
+    """
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        with os.scandir(directory) as entries:
+            entries = sorted(entries, key=lambda e: e.name)
+        for entry in entries:
+            if entry.is_file() and os.path.splitext(entry.name)[1].lower() in AUDIO_EXTENSIONS:
+                relative = os.path.relpath(entry.path, root)
+                parts = relative.split(os.sep)
+                label = parts[0] if len(parts) > 1 else ""
+                yield relative, LABEL_ALIASES.get(label, label)
+        # Reversed so the stack pops subdirectories in name order
+        stack.extend(e.path for e in reversed(entries) if e.is_dir())
+
+
+def featurize(path):
+    """
+    Worker: decode the first CLIP_SECONDS of a file and extract its features.
+    Returns ((mfcc, chroma, mspec), None), or (None, error message).
+    """
+    try:
+        y, sr = feature_engine.load_clip(path, sr=None, duration=feature_engine.CLIP_SECONDS)
+        if len(y) == 0:
+            return None, "empty audio"
+        mfcc, chroma, mspec = feature_engine.extract_feature_batch([(y, sr)])
+        return (mfcc[0], chroma[0], mspec[0]), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def load_model(path):
+    """
+    A .keras/.tflite model file, or a directory scored with the same weighted
+    ensemble as the API (see model_registry).
+    """
+    if os.path.isdir(path):
+        from model_registry import ModelRegistry, parse_weights
+
+        registry = ModelRegistry(path, RESP_LABELS, weights=parse_weights(os.environ.get("RESP_MODEL_WEIGHTS")),
+                                 warmup=False, artifact_format=os.environ.get("RESP_MODEL_FORMAT", "keras"))
+        registry.reload()
+        if not registry.ready():
+            raise SystemExit(f"✗ No {len(RESP_LABELS)}-class classifier in {path}")
+        return registry
+    from model_registry import load_model_file
+
+    return load_model_file(path)
+
+
+def completed_paths(csv_path):
+    """
+    Paths already scored by an earlier run. A row cut short by an interruption
+    doesn't match any real path, so that file is simply scored again.
+    """
+    done = set()
+    if not os.path.exists(csv_path):
+        return done
+    with open(csv_path, newline="") as f:
+        for row in csv.reader(f):
+            if len(row) == len(COLUMNS) and row[0] != "path":
+                done.add(row[0])
+    return done
+
+
+class ResultWriter:
+    def __init__(self, csv_path):
+        new_file = not os.path.exists(csv_path) or os.path.getsize(csv_path) == 0
+        self._file = open(csv_path, "a", newline="")
+        self._writer = csv.writer(self._file)
+        if new_file:
+            self._writer.writerow(COLUMNS)
+
+    def write_batch(self, rows):
+        self._writer.writerows(rows)
+        # One flush per batch: a crash loses at most the batch being written
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+def score_rows(model, batch):
+    """
+    batch: list of (path, label, features). Returns CSV rows.
+    """
+    inputs = [np.stack([features[i] for _, _, features in batch]) for i in range(3)]
+    probs = np.asarray(model.predict_on_batch(inputs))
+    rows = []
+    for (path, label, _), p in zip(batch, probs):
+        best = int(np.argmax(p))
+        rows.append([path, label, RESP_LABELS[best], f"{float(p[best]):.6f}", ""] + [f"{float(x):.6f}" for x in p])
+    return rows
+
+
+def error_row(path, label, error):
+    return [path, label, "", "", error] + [""] * len(RESP_LABELS)
+
+
+def score_directory(root, csv_path, model, workers, batch_size, max_in_flight, limit=None):
+    """
+    Score every recording under root not already in csv_path.
+    Returns (files_scored, errors, seconds).
+    """
+    done = completed_paths(csv_path)
+    if done:
+        print(f"↻ Resuming: {len(done)} file(s) already scored")
+    pending_files = ((path, label) for path, label in iter_recordings(root) if path not in done)
+
+    writer = ResultWriter(csv_path)
+    scored = errors = 0
+    batch = []
+    started = time.perf_counter()
+    last_report = started
+
+    def flush():
+        nonlocal scored, batch
+        if batch:
+            writer.write_batch(score_rows(model, batch))
+            scored += len(batch)
+            batch = []
+
+    # Spawned workers never inherit TensorFlow's state from this process
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        in_flight = {}
+        exhausted = False
+        submitted = 0
+        while in_flight or not exhausted:
+            # Keep the pool busy with at most max_in_flight files decoded at once
+            while not exhausted and len(in_flight) < max_in_flight:
+                item = next(pending_files, None)
+                if item is None or (limit is not None and submitted >= limit):
+                    exhausted = True
+                    break
+                path, label = item
+                in_flight[executor.submit(featurize, os.path.join(root, path))] = (path, label)
+                submitted += 1
+            if not in_flight:
+                break
+
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                path, label = in_flight.pop(future)
+                features, error = future.result()
+                if error:
+                    writer.write_batch([error_row(path, label, error)])
+                    errors += 1
+                    continue
+                batch.append((path, label, features))
+                if len(batch) >= batch_size:
+                    flush()
+
+            now = time.perf_counter()
+            if now - last_report >= 10:
+                print(f"… {scored + errors} file(s), {(scored + errors) / (now - started):.1f} files/s")
+                last_report = now
+        flush()
+    writer.close()
+    return scored, errors, time.perf_counter() - started
+
+
+def confusion_report(csv_path):
+    """
+    Confusion matrix over every scored row in csv_path (this run and earlier
+    ones). Rows whose folder isn't a model label are counted but not scored.
+    """
+    index = {label: i for i, label in enumerate(RESP_LABELS)}
+    matrix = np.zeros((len(RESP_LABELS), len(RESP_LABELS)), dtype=np.int64)
+    unlabeled = failed = 0
+    with open(csv_path, newline="") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            if len(row) != len(COLUMNS):
+                continue
+            _, label, prediction, _, error = row[:5]
+            if error:
+                failed += 1
+            elif label in index:
+                matrix[index[label], index[prediction]] += 1
+            else:
+                unlabeled += 1
+
+    total = int(matrix.sum())
+    per_label = {}
+    for label, i in index.items():
+        support = int(matrix[i].sum())
+        predicted = int(matrix[:, i].sum())
+        correct = int(matrix[i, i])
+        per_label[label] = {
+            "support": support,
+            "precision": round(correct / predicted, 4) if predicted else None,
+            "recall": round(correct / support, 4) if support else None,
+        }
+    return {
+        "labels": RESP_LABELS,
+        "confusion_matrix": matrix.tolist(),
+        "accuracy": round(float(np.trace(matrix)) / total, 4) if total else None,
+        "scored": total,
+        "unlabeled": unlabeled,
+        "failed": failed,
+        "per_label": per_label,
+    }
+
+
+def print_confusion(report):
+    labels = [label for label, stats in report["per_label"].items() if stats["support"]]
+    if not labels:
+        print("No files under a folder named after a model label; no confusion matrix.")
+        return
+    index = {label: i for i, label in enumerate(report["labels"])}
+    width = max(len(label) for label in report["labels"]) + 2
+    print("\nConfusion matrix (rows: folder label, columns: prediction)")
+    print(" " * width + "".join(f"{label[:6]:>8}" for label in report["labels"]))
+    for label in labels:
+        row = report["confusion_matrix"][index[label]]
+        print(f"{label:<{width}}" + "".join(f"{count:>8}" for count in row))
+    print(f"\nAccuracy: {report['accuracy']:.2%} over {report['scored']} file(s)")
+    for label in labels:
+        stats = report["per_label"][label]
+        precision = f"{stats['precision']:.2%}" if stats["precision"] is not None else "n/a"
+        print(f"  {label:<{width}} recall {stats['recall']:.2%}  precision {precision}  (n={stats['support']})")
+
+
+def write_parquet(csv_path, parquet_path):
+    import pandas as pd
+    pd.read_csv(csv_path).to_parquet(parquet_path, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a tree of respiratory recordings with the respiratory model")
+    parser.add_argument("root", nargs="?", default=os.path.join(APP_DIR, "test_audios"), help="directory laid out as <Label>/*.wav")
+    parser.add_argument("--output", default="respiratory_scores.csv", help=".csv or .parquet")
+    parser.add_argument("--model", default=RESP_MODEL_PATH, help="model file, or a directory to score as an ensemble")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="feature extraction processes")
+    parser.add_argument("--batch-size", type=int, default=256, help="files per model call")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="files decoded at once [4 x workers]")
+    parser.add_argument("--limit", type=int, default=None, help="score at most this many new files")
+    args = parser.parse_args()
+    if not os.path.exists(args.model):
+        parser.error(f"model not found: {args.model}. Pass --model with the 8-class respiratory model, "
+                     "or a directory of models to score as an ensemble (or set RESP_MODEL_PATH)")
+
+    # Parquet can't be appended to, so progress is checkpointed in a CSV next
+    # to it (kept, so a later run over a grown archive only scores new files)
+    parquet = args.output.lower().endswith(".parquet")
+    csv_path = f"{args.output}.partial.csv" if parquet else args.output
+
+    print(f"Loading model from {args.model}")
+    model = load_model(args.model)
+    # Workers are single-file jobs; one BLAS thread each avoids oversubscription
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ.setdefault(var, "1")
+
+    scored, errors, seconds = score_directory(
+        args.root, csv_path, model,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        max_in_flight=args.max_in_flight or 4 * args.workers,
+        limit=args.limit,
+    )
+    rate = (scored + errors) / seconds if seconds else 0.0
+    print(f"✓ Scored {scored} file(s), {errors} failed, in {seconds:.1f}s ({rate:.2f} files/s)")
+
+    report = confusion_report(csv_path)
+    report["run"] = {"files": scored, "errors": errors, "seconds": round(seconds, 3), "files_per_second": round(rate, 3),
+                     "workers": args.workers, "batch_size": args.batch_size}
+    print_confusion(report)
+
+    if parquet:
+        try:
+            write_parquet(csv_path, args.output)
+        except ImportError as e:
+            print(f"✗ Parquet output needs pandas with pyarrow ({e}); results kept in {csv_path}")
+            sys.exit(1)
+    report_path = f"{os.path.splitext(args.output)[0]}.report.json"
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"✓ Predictions in {args.output}, report in {report_path}")
+
+
+if __name__ == "__main__":
+    main()
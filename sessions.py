@@ -0,0 +1,234 @@
+# Server-side conversation sessions.
+#
+# Instead of the client re-sending the whole history on every /chat turn, the
+# server keeps each consultation under a session id. Prompts are assembled
+# within a token budget from the most recent turns plus a rolling summary of
+# older ones, so both uploads and prompts stay bounded as a consultation grows.
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Rough token estimate (~4 characters per token for English), good enough for budgeting
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class UnknownSession(KeyError):
+    """The session id was never issued by this server, or has been evicted."""
+
+
+class InMemorySessionStore:
+    def __init__(self, max_sessions=10000):
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _session(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is None:
+            raise UnknownSession(session_id)
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def create(self, session_id):
+        with self._lock:
+            self._sessions[session_id] = {"summary": "", "summarized_upto": 0, "offset": 0, "turns": []}
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def exists(self, session_id):
+        with self._lock:
+            return session_id in self._sessions
+
+    def load(self, session_id):
+        """
+        Returns {"summary", "summarized_upto", "turns"} where turns are the
+        (index, role, content) tuples not yet folded into the summary.
+        """
+        with self._lock:
+            session = self._session(session_id)
+            start = session["summarized_upto"] - session["offset"]
+            turns = [(session["offset"] + i, role, content) for i, (role, content) in enumerate(session["turns"])][start:]
+            return {"summary": session["summary"], "summarized_upto": session["summarized_upto"], "turns": turns}
+
+    def append_turns(self, session_id, turns):
+        with self._lock:
+            self._session(session_id)["turns"].extend(turns)
+
+    def set_summary(self, session_id, summary, summarized_upto):
+        with self._lock:
+            session = self._session(session_id)
+            session["summary"] = summary
+            session["summarized_upto"] = summarized_upto
+            # Summarized turns are never sent again, so drop them
+            drop = summarized_upto - session["offset"]
+            del session["turns"][:drop]
+            session["offset"] = summarized_upto
+
+
+class SQLiteSessionStore:
+    def __init__(self, path="sessions.db"):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    id TEXT PRIMARY KEY,
+                    summary TEXT NOT NULL DEFAULT '',
+                    summarized_upto INTEGER NOT NULL DEFAULT 0,
+                    updated REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS turns (
+                    session_id TEXT NOT NULL,
+                    idx INTEGER NOT NULL,
+                    role TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    PRIMARY KEY (session_id, idx)
+                );
+            """)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def create(self, session_id):
+        with self._connection() as conn:
+            conn.execute("INSERT INTO sessions (id, updated) VALUES (?, ?)", (session_id, time.time()))
+
+    def exists(self, session_id):
+        row = self._connection().execute("SELECT 1 FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return row is not None
+
+    def load(self, session_id):
+        conn = self._connection()
+        row = conn.execute("SELECT summary, summarized_upto FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None:
+            raise UnknownSession(session_id)
+        summary, summarized_upto = row
+        turns = conn.execute(
+            "SELECT idx, role, content FROM turns WHERE session_id = ? AND idx >= ? ORDER BY idx",
+            (session_id, summarized_upto),
+        ).fetchall()
+        return {"summary": summary, "summarized_upto": summarized_upto, "turns": turns}
+
+    def append_turns(self, session_id, turns):
+        with self._connection() as conn:
+            if conn.execute("UPDATE sessions SET updated = ? WHERE id = ?", (time.time(), session_id)).rowcount == 0:
+                raise UnknownSession(session_id)
+            # Summarized turns are pruned, so continue after them if none remain
+            next_idx = conn.execute(
+                "SELECT MAX(COALESCE((SELECT MAX(idx) + 1 FROM turns WHERE session_id = ?), 0), summarized_upto) "
+                "FROM sessions WHERE id = ?",
+                (session_id, session_id),
+            ).fetchone()[0]
+            conn.executemany(
+                "INSERT INTO turns (session_id, idx, role, content) VALUES (?, ?, ?, ?)",
+                [(session_id, next_idx + i, role, content) for i, (role, content) in enumerate(turns)],
+            )
+
+    def set_summary(self, session_id, summary, summarized_upto):
+        with self._connection() as conn:
+            updated = conn.execute(
+                "UPDATE sessions SET summary = ?, summarized_upto = ?, updated = ? WHERE id = ?",
+                (summary, summarized_upto, time.time(), session_id),
+            ).rowcount
+            if updated == 0:
+                raise UnknownSession(session_id)
+            # Summarized turns are never sent again, so drop them
+            conn.execute("DELETE FROM turns WHERE session_id = ? AND idx < ?", (session_id, summarized_upto))
+
+
+class SessionManager:
+    def __init__(self, store, token_budget=3000, summarize_fn=None):
+        """
+        summarize_fn(previous_summary, turns) -> new summary text, where turns
+        is a list of (role, content). Without it, old turns are simply dropped.
+        """
+        self.store = store
+        self.token_budget = token_budget
+        self.summarize_fn = summarize_fn
+        self._compacting = set()
+        self._lock = threading.Lock()
+
+    def new_session(self):
+        """Issue a session id and create its (empty) session."""
+        session_id = secrets.token_urlsafe(16)
+        self.store.create(session_id)
+        return session_id
+
+    def exists(self, session_id):
+        return self.store.exists(session_id)
+
+    def prompt_history(self, session_id):
+        """
+        Messages to place before the new user turn: the rolling summary (if any)
+        followed by as many of the most recent turns as fit in the token budget.
+        """
+        session = self.store.load(session_id)
+        budget = self.token_budget
+        messages = []
+        if session["summary"]:
+            messages.append({"role": "system", "content": f"Summary of the earlier consultation: {session['summary']}"})
+            budget -= estimate_tokens(session["summary"])
+        recent = []
+        for _, role, content in reversed(session["turns"]):
+            cost = estimate_tokens(content)
+            if cost > budget:
+                break
+            budget -= cost
+            recent.append({"role": role, "content": content})
+        return messages + recent[::-1]
+
+    def record_turn(self, session_id, user_text, assistant_text):
+        self.store.append_turns(session_id, [("user", user_text), ("assistant", assistant_text)])
+
+    def needs_compaction(self, session_id):
+        session = self.store.load(session_id)
+        used = estimate_tokens(session["summary"]) + sum(estimate_tokens(content) for _, _, content in session["turns"])
+        return used > self.token_budget
+
+    def compact(self, session_id):
+        """
+        Fold the oldest unsummarized turns into the rolling summary until the
+        remaining turns use at most half the budget.
+        """
+        with self._lock:
+            if session_id in self._compacting:
+                return
+            self._compacting.add(session_id)
+        try:
+            session = self.store.load(session_id)
+            turns = session["turns"]
+            keep_budget = self.token_budget // 2
+            kept = 0
+            split = len(turns)
+            while split > 0 and kept + estimate_tokens(turns[split - 1][2]) <= keep_budget:
+                split -= 1
+                kept += estimate_tokens(turns[split][2])
+            # Don't separate a doctor reply from the patient turn it answers
+            if split < len(turns) and turns[split][1] == "assistant":
+                split += 1
+            old = turns[:split]
+            if not old:
+                return
+            summary = session["summary"]
+            if self.summarize_fn is not None:
+                summary = self.summarize_fn(summary, [(role, content) for _, role, content in old])
+            self.store.set_summary(session_id, summary, old[-1][0] + 1)
+        finally:
+            with self._lock:
+                self._compacting.discard(session_id)
+
+
+def create_session_store(backend="memory", db_path="sessions.db"):
+    if backend == "sqlite":
+        return SQLiteSessionStore(db_path)
+    return InMemorySessionStore()
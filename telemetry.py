@@ -0,0 +1,358 @@
+# Request-scoped timing spans and Prometheus metrics.
+#
+# Every stage of a turn (STT, LLM, translation, TTS, image encoding, feature
+# extraction, inference) runs inside span(), which feeds a per-stage latency
+# histogram and the stage's in-flight gauge, and appends to the current
+# request's span list. The request id lives in a contextvar, so it follows the
+# request onto worker threads as long as work is submitted with
+# contextvars.copy_context().run (see run_in_context). The metrics are kept in
+# plain Python with one lock per metric, cheap enough to leave on in
+# production, and rendered in the Prometheus text format for /metrics.
+import bisect
+import contextvars
+import functools
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Per-request summaries ("request id, status, total, time per stage") are
+# logged for requests slower than TELEMETRY_SLOW_MS (0 logs every request).
+# Probes and scrapes are never logged.
+TELEMETRY_LOG = os.environ.get("TELEMETRY_LOG", "1") == "1"
+TELEMETRY_SLOW_MS = float(os.environ.get("TELEMETRY_SLOW_MS", "1000"))
+UNLOGGED_ROUTES = frozenset(("/metrics", "/healthz", "/readyz"))
+
+request_id_var = contextvars.ContextVar("request_id", default=None)
+_spans_var = contextvars.ContextVar("spans", default=None)
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        f'{name}="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for name, value in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(_label_key(self.labelnames, labels), 0.0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        suffix = "_total" if self.kind == "counter" else ""
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{suffix}{_format_labels(self.labelnames, key)} {value:g}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+
+class CallbackGauge:
+    """
+    Gauge whose value is read from fn() at scrape time (e.g. a queue depth).
+    """
+    kind = "gauge"
+
+    def __init__(self, name, documentation, fn):
+        self.name = name
+        self.documentation = documentation
+        self.fn = fn
+
+    def samples(self):
+        try:
+            value = float(self.fn())
+        except Exception:
+            return
+        yield f"{self.name} {value:g}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [bucket counts..., +Inf count, sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, **labels):
+        key = _label_key(self.labelnames, labels)
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[index] += 1
+            row[-1] += seconds
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(row) for key, row in self._values.items()}
+        for key, row in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), row[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', le)])} {cumulative}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {row[-1]:g}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            # Re-registering a name (e.g. a module reloaded in tests) replaces it
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+stage_seconds = registry.register(Histogram(
+    "speechbot_stage_duration_seconds", "Time spent in each processing stage.", ("stage", "status")))
+stage_queue_seconds = registry.register(Histogram(
+    "speechbot_stage_queue_seconds", "Time a stage waited for a worker thread.", ("stage",)))
+stages_in_flight = registry.register(Gauge(
+    "speechbot_stages_in_flight", "Stages currently executing.", ("stage",)))
+request_seconds = registry.register(Histogram(
+    "speechbot_http_request_duration_seconds", "HTTP request latency by route.", ("route", "method")))
+requests_total = registry.register(Counter(
+    "speechbot_http_requests", "HTTP requests by route and status code.", ("route", "method", "status")))
+requests_in_flight = registry.register(Gauge(
+    "speechbot_http_requests_in_flight", "HTTP requests currently being handled.", ("route",)))
+provider_errors = registry.register(Counter(
+    "speechbot_provider_errors", "Failed calls to external providers.", ("provider", "operation")))
+provider_fallbacks = registry.register(Counter(
+    "speechbot_provider_fallbacks", "Times a provider was replaced by its fallback.", ("from_provider", "to_provider")))
+admission_rejected = registry.register(Counter(
+    "speechbot_admission_rejected", "Requests turned away by admission control.", ("route", "reason")))
+admission_queue_seconds = registry.register(Histogram(
+    "speechbot_admission_queue_seconds", "Time admitted requests waited for a slot.", ("route",)))
+admission_queue_depth = registry.register(Gauge(
+    "speechbot_admission_queue_depth", "Requests waiting for a slot.", ("route",)))
+degraded_responses = registry.register(Counter(
+    "speechbot_degraded_responses", "Replies degraded under load (gtts instead of ElevenLabs, or text only).", ("route", "mode")))
+tts_hedges = registry.register(Counter(
+    "speechbot_tts_hedges", "TTS calls that missed their deadline and were raced against the next engine.", ("engine", "language")))
+tts_wins = registry.register(Counter(
+    "speechbot_tts_wins", "Routed TTS calls by the engine whose audio was used.", ("engine", "language")))
+tts_segments_dropped = registry.register(Counter(
+    "speechbot_tts_segments_dropped", "Sentences left out of pipelined TTS replies because synthesis failed.", ("language",)))
+
+
+def new_request_id():
+    return secrets.token_hex(8)
+
+
+def current_request_id():
+    return request_id_var.get()
+
+
+@contextmanager
+def request_scope(request_id=None):
+    """
+    Bind a request id and a fresh span list for the duration of a request.
+    Yields (request_id, spans).
+    """
+    request_id = request_id or new_request_id()
+    spans = []
+    id_token = request_id_var.set(request_id)
+    spans_token = _spans_var.set(spans)
+    try:
+        yield request_id, spans
+    finally:
+        request_id_var.reset(id_token)
+        _spans_var.reset(spans_token)
+
+
+def observe(stage, seconds, status="ok"):
+    """
+    Record a stage duration measured elsewhere (e.g. time to first token).
+    """
+    stage_seconds.observe(seconds, stage=stage, status=status)
+    spans = _spans_var.get()
+    if spans is not None:
+        spans.append((stage, seconds, status))
+
+
+@contextmanager
+def span(stage):
+    stages_in_flight.inc(stage=stage)
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        stages_in_flight.dec(stage=stage)
+        observe(stage, time.perf_counter() - started, status)
+
+
+def timed(stage):
+    """
+    Decorator form of span().
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def run_in_context(fn):
+    """
+    Wrap fn so it runs in a copy of the caller's context when submitted to a
+    thread pool; executors don't carry contextvars over on their own.
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+def log_request(request_id, method, route, status, seconds, spans):
+    """
+    One JSON line per request with the time spent in each stage.
+    """
+    if not TELEMETRY_LOG or route in UNLOGGED_ROUTES or seconds * 1000 < TELEMETRY_SLOW_MS:
+        return
+    stages = {}
+    for stage, duration, stage_status in spans:
+        entry = stages.setdefault(stage, {"ms": 0.0, "count": 0})
+        entry["ms"] = round(entry["ms"] + duration * 1000, 2)
+        entry["count"] += 1
+        if stage_status != "ok":
+            entry["errors"] = entry.get("errors", 0) + 1
+    print(json.dumps({
+        "event": "request",
+        "request_id": request_id,
+        "method": method,
+        "route": route,
+        "status": status,
+        "ms": round(seconds * 1000, 2),
+        "stages": stages,
+    }))
+
+
+def render_metrics():
+    return registry.render()
+
+
+def _route_template(scope):
+    """
+    The matched route's path template ("/audio/{audio_id}"), so per-route
+    metrics don't grow a label per id. Unknown paths share one label.
+    """
+    from starlette.routing import Match
+
+    app = scope.get("app")
+    for route in getattr(app, "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+class TelemetryMiddleware:
+    """
+    ASGI middleware that gives each HTTP request an id (taken from an incoming
+    X-Request-ID header when present, and echoed back), tracks it in the
+    in-flight gauge and records its latency and status per route. Timing stops
+    at the last body chunk, so streamed responses are measured in full.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope["headers"]).get(b"x-request-id")
+        route = _route_template(scope)
+        method = scope["method"]
+        state = {"status": 500, "finished": False}
+        started = time.perf_counter()
+
+        with request_scope(incoming.decode("latin-1")[:64] if incoming else None) as (request_id, spans):
+            def finish():
+                if state["finished"]:
+                    return
+                state["finished"] = True
+                seconds = time.perf_counter() - started
+                requests_in_flight.dec(route=route)
+                request_seconds.observe(seconds, route=route, method=method)
+                requests_total.inc(route=route, method=method, status=state["status"])
+                log_request(request_id, method, route, state["status"], seconds, spans)
+
+            async def send_with_telemetry(message):
+                if message["type"] == "http.response.start":
+                    state["status"] = message["status"]
+                    message = dict(message, headers=list(message.get("headers", [])) + [(b"x-request-id", request_id.encode("latin-1"))])
+                await send(message)
+                if message["type"] == "http.response.body" and not message.get("more_body", False):
+                    finish()
+
+            requests_in_flight.inc(route=route)
+            try:
+                await self.app(scope, receive, send_with_telemetry)
+            finally:
+                finish()
@@ -0,0 +1,270 @@
+# Admission control: queueing and rejection in AdmissionGate, and the 429/413
+# answers and slot release of AdmissionMiddleware.
+#
+#   python -m pytest test_admission.py
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI, File, UploadFile
+
+from admission import AdmissionGate, AdmissionMiddleware, Rejected
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 10))
+
+
+def test_queue_full_is_rejected():
+    async def scenario():
+        gate = AdmissionGate("/t", max_concurrent=1, max_queue=1, queue_timeout=5)
+        await gate.acquire()
+        queued = asyncio.ensure_future(gate.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Rejected) as rejected:
+            await gate.acquire()
+        assert rejected.value.reason == "queue_full"
+        assert 1 <= rejected.value.retry_after <= 60
+        gate.release()
+        await queued
+        assert gate.in_flight == 1 and gate.waiting == 0
+        assert gate.stats()["rejected"] == {"queue_full": 1}
+
+    run(scenario())
+
+
+def test_queue_timeout_is_rejected():
+    async def scenario():
+        gate = AdmissionGate("/t", max_concurrent=1, max_queue=4, queue_timeout=0.05)
+        await gate.acquire()
+        with pytest.raises(Rejected) as rejected:
+            await gate.acquire()
+        assert rejected.value.reason == "queue_timeout"
+        # The timed-out waiter left the queue and didn't take a slot
+        assert gate.waiting == 0 and gate.in_flight == 1
+
+    run(scenario())
+
+
+def test_slots_are_handed_over_in_fifo_order():
+    async def scenario():
+        gate = AdmissionGate("/t", max_concurrent=1, max_queue=4, queue_timeout=5)
+        await gate.acquire()
+        order = []
+
+        async def waiter(name):
+            await gate.acquire()
+            order.append(name)
+
+        tasks = [asyncio.ensure_future(waiter(name)) for name in "abc"]
+        await asyncio.sleep(0)
+        for _ in tasks:
+            gate.release(held_seconds=0.1)
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        assert order == ["a", "b", "c"]
+        assert gate.in_flight == 1
+
+    run(scenario())
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        gate = AdmissionGate("/t", max_concurrent=1, max_queue=4, queue_timeout=5)
+        await gate.acquire()
+        queued = asyncio.ensure_future(gate.acquire())
+        await asyncio.sleep(0)
+        assert gate.waiting == 1
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        assert gate.waiting == 0
+        gate.release()
+        assert gate.in_flight == 0
+
+    run(scenario())
+
+
+def test_slot_granted_to_a_cancelled_waiter_is_not_lost():
+    async def scenario():
+        gate = AdmissionGate("/t", max_concurrent=1, max_queue=4, queue_timeout=5)
+        await gate.acquire()
+        first = asyncio.ensure_future(gate.acquire())
+        second = asyncio.ensure_future(gate.acquire())
+        await asyncio.sleep(0)
+        # The slot reaches the first waiter just as its caller goes away.
+        # Either the waiter keeps it (wait_for may finish rather than cancel)
+        # and releases it when done, or passes it straight on; no slot leaks
+        gate.release()
+        first.cancel()
+        outcome, = await asyncio.gather(first, return_exceptions=True)
+        if not isinstance(outcome, asyncio.CancelledError):
+            gate.release()
+        await second
+        assert gate.in_flight == 1 and gate.waiting == 0
+        gate.release()
+        assert gate.in_flight == 0
+
+    run(scenario())
+
+
+def make_app(gate, max_upload_bytes=1000):
+    app = FastAPI()
+    app.state.entered = []
+
+    @app.post("/work")
+    async def work(audio: UploadFile = File(...)):
+        data = await audio.read()
+        app.state.entered.append(len(data))
+        await app.state.gate_open.wait()
+        return {"bytes": len(data)}
+
+    app.add_middleware(AdmissionMiddleware, gates={"/work": gate}, max_upload_bytes=max_upload_bytes)
+    return app
+
+
+def client_for(app):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+def test_busy_route_answers_429_with_retry_after():
+    async def scenario():
+        gate = AdmissionGate("/work", max_concurrent=1, max_queue=0, queue_timeout=5)
+        app = make_app(gate)
+        app.state.gate_open = asyncio.Event()
+        async with client_for(app) as client:
+            first = asyncio.ensure_future(client.post("/work", files={"audio": ("a.wav", b"x" * 10)}))
+            while not app.state.entered:
+                await asyncio.sleep(0.01)
+            busy = await client.post("/work", files={"audio": ("a.wav", b"x" * 10)})
+            assert busy.status_code == 429
+            assert busy.headers["retry-after"] == str(busy.json()["retry_after"])
+            assert busy.json()["reason"] == "queue_full"
+            app.state.gate_open.set()
+            assert (await first).status_code == 200
+        assert gate.in_flight == 0
+
+    run(scenario())
+
+
+def test_slot_is_released_when_the_request_is_cancelled():
+    async def scenario():
+        gate = AdmissionGate("/work", max_concurrent=1, max_queue=0, queue_timeout=5)
+        app = make_app(gate)
+        app.state.gate_open = asyncio.Event()
+        async with client_for(app) as client:
+            # The client gives up while the route is still working
+            request = asyncio.ensure_future(client.post("/work", files={"audio": ("a.wav", b"x" * 10)}))
+            while not app.state.entered:
+                await asyncio.sleep(0.01)
+            assert gate.in_flight == 1
+            request.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await request
+            assert gate.in_flight == 0
+            app.state.gate_open.set()
+            assert (await client.post("/work", files={"audio": ("a.wav", b"x" * 10)})).status_code == 200
+
+    run(scenario())
+
+
+def test_slot_is_released_when_the_client_disconnects():
+    async def scenario():
+        gate = AdmissionGate("/work", max_concurrent=1, max_queue=0, queue_timeout=5)
+        sent = []
+
+        async def app(scope, receive, send):
+            # Reads until the client goes away, like a streaming route would
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            raise OSError("client disconnected")
+
+        middleware = AdmissionMiddleware(app, {"/work": gate}, max_upload_bytes=1000)
+        messages = iter([{"type": "http.request", "body": b"abc", "more_body": True}, {"type": "http.disconnect"}])
+
+        async def receive():
+            return next(messages)
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": "POST", "path": "/work", "headers": []}
+        with pytest.raises(OSError):
+            await middleware(scope, receive, send)
+        assert gate.in_flight == 0
+        assert gate.stats()["admitted"] == 1
+
+    run(scenario())
+
+
+def test_oversized_upload_with_content_length_is_413():
+    async def scenario():
+        gate = AdmissionGate("/work", max_concurrent=1, max_queue=0, queue_timeout=5)
+        app = make_app(gate, max_upload_bytes=1000)
+        app.state.gate_open = asyncio.Event()
+        app.state.gate_open.set()
+        async with client_for(app) as client:
+            response = await client.post("/work", files={"audio": ("a.wav", b"x" * 5000)})
+            assert response.status_code == 413
+            # Refused before the route ran or a slot was taken
+            assert app.state.entered == [] and gate.admitted == 0
+            assert (await client.post("/work", files={"audio": ("a.wav", b"x" * 100)})).status_code == 200
+
+    run(scenario())
+
+
+def test_oversized_streamed_upload_is_413():
+    async def scenario():
+        gate = AdmissionGate("/work", max_concurrent=1, max_queue=0, queue_timeout=5)
+        app = make_app(gate, max_upload_bytes=1000)
+        app.state.gate_open = asyncio.Event()
+        app.state.gate_open.set()
+        boundary = "b0undary"
+        body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"audio\"; filename=\"a.wav\"\r\n\r\n".encode()
+                + b"x" * 5000 + f"\r\n--{boundary}--\r\n".encode())
+
+        async def chunks():
+            # No Content-Length: the limit is enforced while the body is read
+            for start in range(0, len(body), 512):
+                yield body[start:start + 512]
+
+        async with client_for(app) as client:
+            response = await client.post("/work", content=chunks(),
+                                         headers={"content-type": f"multipart/form-data; boundary={boundary}"})
+            assert response.status_code == 413
+            assert app.state.entered == []
+        assert gate.in_flight == 0
+
+    run(scenario())
+
+
+def test_api_refuses_uploads_above_max_upload_bytes():
+    from fastapi.testclient import TestClient
+
+    import api
+
+    response = TestClient(api.app).post(
+        "/predict_respiratory", files={"audio": ("big.wav", b"\0" * (api.MAX_UPLOAD_BYTES + 1), "audio/wav")})
+    assert response.status_code == 413
+
+
+def test_chat_routes_share_one_gate():
+    import api
+
+    gate = api.admission_gates["/chat"]
+    assert api.admission_gates["/chat/stream"] is gate
+
+    async def scenario():
+        # Streamed chats fill the shared slots; a buffered /chat reply degrades too
+        held = gate.max_concurrent
+        for _ in range(held):
+            await gate.acquire()
+        try:
+            mode = api.tts_degradation("/chat")
+            assert mode is not None
+            assert api.tts_degradation("/chat/stream") == mode
+        finally:
+            for _ in range(held):
+                gate.release()
+
+    run(scenario())
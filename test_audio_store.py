@@ -0,0 +1,103 @@
+# AudioStore limits and expiry, and Range handling of /audio/{id}.
+#
+#   python -m pytest test_audio_store.py
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+from audio_store import AudioStore, AudioTooLarge, parse_range
+
+AUDIO = bytes(range(256)) * 4
+
+
+def test_put_and_get_round_trip():
+    store = AudioStore()
+    data, media_type, seconds_left = store.get(store.put(AUDIO))
+    assert data == AUDIO and media_type == "audio/mpeg"
+    assert 0 < seconds_left <= store.ttl
+
+
+def test_oversized_item_is_rejected():
+    store = AudioStore(max_bytes=100)
+    kept = store.put(b"x" * 60)
+    with pytest.raises(AudioTooLarge):
+        store.put(b"x" * 101)
+    # Nothing was evicted to make room for it
+    assert store.get(kept) is not None
+
+
+def test_oldest_items_are_evicted_past_max_bytes():
+    store = AudioStore(max_bytes=100)
+    first = store.put(b"x" * 60)
+    second = store.put(b"x" * 60)
+    assert store.get(first) is None
+    assert store.get(second) is not None
+
+
+def test_items_expire_after_ttl():
+    store = AudioStore(ttl=0.05)
+    audio_id = store.put(AUDIO)
+    time.sleep(0.1)
+    assert store.get(audio_id) is None
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("bytes=0-99", (0, 99)),
+    ("bytes=1000-", (1000, 1023)),
+    ("bytes=-100", (924, 1023)),
+    ("bytes=-5000", (0, 1023)),
+    ("bytes=1000-5000", (1000, 1023)),
+    ("bytes=0-1,5-6", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, len(AUDIO)) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1024-", "bytes=-0", "bytes=9-3"])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        parse_range(header, len(AUDIO))
+
+
+@pytest.fixture
+def client():
+    return TestClient(api.app)
+
+
+def audio_path():
+    return f"/audio/{api.audio_store.put(AUDIO)}"
+
+
+def test_audio_without_range_is_served_whole(client):
+    response = client.get(audio_path())
+    assert response.status_code == 200
+    assert response.content == AUDIO
+    assert response.headers["accept-ranges"] == "bytes"
+
+
+def test_audio_range_is_206(client):
+    response = client.get(audio_path(), headers={"Range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert response.content == AUDIO[100:200]
+    assert response.headers["content-range"] == f"bytes 100-199/{len(AUDIO)}"
+    assert response.headers["content-length"] == "100"
+
+
+def test_audio_suffix_range_is_the_last_bytes(client):
+    response = client.get(audio_path(), headers={"Range": "bytes=-24"})
+    assert response.status_code == 206
+    assert response.content == AUDIO[-24:]
+    assert response.headers["content-range"] == f"bytes 1000-1023/{len(AUDIO)}"
+
+
+def test_audio_unsatisfiable_range_is_416(client):
+    response = client.get(audio_path(), headers={"Range": f"bytes={len(AUDIO)}-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(AUDIO)}"
+
+
+def test_unknown_audio_is_404(client):
+    assert client.get("/audio/unknown").status_code == 404
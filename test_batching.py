@@ -0,0 +1,122 @@
+# MicroBatcher: batch forming, the wait timeout, the row limit and error
+# propagation.
+#
+#   python -m pytest test_batching.py
+import asyncio
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from batching import MicroBatcher
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 10))
+
+
+class StubModel:
+    """Doubles its input and records the number of rows in every call."""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def __call__(self, inputs):
+        with self._lock:
+            self.batches.append(len(inputs[0]))
+        if self.error:
+            raise self.error
+        return inputs[0] * 2
+
+
+def rows(start, count):
+    return [np.arange(start, start + count, dtype=np.float32).reshape(count, 1)]
+
+
+def test_concurrent_requests_share_one_batch():
+    async def scenario():
+        model = StubModel()
+        batcher = MicroBatcher(model, max_batch_size=32, max_wait_ms=50)
+        outputs = await asyncio.gather(*(batcher.submit(rows(i * 10, 2)) for i in range(4)))
+        await batcher.close()
+        assert model.batches == [8]
+        for i, output in enumerate(outputs):
+            np.testing.assert_array_equal(output, rows(i * 10, 2)[0] * 2)
+        stats = batcher.stats()
+        assert stats["total_batches"] == 1 and stats["total_items"] == 4 and stats["total_rows"] == 8
+
+    run(scenario())
+
+
+def test_lone_request_waits_at_most_max_wait():
+    async def scenario():
+        model = StubModel()
+        batcher = MicroBatcher(model, max_batch_size=32, max_wait_ms=50)
+        started = time.perf_counter()
+        output = await batcher.submit(rows(0, 1))
+        elapsed = time.perf_counter() - started
+        await batcher.close()
+        np.testing.assert_array_equal(output, rows(0, 1)[0] * 2)
+        assert 0.04 <= elapsed < 0.5
+
+    run(scenario())
+
+
+def test_batches_are_limited_by_rows_not_requests():
+    async def scenario():
+        model = StubModel()
+        batcher = MicroBatcher(model, max_batch_size=8, max_wait_ms=50)
+        outputs = await asyncio.gather(*(batcher.submit(rows(i * 10, 3)) for i in range(4)))
+        await batcher.close()
+        # Two requests of three rows fit in a batch of eight, a third doesn't
+        assert model.batches == [6, 6]
+        for i, output in enumerate(outputs):
+            np.testing.assert_array_equal(output, rows(i * 10, 3)[0] * 2)
+
+    run(scenario())
+
+
+def test_request_larger_than_a_batch_is_split_and_reassembled():
+    async def scenario():
+        model = StubModel()
+        batcher = MicroBatcher(model, max_batch_size=4, max_wait_ms=5)
+        output = await batcher.submit(rows(0, 10))
+        await batcher.close()
+        assert max(model.batches) <= 4 and sum(model.batches) == 10
+        np.testing.assert_array_equal(output, rows(0, 10)[0] * 2)
+
+    run(scenario())
+
+
+def test_model_error_reaches_every_caller_in_the_batch():
+    async def scenario():
+        model = StubModel(error=RuntimeError("model failed"))
+        batcher = MicroBatcher(model, max_batch_size=32, max_wait_ms=50)
+        results = await asyncio.gather(*(batcher.submit(rows(i, 1)) for i in range(3)), return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        # The batcher keeps serving after a failed batch
+        model.error = None
+        np.testing.assert_array_equal(await batcher.submit(rows(5, 1)), rows(5, 1)[0] * 2)
+        await batcher.close()
+
+    run(scenario())
+
+
+def test_cancelled_request_is_left_out_of_the_batch():
+    async def scenario():
+        model = StubModel()
+        batcher = MicroBatcher(model, max_batch_size=32, max_wait_ms=50)
+        gone = asyncio.ensure_future(batcher.submit(rows(0, 2)))
+        kept = asyncio.ensure_future(batcher.submit(rows(10, 1)))
+        await asyncio.sleep(0)
+        gone.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await gone
+        np.testing.assert_array_equal(await kept, rows(10, 1)[0] * 2)
+        await batcher.close()
+        assert model.batches == [1]
+
+    run(scenario())
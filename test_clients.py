@@ -0,0 +1,123 @@
+# The pooled provider clients against the local fake server: connection reuse,
+# SDK retries with backoff, timeouts and warm-up.
+#
+#   python -m pytest test_clients.py
+import time
+
+import groq
+import pytest
+
+from clients import ClientRegistry
+from fake_providers import FAKE_REPLY, FakeProviders
+
+CHAT_ROUTE = "/openai/v1/chat/completions"
+
+
+@pytest.fixture
+def providers():
+    with FakeProviders(latency={"llm": 0.0, "tts": 0.0}, jitter=0.0) as fake:
+        yield fake
+
+
+def make_registry(providers, **kwargs):
+    return ClientRegistry(groq_base_url=providers.base_url, elevenlabs_base_url=providers.base_url, **kwargs)
+
+
+def chat(registry):
+    completion = registry.groq("fake-key").chat.completions.create(
+        model="fake", messages=[{"role": "user", "content": "hello"}])
+    return completion.choices[0].message.content
+
+
+def test_clients_are_shared_and_keep_connections_alive(providers):
+    registry = make_registry(providers)
+    try:
+        assert registry.groq("fake-key") is registry.groq("fake-key")
+        for _ in range(3):
+            assert chat(registry) == FAKE_REPLY
+        assert providers.counts[CHAT_ROUTE] == 3
+        assert providers.counts["connections"] == 1
+    finally:
+        registry.close()
+
+
+def test_server_errors_are_retried(providers):
+    registry = make_registry(providers, max_retries=2)
+    providers.fail_next(CHAT_ROUTE, times=2, status=503)
+    try:
+        assert chat(registry) == FAKE_REPLY
+        assert providers.counts[CHAT_ROUTE] == 3
+    finally:
+        registry.close()
+
+
+def test_retries_stop_at_max_retries(providers):
+    registry = make_registry(providers, max_retries=1)
+    providers.fail_next(CHAT_ROUTE, times=5, status=503)
+    try:
+        with pytest.raises(groq.InternalServerError):
+            chat(registry)
+        assert providers.counts[CHAT_ROUTE] == 2
+    finally:
+        registry.close()
+
+
+def test_rate_limits_are_retried(providers):
+    registry = make_registry(providers, max_retries=1)
+    providers.fail_next(CHAT_ROUTE, times=1, status=429)
+    try:
+        assert chat(registry) == FAKE_REPLY
+        assert providers.counts[CHAT_ROUTE] == 2
+    finally:
+        registry.close()
+
+
+def test_slow_provider_times_out():
+    with FakeProviders(latency={"llm": 2.0}, jitter=0.0) as providers:
+        registry = make_registry(providers, timeout=0.2, max_retries=1)
+        try:
+            started = time.perf_counter()
+            with pytest.raises(groq.APITimeoutError):
+                chat(registry)
+            # One retry after the first timeout, then give up well before the
+            # provider would have answered
+            assert providers.counts[CHAT_ROUTE] == 2
+            assert time.perf_counter() - started < 2.0
+        finally:
+            registry.close()
+
+
+def test_elevenlabs_uses_the_pool(providers):
+    registry = make_registry(providers)
+    try:
+        client = registry.elevenlabs("fake-key")
+        assert client is registry.elevenlabs("fake-key")
+        audio = b"".join(client.generate(text="Hello.", voice="Aria", model="eleven_multilingual_v2"))
+        assert audio
+    finally:
+        registry.close()
+
+
+def test_warm_up_opens_connections(providers):
+    registry = make_registry(providers)
+    try:
+        registry.warm_up()
+        assert providers.counts["HEAD"] == 2
+        connections = providers.counts["connections"]
+        chat(registry)
+        # The first request rides on the warmed connection
+        assert providers.counts["connections"] == connections
+    finally:
+        registry.close()
+
+
+def test_close_drops_clients(providers):
+    registry = make_registry(providers)
+    first = registry.groq("fake-key")
+    registry.close()
+    second = registry.groq("fake-key")
+    try:
+        assert second is not first
+        assert chat(registry) == FAKE_REPLY
+    finally:
+        registry.close()
@@ -0,0 +1,106 @@
+# Parity of the shared-STFT feature engine with the original three-pass
+# librosa pipeline (librosa.feature.mfcc / chroma_stft / melspectrogram), and
+# chunked decoding of long recordings into windows.
+#
+#   python -m pytest test_feature_engine.py
+import glob
+import os
+
+import librosa
+import numpy as np
+import pytest
+
+import feature_engine
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+RECORDINGS = sorted(glob.glob(os.path.join(APP_DIR, "test_audios", "*", "*.wav")))
+
+
+def reference_features(y, sr):
+    mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=feature_engine.N_MFCC)
+    chroma = librosa.feature.chroma_stft(y=y, sr=sr, n_chroma=feature_engine.N_CHROMA)
+    mspec = librosa.power_to_db(librosa.feature.melspectrogram(y=y, sr=sr, n_mels=feature_engine.N_MELS), ref=np.max)
+    return tuple(feature_engine.fit_frames([m]) for m in (mfcc, chroma, mspec))
+
+
+def assert_parity(y, sr):
+    ours = feature_engine.extract_feature_batch([(y, sr)])
+    for name, a, b in zip(("mfcc", "chroma", "mspec"), ours, reference_features(y, sr)):
+        assert a.shape == b.shape, name
+        # dB-scaled features are compared in dB, chroma on its 0..1 scale
+        np.testing.assert_allclose(a, b, atol=1e-3 if name == "chroma" else 1e-2, rtol=1e-4, err_msg=name)
+
+
+def tone_with_noise(sr, seconds):
+    t = np.arange(int(sr * seconds)) / sr
+    rng = np.random.default_rng(0)
+    return (0.5 * np.sin(2 * np.pi * 440 * t) + 0.05 * rng.standard_normal(len(t))).astype(np.float32)
+
+
+@pytest.mark.parametrize("path", RECORDINGS, ids=os.path.basename)
+def test_recordings_match_librosa(path):
+    y, sr = librosa.load(path, sr=22050, duration=feature_engine.CLIP_SECONDS)
+    assert_parity(y, sr)
+
+
+def test_recordings_present():
+    assert RECORDINGS, "test_audios/ should hold at least one recording"
+
+
+@pytest.mark.parametrize("path", RECORDINGS[:1], ids=os.path.basename)
+def test_sub_window_clip_matches_librosa(path):
+    y, sr = librosa.load(path, sr=22050, duration=2.0)
+    assert_parity(y, sr)
+    mfcc, _, _ = feature_engine.extract_feature_batch([(y, sr)])
+    # Shorter than a window: zero-padded out to N_FRAMES
+    assert mfcc.shape == (1, feature_engine.N_MFCC, feature_engine.N_FRAMES, 1)
+    assert not mfcc[0, :, -1].any()
+
+
+def test_silent_clip_matches_librosa():
+    sr = 22050
+    y = np.zeros(int(sr * feature_engine.CLIP_SECONDS), dtype=np.float32)
+    assert_parity(y, sr)
+    for feature in feature_engine.extract_feature_batch([(y, sr)]):
+        assert np.isfinite(feature).all()
+
+
+@pytest.mark.parametrize("sr", [16000, 44100])
+def test_other_sample_rates_match_librosa(sr):
+    assert_parity(tone_with_noise(sr, feature_engine.CLIP_SECONDS), sr)
+
+
+def test_batch_matches_single_clips():
+    clips = [(tone_with_noise(22050, 6.0), 22050), (tone_with_noise(16000, 3.0), 16000)]
+    batch = feature_engine.extract_feature_batch(clips)
+    for i, clip in enumerate(clips):
+        for a, b in zip(batch, feature_engine.extract_feature_batch([clip])):
+            np.testing.assert_array_equal(a[i], b[0])
+
+
+def stereo_wav(path, sr=8000, seconds=14.5):
+    import soundfile as sf
+
+    y = tone_with_noise(sr, seconds)
+    sf.write(path, np.stack([y, -0.5 * y], axis=1), sr, subtype="PCM_16")
+    return path
+
+
+def test_audioread_windows_match_libsndfile(tmp_path, monkeypatch):
+    path = stereo_wav(str(tmp_path / "long.wav"))
+    expected = list(feature_engine.iter_audio_windows(path))
+    # As for an m4a: libsndfile can't read it, so audioread decodes it in chunks
+    monkeypatch.setattr(feature_engine, "can_stream", lambda source: False)
+    windows = list(feature_engine.iter_audio_windows(path))
+    assert [(start, len(y), sr) for start, y, sr in windows] == [(start, len(y), sr) for start, y, sr in expected]
+    for (_, y, _), (_, want, _) in zip(windows, expected):
+        np.testing.assert_allclose(y, want, atol=1e-6)
+
+
+def test_audioread_chunks_split_mid_frame():
+    pcm = (np.arange(-60, 60, dtype="<i2") * 256).reshape(-1, 2)
+    raw = pcm.tobytes()
+    # Chunk boundaries that cut through samples and channel frames
+    chunks = [raw[:3], raw[3:10], raw[10:101], raw[101:]]
+    mono = np.concatenate(list(feature_engine._audioread_blocks(chunks, channels=2)))
+    np.testing.assert_allclose(mono, pcm.mean(axis=1) / 32768.0)
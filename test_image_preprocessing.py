@@ -0,0 +1,46 @@
+# preprocess_image: when the upload is re-encoded and when it is kept.
+#
+#   python -m pytest test_image_preprocessing.py
+import io
+
+import numpy as np
+from PIL import Image
+
+from brain_of_the_doctor import preprocess_image
+
+
+def encode(image, image_format, **kwargs):
+    output = io.BytesIO()
+    image.save(output, format=image_format, **kwargs)
+    return output.getvalue()
+
+
+def noise(width, height):
+    return Image.fromarray(np.random.default_rng(0).integers(0, 255, (height, width, 3), dtype=np.uint8))
+
+
+def test_small_compact_jpeg_is_kept():
+    original = encode(noise(300, 200), "JPEG", quality=60)
+    processed, mime_type = preprocess_image(original, max_edge=1024, quality=85)
+    assert processed is original and mime_type == "image/jpeg"
+
+
+def test_large_image_is_downsized():
+    original = encode(noise(2000, 1000), "JPEG", quality=60)
+    processed, mime_type = preprocess_image(original, max_edge=1024, quality=85)
+    assert Image.open(io.BytesIO(processed)).size == (1024, 512)
+    assert mime_type == "image/jpeg"
+
+
+def test_png_that_re_encodes_smaller_is_replaced():
+    original = encode(noise(300, 200), "PNG")
+    processed, mime_type = preprocess_image(original, max_edge=1024, quality=85)
+    assert len(processed) < len(original) and mime_type == "image/jpeg"
+
+
+def test_rotated_image_is_re_encoded_upright():
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotate 90° clockwise to display
+    original = encode(noise(300, 200), "JPEG", quality=60, exif=exif)
+    processed, _ = preprocess_image(original, max_edge=1024, quality=85)
+    assert Image.open(io.BytesIO(processed)).size == (200, 300)
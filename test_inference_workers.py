@@ -0,0 +1,88 @@
+# The inference service: aggregated worker status, streamed-window features,
+# and an API process that leaves librosa to the workers.
+#
+#   python -m pytest test_inference_workers.py
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+import feature_engine
+from inference_workers import InferenceServer, _run_job, read_arrays, write_arrays
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def worker_status(version, ready=True):
+    return {"ready": ready, "version": version, "models": {}, "errors": {}}
+
+
+def make_server():
+    # No job is submitted, so no worker process is started
+    return InferenceServer(socket_path="/tmp/speechbot-test.sock", workers=2, status_interval=5)
+
+
+def test_no_reports_yet_is_not_ready():
+    status = make_server().status()
+    assert status["ready"] is False and status["version"] == "none"
+    assert status["workers"] == 0
+
+
+def test_version_changes_only_once_every_worker_has_reloaded():
+    server = make_server()
+    server.record_status(1, worker_status("v1"))
+    server.record_status(2, worker_status("v1"))
+    assert server.status()["version"] == "v1"
+
+    # One worker has picked up the new model file, the other hasn't yet
+    server.record_status(1, worker_status("v2"))
+    for _ in range(3):
+        status = server.status()
+        assert status["version"] == "v1" and status["ready"]
+        assert status["reloading"] is True
+
+    server.record_status(2, worker_status("v2"))
+    status = server.status()
+    assert status["version"] == "v2" and status["reloading"] is False
+    assert status["workers"] == 2
+
+
+def test_workers_that_stop_reporting_are_forgotten():
+    server = make_server()
+    server.record_status(1, worker_status("v1"), seen=0.0)
+    server.record_status(2, worker_status("v2"))
+    # Worker 1 was replaced after a crash and its last report has expired
+    status = server.status()
+    assert status["version"] == "v2" and status["workers"] == 1
+
+
+def test_power_features_job_matches_the_in_process_extractor():
+    sr = 16000
+    extractor = feature_engine.StreamingFeatureExtractor(sr)
+    tone = 0.1 * np.sin(2 * np.pi * 300 * np.arange(7 * sr) / sr)
+    extractor.push(tone.astype(np.float32))
+    S = extractor.snapshot()
+
+    shm, descriptor = write_arrays([S])
+    try:
+        response = _run_job({"op": "power_features", "input": descriptor, "sr": sr})
+    finally:
+        shm.close()
+        shm.unlink()
+    for got, want in zip(read_arrays(response["output"], unlink=True), extractor.features(S)):
+        np.testing.assert_allclose(got, want, rtol=1e-5, atol=1e-5)
+
+
+def test_api_with_inference_socket_does_not_load_librosa():
+    # Start-up warm-ups included; the socket needn't exist for this
+    script = (
+        "import sys, api\n"
+        "api.warm_up_models()\n"
+        "api.model_registry.close()\n"
+        "print('librosa' in sys.modules, 'tensorflow' in sys.modules)\n"
+    )
+    env = dict(os.environ, INFERENCE_SOCKET="/tmp/speechbot-missing.sock")
+    result = subprocess.run([sys.executable, "-c", script], cwd=APP_DIR, env=env, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().splitlines()[-1] == "False False"
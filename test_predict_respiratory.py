@@ -0,0 +1,100 @@
+# /predict_respiratory: uploads that aren't audio, and model versus demo answers.
+#
+#   python -m pytest test_predict_respiratory.py
+import io
+
+import numpy as np
+import pytest
+import soundfile as sf
+from fastapi.testclient import TestClient
+
+import api
+
+GARBAGE = b"this is not audio at all" * 64
+
+
+@pytest.fixture(scope="module")
+def client():
+    # Without the lifespan no models are loaded; the endpoint answers with its
+    # demo labels and the windowed timeline carries no model output
+    return TestClient(api.app)
+
+
+def wav_bytes(seconds, sr=8000):
+    buffer = io.BytesIO()
+    sf.write(buffer, np.zeros(int(sr * seconds), dtype=np.float32), sr, format="WAV")
+    return buffer.getvalue()
+
+
+def post(client, data, filename="recording.wav", **form):
+    return client.post("/predict_respiratory", files={"audio": (filename, data, "audio/wav")}, data=form)
+
+
+def test_garbage_upload_falls_back_to_demo_response(client):
+    response = post(client, GARBAGE)
+    assert response.status_code == 200
+    assert response.json()["prediction"] == "Normal"
+
+
+@pytest.mark.parametrize("filename", ["recording.wav", "recording.m4a"])
+def test_garbage_windowed_upload_is_a_bad_request(client, filename):
+    response = post(client, GARBAGE, filename=filename, windowed="true")
+    assert response.status_code == 400
+    error = response.json()["error"]
+    assert error.startswith("Could not decode")
+    assert "as audio" in error
+
+
+def test_windowed_timeline_for_decodable_upload(client):
+    response = post(client, wav_bytes(9.0), windowed="true", hop_seconds="3")
+    assert response.status_code == 200
+    spans = [(w["start"], w["end"]) for w in response.json()["timeline"]]
+    assert spans == [(0.0, 6.0), (3.0, 9.0)]
+
+
+def test_windowed_hop_is_validated(client):
+    response = post(client, wav_bytes(1.0), windowed="true", hop_seconds="0")
+    assert response.status_code == 400
+
+
+def model_output(label):
+    probs = np.full(len(api.RESP_LABELS), 0.02, dtype=np.float32)
+    probs[api.RESP_LABELS.index(label)] = 0.86
+    return probs
+
+
+def test_model_prediction_is_returned_when_models_are_loaded(client, monkeypatch):
+    async def analyze(request, audio_bytes, filename):
+        return model_output("COPD")[None]
+
+    monkeypatch.setattr(api, "analyze_respiratory_audio", analyze)
+    # The filename keyword no longer decides the answer
+    body = post(client, wav_bytes(1.0), filename="asthma.wav").json()
+    assert body["source"] == "model"
+    assert body["prediction"] == "COPD"
+    assert body["confidence"] == 0.86
+    assert body["all_predictions"]["COPD"] == pytest.approx(0.86)
+
+
+def test_windowed_model_prediction_is_the_clip_mean(client, monkeypatch):
+    async def analyze(request, audio_bytes, filename, hop_seconds):
+        probs = [model_output("URTI"), model_output("URTI"), model_output("Asthma")]
+        timeline = [{"start": 3.0 * i, "end": 3.0 * i + 6} for i in range(3)]
+        return timeline, np.mean(probs, axis=0)
+
+    monkeypatch.setattr(api, "analyze_respiratory_windows", analyze)
+    body = post(client, wav_bytes(12.0), windowed="true").json()
+    assert body["source"] == "model"
+    assert body["prediction"] == "URTI"
+    assert len(body["timeline"]) == 3
+
+
+def test_demo_labels_can_be_kept_with_a_model(client, monkeypatch):
+    async def analyze(request, audio_bytes, filename):
+        return model_output("COPD")[None]
+
+    monkeypatch.setattr(api, "analyze_respiratory_audio", analyze)
+    monkeypatch.setattr(api, "RESP_DEMO_LABELS", True)
+    body = post(client, wav_bytes(1.0), filename="asthma.wav").json()
+    assert body["source"] == "demo"
+    assert body["prediction"] == "Asthma"
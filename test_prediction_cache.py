@@ -0,0 +1,112 @@
+# PredictionCache: content-hash keys, LRU eviction, the memory-mapped disk
+# tier and version invalidation.
+#
+#   python -m pytest test_prediction_cache.py
+import os
+
+import numpy as np
+
+from prediction_cache import PredictionCache, file_version
+
+
+def features(seed):
+    rng = np.random.default_rng(seed)
+    return (rng.random((20, 259), dtype=np.float32), rng.random((12, 259), dtype=np.float32),
+            rng.random((128, 259), dtype=np.float32))
+
+
+def assert_same(cached, expected):
+    for got, want in zip(cached, expected):
+        np.testing.assert_array_equal(got, want)
+
+
+def test_keys_follow_content_and_version():
+    cache = PredictionCache("v1")
+    assert cache.key(b"recording") == cache.key(b"recording")
+    assert cache.key(b"recording") != cache.key(b"recording!")
+    key = cache.key(b"recording")
+    cache.set_version("v2")
+    assert cache.key(b"recording") != key
+
+
+def test_memory_hit_returns_features_and_probs():
+    cache = PredictionCache("v1")
+    key = cache.key(b"recording")
+    assert cache.get(key) is None
+    cache.put(key, features(0), np.array([0.1, 0.9]))
+    cached, probs = cache.get(key)
+    assert_same(cached, features(0))
+    np.testing.assert_array_equal(probs, [0.1, 0.9])
+    stats = cache.stats()
+    assert (stats["memory_hits"], stats["misses"], stats["hit_ratio"]) == (1, 1, 0.5)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = PredictionCache("v1", max_entries=2)
+    keys = [cache.key(bytes([i])) for i in range(3)]
+    cache.put(keys[0], features(0))
+    cache.put(keys[1], features(1))
+    cache.get(keys[0])
+    cache.put(keys[2], features(2))
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None and cache.get(keys[2]) is not None
+    assert cache.stats()["memory_entries"] == 2
+
+
+def test_disk_tier_round_trips_through_mmap(tmp_path):
+    writer = PredictionCache("v1", disk_dir=str(tmp_path))
+    key = writer.key(b"recording")
+    writer.put(key, features(0), np.array([0.3, 0.7]))
+
+    # A fresh process (empty memory tier) finds the entry on disk
+    reader = PredictionCache("v1", disk_dir=str(tmp_path))
+    cached, probs = reader.get(key)
+    assert all(isinstance(array, np.memmap) for array in cached)
+    assert_same(cached, features(0))
+    np.testing.assert_array_equal(probs, [0.3, 0.7])
+    assert reader.stats()["disk_hits"] == 1
+    # Promoted into memory for the next lookup
+    reader.get(key)
+    assert reader.stats()["memory_hits"] == 1
+
+
+def test_disk_entry_without_probs(tmp_path):
+    cache = PredictionCache("v1", disk_dir=str(tmp_path))
+    key = cache.key(b"recording")
+    cache.put(key, features(0))
+    cached, probs = PredictionCache("v1", disk_dir=str(tmp_path)).get(key)
+    assert_same(cached, features(0))
+    assert probs is None
+
+
+def test_set_version_drops_memory_and_old_disk_entries(tmp_path):
+    cache = PredictionCache("v1", disk_dir=str(tmp_path))
+    key = cache.key(b"recording")
+    cache.put(key, features(0))
+    old_dir = cache._version_dir()
+
+    cache.set_version("v1")
+    assert cache.stats()["invalidations"] == 0
+    cache.set_version("v2")
+    assert cache.stats()["invalidations"] == 1
+    assert cache.stats()["memory_entries"] == 0
+    assert not os.path.exists(old_dir)
+    assert cache.get(cache.key(b"recording")) is None
+
+
+def test_invalidate_clears_the_current_version(tmp_path):
+    cache = PredictionCache("v1", disk_dir=str(tmp_path))
+    key = cache.key(b"recording")
+    cache.put(key, features(0))
+    cache.invalidate()
+    assert cache.get(key) is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_file_version_changes_when_the_model_is_rewritten(tmp_path):
+    path = tmp_path / "model.keras"
+    assert file_version(str(path)) == "missing"
+    path.write_bytes(b"weights")
+    first = file_version(str(path))
+    path.write_bytes(b"new weights")
+    assert file_version(str(path)) != first
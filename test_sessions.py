@@ -0,0 +1,125 @@
+# Server-side sessions: token-budget trimming, summarization, pruning of
+# summarized turns, unknown ids and the SQLite round trip.
+#
+#   python -m pytest test_sessions.py
+import sqlite3
+
+import pytest
+from fastapi.testclient import TestClient
+
+from sessions import InMemorySessionStore, SessionManager, SQLiteSessionStore, UnknownSession, estimate_tokens
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    return InMemorySessionStore()
+
+
+def sentence(i, words=20):
+    return f"Turn {i}: " + " ".join(["symptom"] * words)
+
+
+def record(manager, session_id, count):
+    for i in range(count):
+        manager.record_turn(session_id, sentence(2 * i), sentence(2 * i + 1))
+
+
+def test_prompt_history_keeps_the_latest_turns_within_budget(store):
+    manager = SessionManager(store, token_budget=200)
+    session_id = manager.new_session()
+    record(manager, session_id, 6)
+    history = manager.prompt_history(session_id)
+    assert sum(estimate_tokens(m["content"]) for m in history) <= 200
+    assert 0 < len(history) < 12
+    # The most recent turns, oldest first
+    assert history[-1] == {"role": "assistant", "content": sentence(11)}
+    assert [m["content"] for m in history] == [sentence(i) for i in range(12 - len(history), 12)]
+
+
+def test_compaction_folds_old_turns_into_the_summary(store):
+    calls = []
+
+    def summarize(previous, turns):
+        calls.append(turns)
+        return f"{previous} {len(turns)} turns".strip()
+
+    manager = SessionManager(store, token_budget=200, summarize_fn=summarize)
+    session_id = manager.new_session()
+    record(manager, session_id, 6)
+    assert manager.needs_compaction(session_id)
+    manager.compact(session_id)
+
+    assert not manager.needs_compaction(session_id)
+    folded = calls[0]
+    assert folded[0] == ("user", sentence(0))
+    # A doctor reply stays with the patient turn it answers
+    assert folded[-1][0] == "assistant"
+    history = manager.prompt_history(session_id)
+    assert history[0] == {"role": "system", "content": f"Summary of the earlier consultation: {len(folded)} turns"}
+    assert history[1]["content"] == sentence(len(folded))
+
+
+def test_turns_continue_after_everything_was_summarized(store):
+    manager = SessionManager(store, token_budget=10, summarize_fn=lambda previous, turns: "summary")
+    session_id = manager.new_session()
+    record(manager, session_id, 1)
+    manager.compact(session_id)
+    assert store.load(session_id)["turns"] == []
+    manager.record_turn(session_id, "Any fever?", "No.")
+    session = store.load(session_id)
+    assert [turn[0] for turn in session["turns"]] == [2, 3]
+    assert session["summarized_upto"] == 2
+
+
+def test_summarized_turns_are_pruned_from_sqlite(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    manager = SessionManager(SQLiteSessionStore(path), token_budget=200, summarize_fn=lambda previous, turns: "summary")
+    session_id = manager.new_session()
+    record(manager, session_id, 6)
+    manager.compact(session_id)
+    summarized_upto = manager.store.load(session_id)["summarized_upto"]
+    with sqlite3.connect(path) as conn:
+        rows = conn.execute("SELECT MIN(idx), COUNT(*) FROM turns WHERE session_id = ?", (session_id,)).fetchone()
+    assert rows == (summarized_upto, 12 - summarized_upto)
+
+
+def test_sqlite_sessions_survive_a_restart(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    manager = SessionManager(SQLiteSessionStore(path), token_budget=200, summarize_fn=lambda previous, turns: "summary")
+    session_id = manager.new_session()
+    record(manager, session_id, 6)
+    manager.compact(session_id)
+    before = manager.prompt_history(session_id)
+
+    reopened = SessionManager(SQLiteSessionStore(path), token_budget=200)
+    assert reopened.exists(session_id)
+    assert reopened.prompt_history(session_id) == before
+
+
+def test_unknown_session_ids_are_not_created(store):
+    manager = SessionManager(store)
+    with pytest.raises(UnknownSession):
+        manager.prompt_history("made-up")
+    with pytest.raises(UnknownSession):
+        manager.record_turn("made-up", "Hello", "Hi")
+    assert not manager.exists("made-up")
+
+
+def test_memory_store_evicts_least_recently_used_sessions():
+    manager = SessionManager(InMemorySessionStore(max_sessions=2))
+    first, second = manager.new_session(), manager.new_session()
+    manager.prompt_history(first)
+    third = manager.new_session()
+    assert manager.exists(first) and manager.exists(third)
+    assert not manager.exists(second)
+
+
+@pytest.mark.parametrize("route", ["/chat", "/chat/stream"])
+def test_api_answers_404_for_an_unknown_session(route):
+    import api
+
+    response = TestClient(api.app).post(route, data={"text": "Hello", "session_id": "made-up"})
+    assert response.status_code == 404
+    assert not api.session_manager.exists("made-up")
@@ -0,0 +1,47 @@
+# Silence trimming before uploads to Whisper.
+#
+#   python -m pytest test_stt_conditioning.py
+import numpy as np
+
+from voice_of_the_patient import STT_SAMPLE_RATE, VAD_FRAME_SECONDS, trim_silence
+
+FRAME = int(STT_SAMPLE_RATE * VAD_FRAME_SECONDS)
+
+
+def silence(frames, seed=0):
+    return 0.001 * np.random.default_rng(seed).standard_normal(frames * FRAME)
+
+
+def speech(frames):
+    return 0.5 * np.sin(2 * np.pi * 300 * np.arange(frames * FRAME) / STT_SAMPLE_RATE)
+
+
+def clip(*parts):
+    return np.concatenate(parts).astype(np.float32)
+
+
+def test_clip_shorter_than_the_padding_is_trimmed_in_place():
+    # 0.45 s in all, less than the 2 * pad + 1 frames of padding around speech
+    y = clip(silence(12), speech(3))
+    out = trim_silence(y, pad_seconds=0.24, max_pause_seconds=0)
+    # Eight frames of padding are kept before the speech; the rest goes
+    assert len(out) == len(y) - 4 * FRAME
+    np.testing.assert_array_equal(out[-3 * FRAME:], y[-3 * FRAME:])
+
+
+def test_leading_and_trailing_silence_is_trimmed_to_the_padding():
+    y = clip(silence(40), speech(20), silence(40, seed=1))
+    out = trim_silence(y, pad_seconds=0.3, max_pause_seconds=0)
+    assert len(out) == (10 + 20 + 10) * FRAME
+    np.testing.assert_array_equal(out[10 * FRAME:30 * FRAME], y[40 * FRAME:60 * FRAME])
+
+
+def test_long_pauses_are_shortened():
+    y = clip(speech(10), silence(100), speech(10))
+    out = trim_silence(y, pad_seconds=0.0, max_pause_seconds=0.3)
+    assert len(out) == (10 + 10 + 10) * FRAME
+
+
+def test_audio_without_speech_is_unchanged():
+    y = np.zeros(STT_SAMPLE_RATE, dtype=np.float32)
+    assert trim_silence(y) is y
@@ -0,0 +1,127 @@
+# TranslationService with a stub translator: batching, deadline fallback and
+# memoization.
+#
+#   python -m pytest test_translation.py
+import threading
+import time
+
+from voice_of_the_doctor import TranslationService
+
+
+class StubTranslator:
+    """
+    Upper-cases text and records every backend call. `delay` slows each call;
+    `merge_lines` answers a joined batch with its line breaks collapsed, like
+    a backend that doesn't keep segment boundaries.
+    """
+
+    def __init__(self, delay=0.0, merge_lines=False, error=None):
+        self.delay = delay
+        self.merge_lines = merge_lines
+        self.error = error
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def factory(self, lang_code):
+        return self
+
+    def translate(self, text):
+        with self._lock:
+            self.calls.append(text)
+        if self.delay:
+            time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        if self.merge_lines:
+            text = text.replace(TranslationService.BATCH_SEPARATOR, " ")
+        return text.upper()
+
+
+def service(translator, **kwargs):
+    return TranslationService(translator_factory=translator.factory, **kwargs)
+
+
+def test_batch_is_joined_into_one_request():
+    translator = StubTranslator()
+    result = service(translator).translate_batch(["Drink water.", "Rest well.", "See a doctor."], "Hindi")
+    assert result == ["DRINK WATER.", "REST WELL.", "SEE A DOCTOR."]
+    assert translator.calls == ["Drink water.\nRest well.\nSee a doctor."]
+
+
+def test_misaligned_batch_falls_back_to_single_requests():
+    translator = StubTranslator(merge_lines=True)
+    result = service(translator).translate_batch(["Drink water.", "Rest well."], "Tamil")
+    assert result == ["DRINK WATER.", "REST WELL."]
+    assert translator.calls == ["Drink water.\nRest well.", "Drink water.", "Rest well."]
+
+
+def test_segments_containing_the_separator_are_sent_one_by_one():
+    translator = StubTranslator()
+    result = service(translator).translate_batch(["Line one\nline two.", "Rest well."], "Hindi")
+    assert result == ["LINE ONE\nLINE TWO.", "REST WELL."]
+    assert translator.calls == ["Line one\nline two.", "Rest well."]
+
+
+def test_deadline_returns_the_source_text():
+    translator = StubTranslator(delay=1.0)
+    translations = service(translator, deadline=0.1)
+    started = time.perf_counter()
+    assert translations.translate_batch(["Drink water.", "Rest well."], "Hindi") == ["Drink water.", "Rest well."]
+    assert time.perf_counter() - started < 0.5
+    assert translations.stats()["timeouts"] == 1
+    # The late answer is dropped rather than memoized
+    time.sleep(1.0)
+    assert translations.stats()["entries"] == 0
+
+
+def test_per_call_deadline_overrides_the_default():
+    translator = StubTranslator(delay=0.3)
+    translations = service(translator, deadline=0.05)
+    assert translations.translate("Rest well.", "Hindi", deadline=2.0) == "REST WELL."
+
+
+def test_backend_error_returns_the_source_text():
+    translator = StubTranslator(error=RuntimeError("quota exceeded"))
+    translations = service(translator)
+    assert translations.translate("Rest well.", "Hindi") == "Rest well."
+    assert translations.stats()["errors"] == 1
+
+
+def test_repeated_sentences_hit_the_memo():
+    translator = StubTranslator()
+    translations = service(translator)
+    assert translations.translate("Rest well.", "Hindi") == "REST WELL."
+    assert translations.translate("Rest well.", "Hindi") == "REST WELL."
+    assert translations.translate_batch(["Rest well.", "Drink water."], "Hindi") == ["REST WELL.", "DRINK WATER."]
+    # Only the unseen sentence reaches the backend; languages are memoized apart
+    assert translator.calls == ["Rest well.", "Drink water."]
+    assert translations.translate("Rest well.", "Tamil") == "REST WELL."
+    assert translator.calls[-1] == "Rest well."
+    stats = translations.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 3
+
+
+def test_duplicates_in_a_batch_are_translated_once():
+    translator = StubTranslator()
+    result = service(translator).translate_batch(["Rest well.", "Rest well."], "Hindi")
+    assert result == ["REST WELL.", "REST WELL."]
+    assert translator.calls == ["Rest well."]
+
+
+def test_memo_evicts_least_recently_used():
+    translator = StubTranslator()
+    translations = service(translator, cache_size=2)
+    for text in ("One.", "Two.", "One.", "Three."):
+        translations.translate(text, "Hindi")
+    translator.calls.clear()
+    translations.translate("One.", "Hindi")
+    translations.translate("Two.", "Hindi")
+    # "One." was used more recently than "Two.", so "Two." was evicted
+    assert translator.calls == ["Two."]
+
+
+def test_english_is_not_translated():
+    translator = StubTranslator()
+    assert service(translator).translate_batch(["Rest well."], "English") == ["Rest well."]
+    assert translator.calls == []
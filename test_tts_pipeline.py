@@ -0,0 +1,86 @@
+# Sentence-pipelined TTS with stub engines: frame-wise joining, dropped
+# sentences, mixed MP3 formats and one engine per reply.
+#
+#   python -m pytest test_tts_pipeline.py
+import time
+
+import telemetry
+import voice_of_the_doctor
+from tts_router import TTSRouter
+from voice_of_the_doctor import TTSCache, mp3_format, text_to_speech_pipelined
+
+# Silent MPEG-2 layer III frames, 22.05 kHz and 24 kHz mono
+FRAME_22K = b"\xff\xf3\x40\xc4" + b"\x00" * 100
+FRAME_24K = b"\xff\xf3\x44\xc4" + b"\x00" * 92
+ID3_TAG = b"ID3\x04\x00\x00\x00\x00\x00\x04tag!"
+
+REPLY = "Drink water. Rest well. See a doctor."
+
+
+def dropped_total():
+    return telemetry.tts_segments_dropped.value(language="en")
+
+
+def engine_returning(audio_for):
+    def engine(input_text, output_filepath=None, language="en"):
+        return audio_for(input_text)
+    return engine
+
+
+def test_segments_are_joined_without_their_id3_tags():
+    engine = engine_returning(lambda text: ID3_TAG + FRAME_22K)
+    audio = text_to_speech_pipelined(REPLY, translate=False, engine=engine)
+    assert audio == FRAME_22K * 3
+    assert mp3_format(ID3_TAG + FRAME_22K) == (22050, 1)
+
+
+def test_failed_sentences_are_dropped_and_counted(capsys):
+    def audio_for(text):
+        if text == "Rest well.":
+            raise RuntimeError("provider down")
+        return None if text == "See a doctor." else FRAME_22K
+
+    before = dropped_total()
+    audio = text_to_speech_pipelined(REPLY, translate=False, engine=engine_returning(audio_for))
+    assert audio == FRAME_22K
+    assert dropped_total() - before == 2
+    out = capsys.readouterr().out
+    assert "dropped sentence 2/3: 'Rest well.'" in out
+    assert "dropped sentence 3/3: 'See a doctor.'" in out
+
+
+def test_mixed_formats_are_synthesized_again_with_gtts(monkeypatch):
+    gtts_calls = []
+
+    def fake_gtts(input_text, output_filepath=None, language="en"):
+        gtts_calls.append(input_text)
+        return FRAME_24K
+
+    monkeypatch.setattr(voice_of_the_doctor, "text_to_speech_with_gtts", fake_gtts)
+    # The second sentence fell back to another engine with a different rate
+    engine = engine_returning(lambda text: FRAME_24K if text == "Rest well." else FRAME_22K)
+    audio = text_to_speech_pipelined(REPLY, translate=False, engine=engine)
+    assert audio == FRAME_24K * 3
+    assert gtts_calls == ["Drink water.", "Rest well.", "See a doctor."]
+
+
+def test_reply_keeps_the_engine_that_voiced_its_first_sentence(monkeypatch):
+    calls = {"elevenlabs": [], "gtts": []}
+
+    def elevenlabs(text, lang_code):
+        calls["elevenlabs"].append(text)
+        # Slow on the first sentence, so gTTS wins its hedge
+        time.sleep(0.3 if len(calls["elevenlabs"]) == 1 else 0.0)
+        return FRAME_22K
+
+    def gtts(text, lang_code):
+        calls["gtts"].append(text)
+        return FRAME_24K
+
+    router = TTSRouter({"elevenlabs": elevenlabs, "gtts": gtts}, max_deadline=0.05, explore=0.0)
+    monkeypatch.setattr(voice_of_the_doctor, "tts_router", router)
+    monkeypatch.setattr(voice_of_the_doctor, "tts_cache", TTSCache())
+    audio = text_to_speech_pipelined(REPLY, translate=False)
+    assert audio == FRAME_24K * 3
+    assert calls["elevenlabs"] == ["Drink water."]
+    assert sorted(calls["gtts"]) == sorted(["Drink water.", "Rest well.", "See a doctor."])
@@ -0,0 +1,145 @@
+# TTSRouter with local stub engines: hedging, cancellation and per-language
+# routing.
+#
+#   python -m pytest test_tts_router.py
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from tts_router import LatencyWindow, StubEngine, TTSRouter
+
+
+def run_calls(router, lang_code, count, concurrency=8):
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(lambda i: router.synthesize(f"Sentence {i}.", lang_code), range(count)))
+
+
+def test_slow_secondary_that_keeps_losing_hedges_is_not_preferred():
+    # The primary often runs past its (median) deadline, so many calls are
+    # hedged and the slow secondary is cancelled again and again
+    primary = StubEngine(0.04, spread=0.5, seed=1)
+    secondary = StubEngine(0.2, spread=0.1, seed=2)
+    router = TTSRouter({"primary": primary, "secondary": secondary}, hedge_quantile=0.5,
+                       min_deadline=0.005, max_deadline=1.0, explore=0.0, max_workers=16, max_hedges=8)
+    results = run_calls(router, "hi", 64)
+
+    assert all(audio for _, audio in results)
+    stats = router.stats()
+    assert stats["hedged"] >= 16
+    assert secondary.cancels >= 8
+    assert router.route("hi")[0] == "primary"
+    # Cancelled attempts are censored, not latency samples
+    secondary_stats = stats["languages"]["hi"]["secondary"]
+    assert secondary_stats["cancelled"] == secondary.cancels
+    if secondary_stats["p50_ms"] is not None:
+        assert secondary_stats["p50_ms"] >= 150
+
+
+def test_primary_stays_preferred_with_exploration():
+    primary = StubEngine(0.04, spread=0.5, seed=3)
+    secondary = StubEngine(0.2, spread=0.1, seed=4)
+    router = TTSRouter({"primary": primary, "secondary": secondary}, hedge_quantile=0.5,
+                       min_deadline=0.005, max_deadline=1.0, explore=0.2)
+    run_calls(router, "hi", 96)
+
+    router.explore = 0.0
+    assert router.route("hi")[0] == "primary"
+    secondary_stats = router.stats()["languages"]["hi"]["secondary"]
+    assert secondary_stats["p50_ms"] is None or secondary_stats["p50_ms"] >= 150
+
+
+def test_language_goes_to_the_engine_that_is_faster_for_it():
+    primary = StubEngine(0.03, latencies={"ta": 0.3}, spread=0.1, seed=5)
+    secondary = StubEngine(0.06, spread=0.1, seed=6)
+    router = TTSRouter({"primary": primary, "secondary": secondary}, min_deadline=0.005, max_deadline=1.0, explore=0.3)
+    run_calls(router, "ta", 64)
+    run_calls(router, "en", 32)
+
+    router.explore = 0.0
+    assert router.route("ta")[0] == "secondary"
+    assert router.route("en")[0] == "primary"
+
+
+def test_hedge_wins_over_a_stalled_primary_and_cancels_it():
+    primary = StubEngine(2.0, spread=0.0)
+    secondary = StubEngine(0.05, spread=0.0)
+    router = TTSRouter({"primary": primary, "secondary": secondary}, max_deadline=0.1, explore=0.0)
+    started = time.perf_counter()
+    name, audio = router.synthesize("Please rest.", "en")
+    assert name == "secondary" and audio
+    assert time.perf_counter() - started < 0.5
+    # The stub notices the cancellation on its next check
+    time.sleep(0.05)
+    assert primary.cancels == 1
+
+
+def test_hedges_in_flight_are_bounded():
+    # Losers that can't be cancelled keep their workers until they finish
+    primary = StubEngine(0.3, spread=0.0)
+    secondary = StubEngine(0.3, spread=0.0)
+    secondary_call = secondary.__call__
+    seen = []
+
+    def uncancellable(text, lang_code):
+        seen.append(router.stats()["hedges_running"])
+        return secondary_call(text, lang_code)
+
+    router = TTSRouter({"primary": primary, "secondary": uncancellable}, max_deadline=0.02, explore=0.0, max_hedges=2)
+    results = run_calls(router, "en", 6, concurrency=6)
+    assert all(audio for _, audio in results)
+    stats = router.stats()
+    assert stats["hedged"] == 2 and stats["hedges_skipped"] == 4
+    assert max(seen) <= 2
+    # The cancelled primaries stop on their next check and free the slots
+    time.sleep(0.05)
+    assert router.stats()["hedges_running"] == 0
+
+
+def test_pinned_call_is_not_hedged():
+    primary = StubEngine(0.2, spread=0.0)
+    secondary = StubEngine(0.01, spread=0.0)
+    router = TTSRouter({"primary": primary, "secondary": secondary}, max_deadline=0.02, explore=0.0)
+    assert router.synthesize("Please rest.", "en", engine="primary")[0] == "primary"
+    assert router.stats()["hedged"] == 0 and secondary.calls == 0
+    # It still falls back when the pinned engine fails
+    failing = TTSRouter({"primary": StubEngine(0.01, error_rate=1.0), "secondary": secondary}, explore=0.0)
+    assert failing.synthesize("Please rest.", "en", engine="primary")[0] == "secondary"
+
+
+def test_failed_primary_falls_back_without_waiting_for_the_deadline():
+    primary = StubEngine(0.01, spread=0.0, error_rate=1.0)
+    secondary = StubEngine(0.01, spread=0.0)
+    router = TTSRouter({"primary": primary, "secondary": secondary}, max_deadline=5.0, explore=0.0)
+    started = time.perf_counter()
+    assert router.synthesize("Please rest.", "en")[0] == "secondary"
+    assert time.perf_counter() - started < 0.5
+
+
+def test_failing_engine_is_routed_last():
+    primary = StubEngine(0.01, spread=0.0, error_rate=1.0)
+    secondary = StubEngine(0.02, spread=0.0)
+    router = TTSRouter({"primary": primary, "secondary": secondary}, explore=0.0)
+    run_calls(router, "en", 8, concurrency=1)
+    assert router.route("en") == ["secondary", "primary"]
+
+
+def test_all_engines_failing_returns_nothing():
+    router = TTSRouter({"a": StubEngine(0.01, error_rate=1.0), "b": StubEngine(0.01, error_rate=1.0)}, explore=0.0)
+    assert router.synthesize("Please rest.", "en") == (None, None)
+
+
+def test_deadline_follows_the_hedge_quantile():
+    router = TTSRouter({"a": StubEngine(0.01)}, hedge_quantile=0.9, min_deadline=0.0, max_deadline=10.0, min_samples=5)
+    assert router.deadline("a", "en") == 10.0
+    for seconds in (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0):
+        router.record("a", "en", seconds, True)
+    assert abs(router.deadline("a", "en") - 0.91) < 1e-6
+
+
+def test_censored_samples_stay_out_of_the_quantiles():
+    window = LatencyWindow(10)
+    window.record(2.0, True)
+    for _ in range(5):
+        window.record_censored(0.05)
+    assert window.quantile(0.5) == 2.0
+    assert window.samples == 1
+    assert window.stats()["cancelled"] == 5
@@ -0,0 +1,403 @@
+# Latency-aware TTS routing with hedged requests.
+#
+# Every synthesis call is timed per (engine, language) in a rolling window.
+# A call goes to the engine that has been fastest for its language (the
+# preferred engine keeps it unless another is clearly faster, or it keeps
+# failing). If that engine hasn't answered by its adaptive deadline, the p90 of
+# its recent successful calls for the language, the next engine is started in
+# parallel and whichever returns audio first wins; the loser is cancelled (a
+# queued call never starts, a running one is told to stop via cancelled()).
+# An engine that fails starts the next one straight away. A loser that can't
+# stop early (gTTS) keeps its worker until it finishes, so at most
+# TTS_HEDGE_MAX_IN_FLIGHT hedges run at once, and none start while every
+# worker is busy; past that a call just waits for its engine.
+#
+# Engines are plain callables engine(text, lang_code) -> MP3 bytes that raise
+# on failure. StubEngine simulates one locally:
+#
+#   python tts_router.py --requests 300
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import ContextVar
+
+import numpy as np
+
+import telemetry
+
+TTS_ROUTER_WINDOW = int(os.environ.get("TTS_ROUTER_WINDOW", "100"))
+TTS_HEDGE_QUANTILE = float(os.environ.get("TTS_HEDGE_QUANTILE", "0.9"))
+TTS_HEDGE_MIN_SECONDS = float(os.environ.get("TTS_HEDGE_MIN_SECONDS", "0.3"))
+TTS_HEDGE_MAX_SECONDS = float(os.environ.get("TTS_HEDGE_MAX_SECONDS", "5"))
+TTS_ROUTE_MARGIN = float(os.environ.get("TTS_ROUTE_MARGIN", "1.5"))
+TTS_ROUTE_EXPLORE = float(os.environ.get("TTS_ROUTE_EXPLORE", "0.05"))
+TTS_HEDGE_MAX_IN_FLIGHT = int(os.environ.get("TTS_HEDGE_MAX_IN_FLIGHT", "2"))
+
+_cancel_event = ContextVar("tts_cancel_event", default=None)
+
+
+class Cancelled(Exception):
+    pass
+
+
+def cancelled():
+    """
+    True once the routed call this engine is running for has been won by
+    another engine. Engines check it between chunks of work.
+    """
+    event = _cancel_event.get()
+    return event is not None and event.is_set()
+
+
+def check_cancelled():
+    if cancelled():
+        raise Cancelled()
+
+
+class LatencyWindow:
+    """
+    The last `size` outcomes of one engine for one language. Calls cancelled
+    after losing a race are kept apart as censored samples: they only say the
+    engine took longer than that, so they stay out of the quantiles.
+    """
+
+    def __init__(self, size):
+        self._latencies = deque(maxlen=size)
+        self._outcomes = deque(maxlen=size)
+        self._censored = deque(maxlen=size)
+
+    def record(self, seconds, ok):
+        self._outcomes.append(ok)
+        if ok:
+            self._latencies.append(seconds)
+
+    def record_censored(self, seconds):
+        self._censored.append(seconds)
+
+    @property
+    def samples(self):
+        return len(self._latencies)
+
+    def quantile(self, q):
+        return float(np.quantile(self._latencies, q)) if self._latencies else None
+
+    def error_rate(self):
+        return (len(self._outcomes) - sum(self._outcomes)) / len(self._outcomes) if self._outcomes else 0.0
+
+    def __len__(self):
+        return len(self._outcomes)
+
+    def stats(self):
+        p50, p90 = self.quantile(0.5), self.quantile(0.9)
+        return {
+            "calls": len(self._outcomes),
+            "cancelled": len(self._censored),
+            "error_rate": round(self.error_rate(), 3),
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p90_ms": round(p90 * 1000, 1) if p90 is not None else None,
+        }
+
+
+class TTSRouter:
+    def __init__(self, engines, window=TTS_ROUTER_WINDOW, hedge_quantile=TTS_HEDGE_QUANTILE,
+                 min_deadline=TTS_HEDGE_MIN_SECONDS, max_deadline=TTS_HEDGE_MAX_SECONDS,
+                 route_margin=TTS_ROUTE_MARGIN, explore=TTS_ROUTE_EXPLORE, min_samples=5, max_error_rate=0.5,
+                 hedge=True, max_workers=8, max_hedges=TTS_HEDGE_MAX_IN_FLIGHT):
+        """
+        engines: name -> engine(text, lang_code), in order of preference. Until
+        min_samples calls have been timed the deadline is max_deadline, and
+        routing follows the preference order.
+        """
+        if not engines:
+            raise ValueError("at least one TTS engine is required")
+        self.engines = dict(engines)
+        self.window = window
+        self.hedge_quantile = hedge_quantile
+        self.min_deadline = min_deadline
+        self.max_deadline = max_deadline
+        self.route_margin = route_margin
+        self.explore = explore
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.hedge = hedge
+        self.max_workers = max_workers
+        self.max_hedges = max_hedges
+        self._windows = {}
+        self._lock = threading.Lock()
+        self._random = random.Random()
+        # Separate from the sentence pipeline's pool, which calls into the router
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tts-engine")
+        self._running = 0
+        self._hedges_running = 0
+        self.calls = 0
+        self.hedged = 0
+        self.hedges_skipped = 0
+        self.wins = {}
+
+    def _window(self, name, lang_code):
+        key = (name, lang_code)
+        if key not in self._windows:
+            self._windows[key] = LatencyWindow(self.window)
+        return self._windows[key]
+
+    def record(self, name, lang_code, seconds, ok):
+        with self._lock:
+            self._window(name, lang_code).record(seconds, ok)
+
+    def record_cancelled(self, name, lang_code, seconds):
+        with self._lock:
+            self._window(name, lang_code).record_censored(seconds)
+
+    def route(self, lang_code):
+        """
+        Engine names in the order to try them for this language.
+        """
+        order = list(self.engines)
+        if len(order) > 1 and self._random.random() < self.explore:
+            # Now and then lead with another engine (the next one still hedges
+            # it), so engines that are routed around keep getting timed and
+            # can win their languages back
+            first = self._random.choice(order[1:])
+            return [first] + [name for name in order if name != first]
+        with self._lock:
+            windows = {name: self._window(name, lang_code) for name in order}
+            failing = [name for name in order
+                       if len(windows[name]) >= self.min_samples and windows[name].error_rate() > self.max_error_rate]
+            typical = {name: windows[name].quantile(0.5) if windows[name].samples >= self.min_samples else None
+                       for name in order}
+        healthy = [name for name in order if name not in failing] or order
+        preferred = healthy[0]
+        known = [name for name in healthy if typical[name] is not None]
+        if known and typical[preferred] is not None:
+            fastest = min(known, key=typical.get)
+            # Leave the preferred engine only for a clear win
+            if typical[preferred] > self.route_margin * typical[fastest]:
+                preferred = fastest
+        return [preferred] + [name for name in order if name != preferred and name not in failing] + \
+            [name for name in failing if name != preferred]
+
+    def deadline(self, name, lang_code):
+        """
+        Seconds to wait for an engine before hedging: the hedge quantile of its
+        recent successful calls for the language, clamped.
+        """
+        with self._lock:
+            window = self._window(name, lang_code)
+            if window.samples < self.min_samples:
+                return self.max_deadline
+            quantile = window.quantile(self.hedge_quantile)
+        return min(self.max_deadline, max(self.min_deadline, quantile))
+
+    def _attempt(self, name, text, lang_code, event):
+        _cancel_event.set(event)
+        started = time.perf_counter()
+        try:
+            audio = self.engines[name](text, lang_code)
+            if not audio:
+                raise RuntimeError("engine returned no audio")
+        except Cancelled:
+            # Only a lower bound on its latency; a slow engine that keeps
+            # losing must not look fast. Exploration in route() times it fully.
+            self.record_cancelled(name, lang_code, time.perf_counter() - started)
+            return name, None
+        except Exception as e:
+            self.record(name, lang_code, time.perf_counter() - started, False)
+            telemetry.provider_errors.inc(provider=name, operation="tts")
+            print(f"✗ TTS {name} ({lang_code}) failed: {e}")
+            return name, None
+        # A loser that finished anyway still tells us how fast it was
+        self.record(name, lang_code, time.perf_counter() - started, True)
+        return name, audio
+
+    def synthesize(self, text, lang_code, engine=None):
+        """
+        (engine name, MP3 bytes) from the first engine to succeed, or
+        (None, None) if they all fail. A call pinned to `engine` isn't hedged;
+        the other engines are only tried if it fails.
+        """
+        order = self.route(lang_code)
+        if engine is not None:
+            order = [engine] + [name for name in order if name != engine]
+        hedging = self.hedge and engine is None
+        with self._lock:
+            self.calls += 1
+        events, futures = {}, {}
+        outstanding, hedged = 0, False
+
+        def finished(future):
+            nonlocal outstanding
+            with self._lock:
+                self._running -= 1
+                outstanding -= 1
+                # A hedged call holds its hedge slot until its loser is done too
+                if hedged and not outstanding:
+                    self._hedges_running -= 1
+
+        def launch(name, hedge=False):
+            nonlocal outstanding, hedged
+            events[name] = threading.Event()
+            with self._lock:
+                self._running += 1
+                outstanding += 1
+                if hedge and not hedged:
+                    hedged = True
+                    self._hedges_running += 1
+            future = self._executor.submit(telemetry.run_in_context(self._attempt), name, text, lang_code, events[name])
+            futures[future] = name
+            future.add_done_callback(finished)
+            return future
+
+        def can_hedge():
+            with self._lock:
+                if self._running < self.max_workers and (hedged or self._hedges_running < self.max_hedges):
+                    return True
+                self.hedges_skipped += 1
+                return False
+
+        pending = {launch(order[0])}
+        remaining = order[1:]
+        hedge_at = time.monotonic() + self.deadline(order[0], lang_code)
+        try:
+            while pending:
+                timeout = max(0.0, hedge_at - time.monotonic()) if hedging and remaining else None
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    if not can_hedge():
+                        # Too many hedges already hold workers; wait for this one
+                        print(f"⏱ TTS {order[0]} slow for {lang_code}; no worker free to hedge")
+                        hedging = False
+                        continue
+                    # Deadline passed: race the next engine against the ones running
+                    name = remaining.pop(0)
+                    with self._lock:
+                        self.hedged += 1
+                    telemetry.tts_hedges.inc(engine=order[0], language=lang_code)
+                    print(f"⏱ TTS {order[0]} slow for {lang_code}; hedging with {name}")
+                    # Added as is: a hedge may finish before the next wait()
+                    pending.add(launch(name, hedge=True))
+                    hedge_at = time.monotonic() + self.deadline(name, lang_code)
+                    continue
+                for future in done:
+                    name, audio = future.result()
+                    if audio:
+                        with self._lock:
+                            self.wins[name] = self.wins.get(name, 0) + 1
+                        telemetry.tts_wins.inc(engine=name, language=lang_code)
+                        if name != order[0]:
+                            telemetry.provider_fallbacks.inc(from_provider=order[0], to_provider=name)
+                        return name, audio
+                if not pending and remaining:
+                    # Everything running failed; no point waiting for a deadline
+                    pending.add(launch(remaining.pop(0)))
+            return None, None
+        finally:
+            for future, name in futures.items():
+                if not future.done():
+                    future.cancel()
+                    events[name].set()
+
+    def stats(self):
+        with self._lock:
+            languages = {}
+            for (name, lang_code), window in sorted(self._windows.items()):
+                if len(window) or window.stats()["cancelled"]:
+                    languages.setdefault(lang_code, {})[name] = window.stats()
+            return {
+                "engines": list(self.engines),
+                "hedge": self.hedge,
+                "calls": self.calls,
+                "hedged": self.hedged,
+                "hedges_skipped": self.hedges_skipped,
+                "hedges_running": self._hedges_running,
+                "wins": dict(self.wins),
+                "languages": languages,
+            }
+
+
+class StubEngine:
+    """
+    Local stand-in for a TTS provider: lognormal latency around `latency`
+    seconds (per-language overrides in `latencies`), stalling for stall_factor
+    times as long with probability stall_rate and failing with probability
+    error_rate. Returns a few silent MP3 frames and stops early when cancelled.
+    """
+
+    FRAME = b"\xff\xf3\x44\xc4" + b"\x00" * 140
+
+    def __init__(self, latency, latencies=None, spread=0.3, stall_rate=0.0, stall_factor=8.0, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.latencies = latencies or {}
+        self.spread = spread
+        self.stall_rate = stall_rate
+        self.stall_factor = stall_factor
+        self.error_rate = error_rate
+        self.calls = 0
+        self.cancels = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __call__(self, text, lang_code):
+        with self._lock:
+            self.calls += 1
+            delay = self.latencies.get(lang_code, self.latency) * self._random.lognormvariate(0, self.spread)
+            if self._random.random() < self.stall_rate:
+                delay *= self.stall_factor
+            fail = self._random.random() < self.error_rate
+        deadline = time.monotonic() + delay
+        while time.monotonic() < deadline:
+            if cancelled():
+                with self._lock:
+                    self.cancels += 1
+                raise Cancelled()
+            time.sleep(min(0.01, max(0.0, deadline - time.monotonic())))
+        if fail:
+            raise RuntimeError("stub engine failure")
+        return self.FRAME * max(1, len(text) // 2)
+
+
+def _simulate(router, languages, requests, concurrency):
+    latencies = {lang_code: [] for lang_code in languages}
+
+    def one(i):
+        lang_code = languages[i % len(languages)]
+        started = time.perf_counter()
+        router.synthesize("Please drink plenty of fluids and get some rest.", lang_code)
+        latencies[lang_code].append(time.perf_counter() - started)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    return latencies
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Simulate hedged TTS routing with stub engines")
+    parser.add_argument("--requests", type=int, default=300)
+    # Like the API, whose sentence pool (TTS_PIPELINE_WORKERS) calls the router
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    # A primary that now and then stalls and is slow for one language, and a
+    # steadier secondary
+    def engines():
+        return {
+            "elevenlabs": StubEngine(0.25, latencies={"ta": 0.9}, spread=0.3, stall_rate=0.08, error_rate=0.02, seed=1),
+            "gtts": StubEngine(0.4, spread=0.15, seed=2),
+        }
+
+    languages = ["en", "hi", "ta"]
+    print(f"{args.requests} requests over {', '.join(languages)}, concurrency {args.concurrency}")
+    for label, hedge in (("fallback only", False), ("hedged", True)):
+        router = TTSRouter(engines(), hedge=hedge, max_deadline=2.0, window=50, explore=0.1)
+        latencies = _simulate(router, languages, args.requests, args.concurrency)
+        print(f"\n{label}:")
+        for lang_code, samples in latencies.items():
+            p50, p95, p99 = (np.percentile(samples, q) * 1000 for q in (50, 95, 99))
+            router.explore = 0
+            print(f"  {lang_code}  p50 {p50:7.1f}  p95 {p95:7.1f}  p99 {p99:7.1f} ms   now routed to {router.route(lang_code)[0]}")
+        stats = router.stats()
+        print(f"  hedged {stats['hedged']}/{stats['calls']} ({stats['hedges_skipped']} skipped), wins {stats['wins']}")
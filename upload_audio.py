@@ -0,0 +1,88 @@
+# Decoding of uploaded audio bytes for respiratory analysis.
+#
+# Shared by the API and the inference worker processes (inference_workers.py).
+# Uploads are decoded from memory; only payloads above UPLOAD_SPILL_BYTES, or
+# containers libsndfile can't read from a buffer, are spilled to a temp file.
+import io
+import os
+import tempfile
+from contextlib import contextmanager
+
+import feature_engine
+
+UPLOAD_SPILL_BYTES = int(os.environ.get("UPLOAD_SPILL_BYTES", str(8 * 1024 * 1024)))
+
+
+class UndecodableAudio(ValueError):
+    pass
+
+
+@contextmanager
+def spilled_upload(data, filename):
+    """
+    Write upload bytes to a unique per-request temp file and remove it afterwards.
+    Only used for large uploads or formats that can't be decoded from memory.
+    """
+    suffix = os.path.splitext(filename or "")[1] or ".bin"
+    fd, path = tempfile.mkstemp(prefix="speechbot_", suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        yield path
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def load_audio_bytes(data, filename):
+    if len(data) <= UPLOAD_SPILL_BYTES:
+        try:
+            return feature_engine.load_clip(io.BytesIO(data), sr=None, duration=feature_engine.CLIP_SECONDS)
+        except Exception:
+            # soundfile can't decode every container (e.g. m4a) from memory
+            pass
+    with spilled_upload(data, filename) as path:
+        return feature_engine.load_clip(path, sr=None, duration=feature_engine.CLIP_SECONDS)
+
+
+@contextmanager
+def streamable_audio(data, filename):
+    """
+    Yield a source feature_engine can decode incrementally: the in-memory bytes
+    when libsndfile reads them, otherwise a spilled temp file path.
+    """
+    if len(data) <= UPLOAD_SPILL_BYTES and feature_engine.can_stream(io.BytesIO(data)):
+        yield io.BytesIO(data)
+    else:
+        with spilled_upload(data, filename) as path:
+            yield path
+
+
+def iter_window_feature_batches(source, filename, hop_seconds):
+    """
+    feature_engine.iter_window_feature_batches, raising UndecodableAudio if no
+    decoder can read the upload.
+    """
+    batches = feature_engine.iter_window_feature_batches(source, hop_seconds=hop_seconds)
+    while True:
+        try:
+            item = next(batches)
+        except StopIteration:
+            return
+        except Exception as e:
+            # audioread's NoBackendError has no message of its own
+            detail = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+            raise UndecodableAudio(f"Could not decode {filename or 'upload'} as audio ({detail})") from e
+        yield item
+
+
+def extract_features(audio_bytes, filename=None):
+    """
+    (mfcc, chroma, mspec) batches of one for the first clip of an upload, or
+    (None, None, None) if it can't be decoded.
+    """
+    try:
+        y, sr = load_audio_bytes(audio_bytes, filename)
+        return feature_engine.extract_feature_batch([(y, sr)])
+    except Exception:
+        return None, None, None
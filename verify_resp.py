@@ -3,13 +3,18 @@ import librosa
 import tensorflow as tf
 import os
 import soundfile as sf
+import feature_engine
 
 # Configuration
-MODEL_PATH = "/home/nishanth/parthibanproject/speechbot/models/trained_models/Respiratory_sound.keras"
+MODEL_PATH = os.environ.get("RESP_MODEL_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "trained_models", "Respiratory_sound.keras"))
 RESP_LABELS = ['Asthma', 'Bronchiectasis', 'Bronchiolitis', 'COPD', 'Healthy', 'LRTI', 'Pneumonia', 'URTI']
 
 def extract_features(audio_path):
     print(f"Extracting features from {audio_path}...")
+    return feature_engine.extract_features(audio_path, sr=22050)
+
+def extract_features_reference(audio_path):
+    # Original three-pass librosa pipeline, kept to check the feature engine against
     y, sr = librosa.load(audio_path, duration=6.0)
     
     mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=20)
@@ -56,6 +61,12 @@ def verify():
     mfcc, chroma, mspec = extract_features(dummy_audio)
     print(f"✅ Features extracted. Shapes: MFCC={mfcc.shape}, Chroma={chroma.shape}, MelSpec={mspec.shape}")
 
+    print("\nStep 3b: Checking parity with librosa reference features...")
+    for name, ours, ref in zip(["MFCC", "Chroma", "MelSpec"], (mfcc, chroma, mspec), extract_features_reference(dummy_audio)):
+        diff = float(np.max(np.abs(ours - ref)))
+        status = "✅" if np.allclose(ours, ref, atol=1e-3) else "❌"
+        print(f"{status} {name}: max abs diff {diff:.2e}")
+
     print("\nStep 4: Running prediction...")
     try:
         prediction = model.predict([mfcc, chroma, mspec], verbose=0)
@@ -1,85 +1,424 @@
 import os
-import elevenlabs
-from elevenlabs.client import ElevenLabs
+import io
+import re
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from clients import registry
+import telemetry
+from tts_router import TTSRouter, check_cancelled
 import subprocess
 import platform
-from gtts import gTTS
-from deep_translator import GoogleTranslator
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 
 # Check for API key - try both common environment variable names
 ELEVENLABS_API_KEY = os.environ.get("ELEVENLABS_API_KEY") or os.environ.get("ELEVEN_API_KEY")
 
-# Initialize translator (no need to create instance, it's stateless)
-translator = GoogleTranslator(source='en', target='ta')
 
-# Debug output
-if ELEVENLABS_API_KEY:
-    print(f"✓ ElevenLabs API Key loaded in voice_of_the_doctor.py (length: {len(ELEVENLABS_API_KEY)} characters)")
-else:
-    print("✗ ElevenLabs API Key NOT found in voice_of_the_doctor.py - will use Google TTS fallback")
+def log_tts_status():
+    """
+    Report which TTS provider will be used. Called once at app start-up rather
+    than on import.
+    """
+    if ELEVENLABS_API_KEY:
+        print(f"✓ ElevenLabs API Key loaded in voice_of_the_doctor.py (length: {len(ELEVENLABS_API_KEY)} characters)")
+    else:
+        print("✗ ElevenLabs API Key NOT found in voice_of_the_doctor.py - will use Google TTS fallback")
+    print(f"🔀 TTS engines: {', '.join(tts_router.engines)} (hedging {'on' if tts_router.hedge else 'off'})")
 
 
-def translate_text(text, target_lang):
+def _google_translator(lang_code):
+    from deep_translator import GoogleTranslator
+    return GoogleTranslator(source='auto', target=lang_code)
+
+
+# Full language names to the codes deep-translator and gTTS expect
+LANG_MAP = {
+    'english': 'en', 'tamil': 'ta', 'hindi': 'hi', 'telugu': 'te', 
+    'kannada': 'kn', 'malayalam': 'ml', 'bengali': 'bn', 'gujarati': 'gu',
+    'marathi': 'mr', 'punjabi': 'pa'
+}
+
+
+def resolve_lang_code(language):
+    # Map full language names to codes if necessary, or assume codes are passed
+    return LANG_MAP.get(language.lower(), language.lower())
+
+
+class TranslationService:
     """
-    Translate text to target language using Google Translate (via deep-translator)
+    Memoized, batched translation.
+    Keeps translator instances per target language (per thread, since
+    deep-translator objects hold per-call state), memoizes results in a bounded
+    LRU keyed on (text hash, target language), and gives every call a deadline
+    after which the original text is returned.
+    translator_factory(lang_code) must return an object with translate(text);
+    pass a stub to test without the network.
     """
-    try:
-        # Map full language names to codes if necessary, or assume codes are passed
-        # For simplicity, let's assume we might get full names or codes, but deep-translator expects codes.
-        # A simple mapping for Indian languages:
-        lang_map = {
-            'english': 'en', 'tamil': 'ta', 'hindi': 'hi', 'telugu': 'te', 
-            'kannada': 'kn', 'malayalam': 'ml', 'bengali': 'bn', 'gujarati': 'gu',
-            'marathi': 'mr', 'punjabi': 'pa'
-        }
-        
-        lang_code = lang_map.get(target_lang.lower(), target_lang.lower())
-        
+
+    # Joins batch segments into one request; Google Translate keeps line breaks
+    BATCH_SEPARATOR = "\n"
+
+    def __init__(self, translator_factory=None, cache_size=4096, deadline=5.0, max_workers=8):
+        self.translator_factory = translator_factory or _google_translator
+        self.cache_size = cache_size
+        self.deadline = deadline
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="translate")
+        self.hits = 0
+        self.misses = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    def _translator(self, lang_code):
+        translators = getattr(self._local, "translators", None)
+        if translators is None:
+            translators = self._local.translators = {}
+        if lang_code not in translators:
+            translators[lang_code] = self.translator_factory(lang_code)
+        return translators[lang_code]
+
+    @staticmethod
+    def _memo_key(text, lang_code):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest(), lang_code
+
+    def _memo_get(self, key):
+        with self._lock:
+            if key in self._memo:
+                self._memo.move_to_end(key)
+                self.hits += 1
+                return self._memo[key]
+            self.misses += 1
+            return None
+
+    def _memo_put(self, key, value):
+        with self._lock:
+            self._memo[key] = value
+            self._memo.move_to_end(key)
+            while len(self._memo) > self.cache_size:
+                self._memo.popitem(last=False)
+
+    def _backend_batch(self, texts, lang_code):
+        translator = self._translator(lang_code)
+        if len(texts) == 1:
+            return [translator.translate(texts[0])]
+        if not any(self.BATCH_SEPARATOR in t for t in texts):
+            joined = translator.translate(self.BATCH_SEPARATOR.join(texts))
+            parts = joined.split(self.BATCH_SEPARATOR) if joined else []
+            if len(parts) == len(texts):
+                return [p.strip() for p in parts]
+        # Backend merged or split segments; translate them one by one instead
+        return [translator.translate(t) for t in texts]
+
+    def translate_batch(self, texts, target_lang, deadline=None):
+        lang_code = resolve_lang_code(target_lang)
         if lang_code == 'en':
-            return text
+            return list(texts)
 
-        translator = GoogleTranslator(source='auto', target=lang_code)
-        translated_text = translator.translate(text)
-        print(f"📝 Translated to {target_lang} ({lang_code}): {translated_text[:100]}...")
-        return translated_text
-    except Exception as e:
-        print(f"✗ Translation Error: {e}")
-        print("⚠ Using original text as fallback")
-        return text
+        results = list(texts)
+        missing = {}
+        for i, text in enumerate(texts):
+            if not text.strip():
+                continue
+            cached = self._memo_get(self._memo_key(text, lang_code))
+            if cached is not None:
+                results[i] = cached
+            else:
+                missing.setdefault(text, []).append(i)
+        if not missing:
+            return results
+
+        pending = list(missing)
+        future = self._executor.submit(self._backend_batch, pending, lang_code)
+        try:
+            with telemetry.span("translate"):
+                translated = future.result(timeout=self.deadline if deadline is None else deadline)
+        except FutureTimeoutError:
+            future.cancel()
+            with self._lock:
+                self.timeouts += 1
+            telemetry.provider_fallbacks.inc(from_provider="translator", to_provider="original_text")
+            print(f"✗ Translation to {lang_code} missed its deadline")
+            print("⚠ Using original text as fallback")
+            return results
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            telemetry.provider_errors.inc(provider="translator", operation="translate")
+            telemetry.provider_fallbacks.inc(from_provider="translator", to_provider="original_text")
+            print(f"✗ Translation Error: {e}")
+            print("⚠ Using original text as fallback")
+            return results
+
+        for text, value in zip(pending, translated):
+            if not value:
+                continue
+            self._memo_put(self._memo_key(text, lang_code), value)
+            for i in missing[text]:
+                results[i] = value
+        print(f"📝 Translated {len(pending)} segment(s) to {target_lang} ({lang_code})")
+        return results
+
+    def translate(self, text, target_lang, deadline=None):
+        return self.translate_batch([text], target_lang, deadline=deadline)[0]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "timeouts": self.timeouts,
+                "errors": self.errors,
+                "entries": len(self._memo),
+            }
+
+
+translation_service = TranslationService(
+    cache_size=int(os.environ.get("TRANSLATION_CACHE_SIZE", "4096")),
+    deadline=float(os.environ.get("TRANSLATION_DEADLINE", "5")),
+)
 
 
-def text_to_speech_with_gtts(input_text, output_filepath, language='en'):
+def translate_text(text, target_lang):
     """
-    Convert text to speech using Google TTS
+    Translate text to target language using Google Translate (via deep-translator).
+    Falls back to the original text on error or timeout.
     """
-    print(f"🔊 gTTS called for language={language}")
-    
-    # Map common names to gTTS codes
-    lang_map = {
-        'english': 'en', 'tamil': 'ta', 'hindi': 'hi', 'telugu': 'te', 
-        'kannada': 'kn', 'malayalam': 'ml', 'bengali': 'bn', 'gujarati': 'gu',
-        'marathi': 'mr', 'punjabi': 'pa'
-    }
-    lang_code = lang_map.get(language.lower(), 'en')
-    
-    try:
+    return translation_service.translate(text, target_lang)
+
+
+# Sentence boundary: terminal punctuation (incl. Devanagari danda) followed by whitespace
+SENTENCE_END = re.compile(r'(?<=[.!?।])\s+')
+
+
+def split_sentences(text):
+    """
+    Split text into sentences for incremental synthesis.
+    """
+    return [s.strip() for s in SENTENCE_END.split(text) if s.strip()]
+
+
+def pop_complete_sentences(buffer):
+    """
+    Split a growing text buffer into (complete_sentences, remainder).
+    The remainder is the trailing text that hasn't reached a sentence boundary yet.
+    """
+    parts = SENTENCE_END.split(buffer)
+    return [p.strip() for p in parts[:-1] if p.strip()], parts[-1]
+
+
+# ElevenLabs synthesis settings (also part of the TTS cache key)
+ELEVENLABS_VOICE = "Aria"
+ELEVENLABS_MODEL_ID = "eleven_multilingual_v2"  # multilingual model for non-English support
+ELEVENLABS_OUTPUT_FORMAT = "mp3_22050_32"
+
+
+class TTSCache:
+    """
+    Content-addressed cache of synthesized audio.
+    Keys hash (normalized text, language, voice, model_id, output_format).
+    A size-bounded in-memory LRU sits in front of an optional on-disk tier
+    whose least recently used files are evicted past disk_max_bytes.
+    """
+
+    def __init__(self, memory_max_bytes=32 * 1024 * 1024, disk_dir=None, disk_max_bytes=512 * 1024 * 1024):
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+
+    @staticmethod
+    def key(text, language, voice, model_id, output_format):
+        normalized = " ".join(unicodedata.normalize("NFC", text).split())
+        raw = "\x1f".join([normalized, language.lower(), voice, model_id, output_format])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.mp3")
+
+    def _disk_entries(self):
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith(".mp3"):
+                stat = entry.stat()
+                yield entry.path, stat.st_size, stat.st_mtime
+
+    def _remember(self, key, data):
+        if len(data) > self.memory_max_bytes:
+            return
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key))
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.memory_max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key]
+        if self.disk_dir:
+            path = self._path(key)
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+                os.utime(path)  # mtime doubles as the disk tier's LRU clock
+            except OSError:
+                data = None
+            if data:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._remember(key, data)
+                return data
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, data):
+        if not data:
+            return
+        with self._lock:
+            self._remember(key, data)
+        if not self.disk_dir:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            existed = os.path.exists(path)
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            if not existed:
+                with self._lock:
+                    self._disk_bytes += len(data)
+                    over_budget = self._disk_bytes > self.disk_max_bytes
+                if over_budget:
+                    self._evict_disk()
+        except OSError as e:
+            print(f"⚠ TTS cache write failed: {e}")
+
+    def _evict_disk(self):
+        entries = sorted(self._disk_entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_bytes = total
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_bytes": self._disk_bytes,
+            }
+
+
+# Set TTS_CACHE_DIR to an empty string to keep the cache in memory only
+tts_cache = TTSCache(
+    memory_max_bytes=int(os.environ.get("TTS_CACHE_MEMORY_BYTES", str(32 * 1024 * 1024))),
+    disk_dir=os.environ.get("TTS_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "speechbot", "tts")) or None,
+    disk_max_bytes=int(os.environ.get("TTS_CACHE_DISK_BYTES", str(512 * 1024 * 1024))),
+)
+
+
+def _deliver_audio(audio_bytes, output_filepath):
+    if audio_bytes is None or output_filepath is None:
+        return audio_bytes
+    with open(output_filepath, "wb") as f:
+        f.write(audio_bytes)
+    return output_filepath
+
+
+def _gtts_audio(input_text, lang_code):
+    from gtts import gTTS
+    with telemetry.span("gtts"):
         audioobj = gTTS(
             text=input_text,
             lang=lang_code,
             slow=False
         )
-        audioobj.save(output_filepath)
-        print(f"✓ gTTS: Audio saved to {output_filepath} (language: {lang_code})")
-        return output_filepath
+        buffer = io.BytesIO()
+        audioobj.write_to_fp(buffer)
+    return buffer.getvalue()
+
+
+def _elevenlabs_audio(input_text, lang_code=None):
+    # eleven_multilingual_v2 detects the language from the text itself
+    client = registry.elevenlabs(ELEVENLABS_API_KEY)
+    with telemetry.span("elevenlabs_tts"):
+        audio = client.generate(
+            text=input_text,
+            voice=ELEVENLABS_VOICE,
+            output_format=ELEVENLABS_OUTPUT_FORMAT,
+            model=ELEVENLABS_MODEL_ID
+        )
+        if isinstance(audio, bytes):
+            return audio
+        # The SDK streams the body lazily, so the join is part of the call;
+        # a routed call that lost its race stops reading here
+        chunks = []
+        for chunk in audio:
+            check_cancelled()
+            chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def text_to_speech_with_gtts(input_text, output_filepath=None, language='en'):
+    """
+    Convert text to speech using Google TTS.
+    If output_filepath is None the MP3 is returned as bytes instead of saved.
+    """
+    print(f"🔊 gTTS called for language={language}")
+    
+    lang_code = LANG_MAP.get(language.lower(), 'en')
+    cache_key = TTSCache.key(input_text, lang_code, "gtts", "gtts", "mp3")
+    cached = tts_cache.get(cache_key)
+    if cached:
+        print(f"✓ gTTS: cache hit (language: {lang_code})")
+        return _deliver_audio(cached, output_filepath)
+    
+    try:
+        audio_bytes = _gtts_audio(input_text, lang_code)
+        tts_cache.put(cache_key, audio_bytes)
+        print(f"✓ gTTS: Audio generated (language: {lang_code})")
+        return _deliver_audio(audio_bytes, output_filepath)
     except Exception as e:
+        telemetry.provider_errors.inc(provider="gtts", operation="tts")
         print(f"✗ gTTS Error: {e}")
         return None
 
 
-def text_to_speech_with_elevenlabs(input_text, output_filepath, language='en'):
+def text_to_speech_with_elevenlabs(input_text, output_filepath=None, language='en'):
     """
     Convert text to speech using ElevenLabs API with fallback to Google TTS.
     Uses eleven_multilingual_v2 for non-English support.
+    If output_filepath is None the MP3 is returned as bytes instead of saved.
     """
     print(f"🔊 ElevenLabs called for language={language}")
     
@@ -88,31 +427,202 @@ def text_to_speech_with_elevenlabs(input_text, output_filepath, language='en'):
         print("⚠ ELEVENLABS_API_KEY not found. Using Google TTS instead...")
         return text_to_speech_with_gtts(input_text, output_filepath, language=language)
     
+    cache_key = TTSCache.key(input_text, language, ELEVENLABS_VOICE, ELEVENLABS_MODEL_ID, ELEVENLABS_OUTPUT_FORMAT)
+    cached = tts_cache.get(cache_key)
+    if cached:
+        print("✓ ElevenLabs: cache hit")
+        return _deliver_audio(cached, output_filepath)
+    
     try:
         print(f"Attempting ElevenLabs TTS with API key: {ELEVENLABS_API_KEY[:10]}...")
         
-        client = ElevenLabs(api_key=ELEVENLABS_API_KEY)
-        
-        # Use multilingual model
-        model_id = "eleven_multilingual_v2"
-        
-        audio = client.generate(
-            text=input_text,
-            voice="Aria",
-            output_format="mp3_22050_32",
-            model=model_id
-        )
-        
-        elevenlabs.save(audio, output_filepath)
-        print(f"✓ ElevenLabs: Audio saved to {output_filepath}")
-        return output_filepath
+        audio_bytes = _elevenlabs_audio(input_text)
+        tts_cache.put(cache_key, audio_bytes)
+        print("✓ ElevenLabs: Audio generated")
+        return _deliver_audio(audio_bytes, output_filepath)
         
     except Exception as e:
+        telemetry.provider_errors.inc(provider="elevenlabs", operation="tts")
+        telemetry.provider_fallbacks.inc(from_provider="elevenlabs", to_provider="gtts")
         print(f"✗ ElevenLabs Error: {e}")
         print("⚠ Falling back to Google TTS...")
         return text_to_speech_with_gtts(input_text, output_filepath, language=language)
 
 
+def _tts_engines():
+    """
+    TTS_ENGINES (default "elevenlabs,gtts"), in order of preference, minus
+    ElevenLabs when there is no API key.
+    """
+    available = {"elevenlabs": _elevenlabs_audio, "gtts": _gtts_audio}
+    names = [name.strip() for name in os.environ.get("TTS_ENGINES", "elevenlabs,gtts").split(",") if name.strip()]
+    engines = {name: available[name] for name in names if name in available}
+    if not ELEVENLABS_API_KEY:
+        engines.pop("elevenlabs", None)
+    return engines or {"gtts": _gtts_audio}
+
+
+tts_router = TTSRouter(_tts_engines(), hedge=os.environ.get("TTS_HEDGE", "1") == "1")
+
+
+def _routed_audio(input_text, language='en', engine_name=None):
+    """
+    (engine name, MP3 bytes) from the cache or the router, or (None, None).
+    With engine_name only that engine's cached audio counts, and the router
+    call is pinned to it.
+    """
+    lang_code = LANG_MAP.get(language.lower(), 'en')
+    cache_keys = {
+        "elevenlabs": TTSCache.key(input_text, language, ELEVENLABS_VOICE, ELEVENLABS_MODEL_ID, ELEVENLABS_OUTPUT_FORMAT),
+        "gtts": TTSCache.key(input_text, lang_code, "gtts", "gtts", "mp3"),
+    }
+    for name in [engine_name] if engine_name else tts_router.engines:
+        cached = tts_cache.get(cache_keys[name])
+        if cached:
+            print(f"✓ TTS: {name} cache hit (language: {lang_code})")
+            return name, cached
+
+    name, audio_bytes = tts_router.synthesize(input_text, lang_code, engine=engine_name)
+    if audio_bytes is None:
+        print(f"✗ TTS: every engine failed (language: {lang_code})")
+        return None, None
+    tts_cache.put(cache_keys[name], audio_bytes)
+    print(f"✓ TTS: Audio generated by {name} (language: {lang_code})")
+    return name, audio_bytes
+
+
+def text_to_speech_routed(input_text, output_filepath=None, language='en', engine_name=None):
+    """
+    Synthesize with the engine that has been fastest for this language,
+    hedging with the next one when it runs past its usual latency (see
+    tts_router.py). Either engine's cached audio is used first.
+    If output_filepath is None the MP3 is returned as bytes instead of saved.
+    """
+    _, audio_bytes = _routed_audio(input_text, language, engine_name)
+    return _deliver_audio(audio_bytes, output_filepath)
+
+
+class ReplyEngine:
+    """
+    Routed TTS for the sentences of one reply. The first sentence is routed
+    (and hedged) as usual and the engine that answers it is used for the rest,
+    so a reply keeps one voice and one MP3 format. Later sentences wait for
+    that choice; if the first sentence fails they are routed on their own.
+    """
+
+    def __init__(self):
+        self.engine_name = None
+        self._claimed = False
+        self._chosen = threading.Event()
+        self._lock = threading.Lock()
+
+    def __call__(self, input_text, output_filepath=None, language='en'):
+        with self._lock:
+            first, self._claimed = not self._claimed, True
+        if not first:
+            self._chosen.wait()
+            return text_to_speech_routed(input_text, output_filepath, language, self.engine_name)
+        try:
+            self.engine_name, audio_bytes = _routed_audio(input_text, language)
+        finally:
+            self._chosen.set()
+        return _deliver_audio(audio_bytes, output_filepath)
+
+
+# Bounded pool shared by all pipelined TTS calls
+TTS_PIPELINE_WORKERS = int(os.environ.get("TTS_PIPELINE_WORKERS", "4"))
+_tts_pipeline_executor = ThreadPoolExecutor(max_workers=TTS_PIPELINE_WORKERS, thread_name_prefix="tts")
+
+
+# Sample rates by the MPEG version bits of a frame header (3 = MPEG-1,
+# 2 = MPEG-2, 0 = MPEG-2.5)
+_MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+def mp3_frames(data):
+    """
+    The MPEG frames of an MP3, without its ID3v2 header and ID3v1 trailer,
+    so segments can be joined into one stream.
+    """
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = (data[6] & 0x7f) << 21 | (data[7] & 0x7f) << 14 | (data[8] & 0x7f) << 7 | (data[9] & 0x7f)
+        data = data[10 + size + (10 if data[5] & 0x10 else 0):]
+    if len(data) >= 128 and data[-128:-125] == b"TAG":
+        data = data[:-128]
+    return data
+
+
+def mp3_format(data):
+    """(sample_rate, channels) of the first MPEG layer III frame, or None."""
+    data = mp3_frames(data)
+    for i in range(min(len(data) - 3, 4096)):
+        if data[i] != 0xff or data[i + 1] & 0xe6 != 0xe2:
+            continue
+        version, rate_index = (data[i + 1] >> 3) & 3, (data[i + 2] >> 2) & 3
+        if version == 1 or rate_index == 3:
+            continue
+        return _MP3_SAMPLE_RATES[version][rate_index], 1 if data[i + 3] >> 6 == 3 else 2
+    return None
+
+
+def _translate_and_synthesize(sentence, language, translate, engine):
+    if translate:
+        sentence = translate_text(sentence, language)
+    return engine(input_text=sentence, output_filepath=None, language=language)
+
+
+def iter_speech_segments(input_text, language='en', translate=True, engine=None):
+    """
+    Split input_text into sentences, translate and synthesize them concurrently
+    on the TTS pool, and yield each sentence's MP3 bytes in sentence order.
+    Sentences that fail to synthesize are logged, counted and left out.
+    Without an engine the reply gets its own ReplyEngine.
+    """
+    engine = engine or ReplyEngine()
+    sentences = split_sentences(input_text)
+    futures = [
+        _tts_pipeline_executor.submit(telemetry.run_in_context(_translate_and_synthesize), sentence, language, translate, engine)
+        for sentence in sentences
+    ]
+    for index, (sentence, future) in enumerate(zip(sentences, futures)):
+        try:
+            segment = future.result()
+        except Exception as e:
+            print(f"✗ Pipelined TTS: {e}")
+            segment = None
+        if segment:
+            yield segment
+            continue
+        telemetry.tts_segments_dropped.inc(language=language.lower())
+        print(f"⚠ Pipelined TTS: dropped sentence {index + 1}/{len(sentences)}: {sentence[:60]!r}")
+
+
+def text_to_speech_pipelined(input_text, output_filepath=None, language='en', translate=True, engine=None):
+    """
+    Sentence-pipelined TTS: translation and synthesis of different sentences overlap.
+    The MPEG frames of each segment are joined into one stream. Segments in
+    different MP3 formats (e.g. the reply's engine failed on one sentence and
+    it fell back from ElevenLabs to gTTS) can't share a stream, so the reply is synthesized again with gTTS.
+    If output_filepath is None the MP3 is returned as bytes instead of saved.
+    """
+    segments = list(iter_speech_segments(input_text, language=language, translate=translate, engine=engine))
+    formats = {mp3_format(segment) for segment in segments}
+    if len(formats) > 1:
+        print(f"⚠ Pipelined TTS: mixed MP3 formats {sorted(formats, key=str)}")
+        if engine is not text_to_speech_with_gtts:
+            print("⚠ Pipelined TTS: synthesizing the reply again with Google TTS")
+            return text_to_speech_pipelined(input_text, output_filepath, language, translate, text_to_speech_with_gtts)
+    audio_bytes = b"".join(mp3_frames(segment) for segment in segments)
+    if not audio_bytes:
+        return None
+    if output_filepath is None:
+        return audio_bytes
+    with open(output_filepath, "wb") as f:
+        f.write(audio_bytes)
+    print(f"✓ Pipelined TTS: Audio saved to {output_filepath}")
+    return output_filepath
+
+
 def play_audio(output_filepath):
     """
     Play audio file based on operating system
@@ -137,4 +647,48 @@ def text_to_speech_with_gtts_old(input_text, output_filepath):
 
 
 def text_to_speech_with_elevenlabs_old(input_text, output_filepath):
-    return text_to_speech_with_elevenlabs(input_text, output_filepath)
\ No newline at end of file
+    return text_to_speech_with_elevenlabs(input_text, output_filepath)
+
+
+# Phrases the doctor repeats often enough to be worth pre-synthesizing
+COMMON_PHRASES = [
+    "Hello, I am your AI doctor. How can I help you today?",
+    "How long have you had these symptoms?",
+    "Do you have a fever?",
+    "Are you taking any medication at the moment?",
+    "Please drink plenty of fluids and get some rest.",
+    "Please consult a physician if your symptoms get worse.",
+    "Take care and get well soon.",
+]
+
+
+def prewarm_tts_cache(phrases=None, languages=None):
+    """
+    Synthesize common phrases in each language so later replies hit the cache.
+    Goes through the same translate-then-synthesize path as pipelined TTS.
+    """
+    phrases = phrases or COMMON_PHRASES
+    languages = languages or list(LANG_MAP)
+    sentences = [sentence for phrase in phrases for sentence in split_sentences(phrase)]
+    for language in languages:
+        for translated in translation_service.translate_batch(sentences, language):
+            text_to_speech_with_elevenlabs(input_text=translated, output_filepath=None, language=language)
+    print(f"✓ TTS cache pre-warmed: {tts_cache.stats()}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Doctor voice utilities")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    prewarm = subparsers.add_parser("prewarm", help="Pre-synthesize common phrases into the TTS cache")
+    prewarm.add_argument("--languages", nargs="*", help="Languages to warm (default: all in LANG_MAP)")
+    prewarm.add_argument("--phrases-file", help="Text file with one phrase per line (default: built-in list)")
+    args = parser.parse_args()
+
+    if args.command == "prewarm":
+        phrases = None
+        if args.phrases_file:
+            with open(args.phrases_file, encoding="utf-8") as f:
+                phrases = [line.strip() for line in f if line.strip()]
+        prewarm_tts_cache(phrases=phrases, languages=args.languages)
@@ -5,8 +5,6 @@
 #Step1: Setup Audio recorder (ffmpeg & portaudio)
 # ffmpeg, portaudio, pyaudio
 import logging
-import speech_recognition as sr
-from pydub import AudioSegment
 from io import BytesIO
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -20,6 +18,10 @@ def record_audio(file_path, timeout=20, phrase_time_limit=None):
     timeout (int): Maximum time to wait for a phrase to start (in seconds).
     phrase_time_lfimit (int): Maximum time for the phrase to be recorded (in seconds).
     """
+    # Microphone capture is only used from the CLI, so keep these off the server's import path
+    import speech_recognition as sr
+    from pydub import AudioSegment
+
     recognizer = sr.Recognizer()
     
     try:
@@ -47,18 +49,188 @@ audio_filepath="patient_voice_test_for_patient.mp3"
 
 #Step2: Setup Speech to text–STT–model for transcription
 import os
-from groq import Groq
+import tempfile
+import warnings
+import numpy as np
+import soundfile as sf
+from clients import registry
+import telemetry
 
 GROQ_API_KEY=os.environ.get("GROQ_API_KEY")
 stt_model="whisper-large-v3"
 
-def transcribe_with_groq(stt_model, audio_filepath, GROQ_API_KEY):
-    client=Groq(api_key=GROQ_API_KEY)
-    
-    audio_file=open(audio_filepath, "rb")
-    transcription=client.audio.transcriptions.create(
-        model=stt_model,
-        file=audio_file
+# Uploads are conditioned before they go to Whisper: mono, 16 kHz (Whisper's
+# own rate), leading/trailing silence trimmed, long pauses shortened and
+# re-encoded compactly. Set STT_AUDIO_FORMAT=off to send recordings as-is.
+STT_SAMPLE_RATE=16000
+STT_AUDIO_FORMAT=os.environ.get("STT_AUDIO_FORMAT", "flac").lower()  # flac, opus or off
+STT_VAD_TOP_DB=float(os.environ.get("STT_VAD_TOP_DB", "35"))
+STT_VAD_PAD_SECONDS=float(os.environ.get("STT_VAD_PAD_SECONDS", "0.25"))
+STT_MAX_PAUSE_SECONDS=float(os.environ.get("STT_MAX_PAUSE_SECONDS", "1.0"))  # 0 keeps pauses
+VAD_FRAME_SECONDS=0.03
+VAD_NOISE_MARGIN_DB=6.0
+STT_UPLOAD_FORMATS={
+    # Lossless and encodes in a few ms; about 16x smaller than 44.1 kHz WAV
+    "flac": ("FLAC", "PCM_16", ".flac"),
+    # ~24 kbps, another 2-3x smaller, but libsndfile's encoder costs ~50 ms per second of audio
+    "opus": ("OGG", "OPUS", ".ogg"),
+}
+
+stt_upload_bytes=telemetry.registry.register(telemetry.Counter(
+    "speechbot_stt_upload_bytes", "Audio bytes received for transcription and bytes sent to Whisper.", ("kind",)))
+
+def decode_for_stt(data, filename=None):
+    """
+    Decode an upload to mono float32 at STT_SAMPLE_RATE. libsndfile reads
+    WAV/FLAC/OGG/MP3 from memory; other containers (m4a, webm) go through a
+    temp file so librosa can hand them to ffmpeg. Resampling uses scipy, so
+    the common formats never import librosa into the API process.
+    """
+    from math import gcd
+    from scipy.signal import resample_poly
+
+    try:
+        y, sr=sf.read(BytesIO(data), dtype="float32", always_2d=True)
+        y=y.mean(axis=1)
+    except Exception:
+        suffix=os.path.splitext(filename or "")[1] or ".bin"
+        fd, path=tempfile.mkstemp(prefix="speechbot_stt_", suffix=suffix)
+        try:
+            import librosa
+
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            with warnings.catch_warnings():
+                # librosa warns every time it falls back to audioread
+                warnings.simplefilter("ignore")
+                y, sr=librosa.load(path, sr=None, mono=True)
+        finally:
+            os.remove(path)
+    if sr != STT_SAMPLE_RATE:
+        common=gcd(int(sr), STT_SAMPLE_RATE)
+        y=resample_poly(y, STT_SAMPLE_RATE // common, int(sr) // common)
+    return np.ascontiguousarray(y, dtype=np.float32)
+
+def speech_frames(y, sr=STT_SAMPLE_RATE, top_db=STT_VAD_TOP_DB):
+    """
+    Energy VAD over 30 ms frames: a frame is speech when it is within top_db
+    of the loudest frame and clearly above the background noise floor.
+    Returns (mask, frame_length).
+    """
+    frame=int(sr * VAD_FRAME_SECONDS)
+    n_frames=len(y) // frame
+    if n_frames == 0:
+        return np.zeros(0, dtype=bool), frame
+    frames=y[:n_frames * frame].reshape(n_frames, frame)
+    energy_db=10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+    noise_floor=np.percentile(energy_db, 10)
+    threshold=max(energy_db.max() - top_db, noise_floor + VAD_NOISE_MARGIN_DB)
+    return energy_db > threshold, frame
+
+def trim_silence(y, sr=STT_SAMPLE_RATE, pad_seconds=STT_VAD_PAD_SECONDS, max_pause_seconds=STT_MAX_PAUSE_SECONDS):
+    """
+    Drop leading and trailing silence (keeping pad_seconds around speech) and
+    shorten pauses longer than max_pause_seconds. Audio with no detectable
+    speech is returned unchanged and left for Whisper to judge.
+    """
+    from scipy.ndimage import binary_dilation
+
+    speech, frame=speech_frames(y, sr)
+    if not speech.any():
+        return y
+    pad=int(round(pad_seconds / VAD_FRAME_SECONDS))
+    # Widen every speech run by pad frames on each side; unlike a "same"
+    # convolution this keeps the mask aligned when it is shorter than the pad
+    keep=binary_dilation(speech, structure=np.ones(2 * pad + 1, dtype=bool))
+
+    voiced=np.flatnonzero(keep)
+    first, last=voiced[0], voiced[-1]
+    max_pause=int(round(max_pause_seconds / VAD_FRAME_SECONDS))
+    if max_pause <= 0:
+        keep[first:last + 1]=True
+    else:
+        # Keep the first max_pause frames of every gap between speech runs
+        gap_start=None
+        for i in range(first, last + 1):
+            if not keep[i] and gap_start is None:
+                gap_start=i
+            elif keep[i] and gap_start is not None:
+                keep[gap_start:min(i, gap_start + max_pause)]=True
+                gap_start=None
+
+    mask=np.repeat(keep, frame)
+    # Samples past the last whole frame follow that frame
+    mask=np.concatenate([mask, np.full(len(y) - len(mask), keep[-1])])
+    return y[mask]
+
+def encode_for_stt(y, sr=STT_SAMPLE_RATE, audio_format=STT_AUDIO_FORMAT):
+    """
+    Returns (encoded_bytes, file_extension).
+    """
+    container, subtype, extension=STT_UPLOAD_FORMATS[audio_format]
+    buffer=BytesIO()
+    sf.write(buffer, y, sr, format=container, subtype=subtype)
+    return buffer.getvalue(), extension
+
+def condition_audio(data, filename=None, audio_format=STT_AUDIO_FORMAT):
+    """
+    Prepare an upload for Whisper. Returns (payload_bytes, upload_filename, info)
+    where info reports sizes, durations and the compression ratio. Falls back
+    to the original bytes if decoding fails or conditioning wouldn't help.
+    """
+    filename=filename or "audio.wav"
+    info={"original_bytes": len(data), "conditioned_bytes": len(data), "compression_ratio": 1.0, "conditioned": False}
+    if audio_format not in STT_UPLOAD_FORMATS:
+        return data, filename, info
+    with telemetry.span("stt_precondition"):
+        try:
+            y=decode_for_stt(data, filename)
+            trimmed=trim_silence(y)
+            encoded, extension=encode_for_stt(trimmed, audio_format=audio_format)
+        except Exception as e:
+            logging.warning(f"Audio conditioning failed ({e}); uploading original")
+            return data, filename, info
+
+    info["original_seconds"]=round(len(y) / STT_SAMPLE_RATE, 2)
+    info["conditioned_seconds"]=round(len(trimmed) / STT_SAMPLE_RATE, 2)
+    if len(encoded) >= len(data) and len(trimmed) == len(y):
+        # Already compact and nothing to trim
+        return data, filename, info
+    info.update(conditioned_bytes=len(encoded), compression_ratio=round(len(data) / max(len(encoded), 1), 2), conditioned=True)
+    logging.info(
+        f"STT upload conditioned: {info['original_bytes']} -> {info['conditioned_bytes']} bytes "
+        f"({info['compression_ratio']}x), {info['original_seconds']}s -> {info['conditioned_seconds']}s"
     )
+    return encoded, os.path.splitext(filename)[0] + extension, info
+
+def transcribe_with_groq(stt_model, audio_filepath=None, GROQ_API_KEY=None, audio_file=None, audio_format=STT_AUDIO_FORMAT):
+    """
+    Transcribe audio with Groq Whisper.
+    Pass either audio_filepath, or audio_file as an in-memory (filename, bytes) tuple
+    or open file object. The audio is conditioned first (see condition_audio)
+    unless audio_format is "off".
+    """
+    client=registry.groq(GROQ_API_KEY)
+
+    if audio_file is None:
+        with open(audio_filepath, "rb") as f:
+            audio_file=(os.path.basename(audio_filepath), f.read())
+    elif not isinstance(audio_file, tuple):
+        audio_file=(os.path.basename(getattr(audio_file, "name", "") or "audio.wav"), audio_file.read())
+
+    filename, data=audio_file
+    payload, filename, _=condition_audio(data, filename, audio_format=audio_format)
+    stt_upload_bytes.inc(len(data), kind="received")
+    stt_upload_bytes.inc(len(payload), kind="sent")
+
+    with telemetry.span("groq_transcription"):
+        try:
+            transcription=client.audio.transcriptions.create(
+                model=stt_model,
+                file=(filename, payload)
+            )
+        except Exception:
+            telemetry.provider_errors.inc(provider="groq", operation="transcription")
+            raise
 
     return transcription.text